@@ -1,21 +1,23 @@
-# app.py (final) — zip entire sorted_output and return timestamped PixClad zip
+# app.py (final) — queue sorting jobs; stream each job's sorted output as a timestamped PixClad zip
 import os
 import shutil
-import tempfile
-import zipfile
 import threading
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, session, send_file
+from datetime import timedelta
+from flask import Flask, request, jsonify, session, Response, abort, make_response, stream_with_context
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
 
-from model_loader import get_image_tags
 from auth import auth_blueprint
-from gdrive import gdrive_blueprint, upload_file_to_gdrive, get_or_create_output_folder
+from gdrive import gdrive_blueprint
+from pipeline import UPLOAD_FOLDER, OUTPUT_FOLDER, stream_zip
+from tasks import credentials_ref, enqueue_job, get_job, new_job_id, remember_job, job_response, owns_job
+from inference_pool import inference_workers, load_model, model_status
+from metrics import render as render_metrics, timed
+from result_cache import result_cache
+from upload_spool import UploadSpool, receive_multipart
+from config import Config
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from flask_session import Session
+from session_store import init_sessions
 
 # -------------------------------------------------------
 # Initialize Flask App
@@ -24,9 +26,7 @@ app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
 # -------- SESSION CONFIG ----------
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SESSION_FILE_DIR"] = "flask_session"
-os.makedirs("flask_session", exist_ok=True)
+# Backend chosen by SESSION_BACKEND, see session_store.init_sessions
 app.config["SESSION_PERMANENT"] = True
 app.config["SESSION_COOKIE_HTTPONLY"] = True
 app.config["SESSION_COOKIE_NAME"] = "session"
@@ -45,7 +45,7 @@ else:
     app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
     app.config["SESSION_COOKIE_DOMAIN"] = None
 
-Session(app)
+init_sessions(app)
 
 # -------------------------------------------------------
 # CORS CONFIG — FRONTEND ONLY
@@ -98,12 +98,57 @@ app.register_blueprint(gdrive_blueprint, url_prefix="/auth/gdrive")
 # -------------------------------------------------------
 # Folders
 # -------------------------------------------------------
-UPLOAD_FOLDER = "temp_uploads"
-OUTPUT_FOLDER = "sorted_output"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 
+# -------------------------------------------------------
+# Model: load at startup only when asked to (PRELOAD_MODEL=1); otherwise
+# the first inference (or /ready probe) loads it and /auth/* never waits
+# on torch. An inference pool (INFERENCE_WORKERS) is started per worker
+# after the fork instead, see gunicorn.conf.py
+# -------------------------------------------------------
+if Config.PRELOAD_MODEL and not inference_workers():
+    load_model()
+
+# /ready starts the load itself (once per process) when nothing else has
+_background_load = threading.Lock()
+
+
+def _load_model_in_background():
+    if _background_load.acquire(blocking=False):
+        threading.Thread(target=load_model, name='model-load', daemon=True).start()
+
+
+@app.route('/health')
+def health():
+    """Liveness: the process is up. Also reports the model load state and result cache use."""
+    return jsonify({
+        "status": "ok", "model": model_status(),
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+    })
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text format: stage timings, image/byte/API call counters, queue depths."""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+@app.route('/ready')
+def ready():
+    """
+    Readiness: 200 once the model is loaded, 503 before (or if loading
+    failed). The first call starts loading it in the background, so the
+    probe passes without PRELOAD_MODEL too.
+    """
+    status = model_status()
+    if status['state'] == 'not_loaded':
+        _load_model_in_background()
+    return jsonify({"ready": status['state'] == 'ready', "model": status}), 200 if status['state'] == 'ready' else 503
+
+
 # -------------------------------------------------------
 # Keep Session Permanent
 # -------------------------------------------------------
@@ -113,108 +158,121 @@ def make_session_permanent():
     app.permanent_session_lifetime = timedelta(days=30)
 
 
-# ---- helper to cleanup files later (background thread) ----
-def remove_file_later(path, delay=30):
-    def _remove():
-        try:
-            if os.path.exists(path):
-                os.remove(path)
-        except Exception:
-            pass
-    t = threading.Timer(delay, _remove)
-    t.daemon = True
-    t.start()
-
-
 # -------------------------------------------------------
-# Process Upload Route (local ZIP download support)
+# Process Upload Route (queues a job; local ZIP via /jobs/<id>/download)
 # -------------------------------------------------------
 @app.route('/process-upload', methods=['POST'])
 def process_upload():
-    try:
-        destination = request.form.get('destination', 'local')
-        uploaded_files = request.files.getlist('files')
-
-        if not uploaded_files or not uploaded_files[0].filename:
-            return jsonify({"error": "No files were selected"}), 400
-
-        results = {}
-        gdrive_service = None
-        processed_local_paths = []
-
+    # The body is parsed as it streams in (never via request.files): each
+    # file lands in this request's own folder as soon as its part is done,
+    # and the job starts tagging from the first finished file
+    job_id = new_job_id()
+    spool = UploadSpool(os.path.join(UPLOAD_FOLDER, job_id))
+    form = {}
+    queued = []
+
+    def start_job():
+        if queued:
+            return
+        destination = form.get('destination', 'local')
+        creds_ref = None
         if destination == 'gdrive':
-            creds_data = session.get('destination_credentials', session.get('credentials'))
+            creds_key = 'destination_credentials' if 'destination_credentials' in session else 'credentials'
+            creds_data = session.get(creds_key)
             if not creds_data:
-                return jsonify({"error": "Google Drive not connected"}), 401
+                abort(make_response(jsonify({"error": "Google Drive not connected"}), 401))
 
             required_keys = ["token", "token_uri", "client_id", "client_secret"]
             if not all(key in creds_data and creds_data[key] for key in required_keys):
-                return jsonify({"error": "Incomplete Google Drive credentials"}), 400
-
-            creds = Credentials(**creds_data)
-            gdrive_service = build('drive', 'v3', credentials=creds)
-            output_parent_id = get_or_create_output_folder(gdrive_service)
-
-        # Process files: categorize and move
-        for file in uploaded_files:
-            filename = secure_filename(os.path.basename(file.filename))
-            temp_path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(temp_path)
-
-            tags = get_image_tags(temp_path)
-            category = tags[0]["name"] if tags and tags[0]["name"] != "Error" else "Uncategorized"
-            results[filename] = tags
-
-            if destination == 'local':
-                category_folder = os.path.join(OUTPUT_FOLDER, category)
-                os.makedirs(category_folder, exist_ok=True)
-                dest_path = os.path.join(category_folder, filename)
-                shutil.move(temp_path, dest_path)
-                processed_local_paths.append(dest_path)
-
-            elif destination == 'gdrive' and gdrive_service:
-                upload_file_to_gdrive(gdrive_service, temp_path, category, output_parent_id)
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
-
-        # If user requested local output, zip the whole OUTPUT_FOLDER and return
-        if destination == 'local':
-            # If you prefer only request-specific files, use processed_local_paths list.
-            # The user asked for the entire sorted_output folder zip: we zip OUTPUT_FOLDER.
-            # If OUTPUT_FOLDER might contain previous runs and you prefer per-request only,
-            # change to zip the processed_local_paths instead.
-            # Here we zip OUTPUT_FOLDER but include only files that exist currently.
-            zip_timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%SZ")
-            zip_name = f"PixClad_Output_{zip_timestamp}.zip"
-            tmp_fd, tmp_zip_path = tempfile.mkstemp(suffix='.zip')
-            os.close(tmp_fd)
-            with zipfile.ZipFile(tmp_zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                # Walk OUTPUT_FOLDER and add files with relative path so categories are preserved
-                for root, dirs, files_in_dir in os.walk(OUTPUT_FOLDER):
-                    for fname in files_in_dir:
-                        full_path = os.path.join(root, fname)
-                        rel_path = os.path.relpath(full_path, OUTPUT_FOLDER)  # category/filename
-                        zf.write(full_path, arcname=rel_path)
-
-            # schedule cleanup
-            remove_file_later(tmp_zip_path, delay=60)
-
-            # send the zip with the timestamped filename
-            try:
-                return send_file(tmp_zip_path, as_attachment=True, download_name=zip_name)
-            except TypeError:
-                return send_file(tmp_zip_path, as_attachment=True, attachment_filename=zip_name)
-
-        # default JSON response for gdrive
-        return jsonify({"message": "Processing complete", "results": results})
+                abort(make_response(jsonify({"error": "Incomplete Google Drive credentials"}), 400))
+            creds_ref = credentials_ref(creds_key)
+
+        enqueue_job(
+            {'type': 'upload', 'folder': spool.folder},
+            {'type': destination, 'credentials': creds_ref},
+            job_id=job_id,
+        )
+        queued.append(job_id)
 
+    def on_file(filename, path):
+        # Clients that send destination after the files start at the end
+        if 'destination' in form:
+            start_job()
+
+    try:
+        with timed('upload_request'):
+            receive_multipart(request, spool, on_field=form.__setitem__, on_file=on_file)
+        if not spool.count:
+            spool.discard()
+            return jsonify({"error": "No files were selected"}), 400
+        start_job()
+        spool.complete()
+        remember_job(job_id)
+        return job_response(job_id)
+
+    except HTTPException as e:
+        # A job already tagging this upload sees the marker and fails;
+        # otherwise nothing else will clean the folder up
+        spool.abort(e.description or e.name)
+        if not queued:
+            spool.discard()
+        if e.response is not None:
+            return e.response
+        return jsonify({"error": e.description or e.name}), e.code
     except Exception as e:
+        spool.abort(str(e))
+        if not queued:
+            spool.discard()
         print(f"[ERROR] process_upload failed: {e}")
         return jsonify({"error": "Failed to process upload", "details": str(e)}), 500
 
 
+# -------------------------------------------------------
+# Job Status / Result Routes
+# -------------------------------------------------------
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_job(job_id) if owns_job(job_id) else None
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    info = job['info'] if isinstance(job['info'], dict) else {}
+    body = {"job_id": job_id, "state": job['state']}
+    if job['state'] in ('PENDING', 'STARTED', 'PROGRESS'):
+        body.update({k: info.get(k) for k in ('current', 'total', 'status')})
+    elif job['state'] == 'FAILURE':
+        body["error"] = info.get('error') or info.get('exc_message') or "Job failed"
+    else:
+        # Per-stage job timings only on request (?timings=1)
+        hidden = ('output_dir', 'zip_name') + (() if request.args.get('timings') == '1' else ('timings',))
+        body.update({k: v for k, v in info.items() if k not in hidden})
+        if 'output_dir' in info:
+            body["download_url"] = f"/jobs/{job_id}/download"
+    return jsonify(body)
+
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    job = get_job(job_id) if owns_job(job_id) else None
+    info = job['info'] if job and isinstance(job['info'], dict) else {}
+    if job is None or job['state'] != 'SUCCESS' or not os.path.isdir(info.get('output_dir', '')):
+        return jsonify({"error": "No download available for this job"}), 404
+
+    output_dir = info['output_dir']
+
+    def generate():
+        yield from stream_zip(output_dir)
+        # Only this job's files were in the zip; drop them once fully sent
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    # stream the zip with the timestamped filename as entries are written
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/zip',
+        headers={"Content-Disposition": f'attachment; filename="{info["zip_name"]}"'},
+    )
+
+
 # -------------------------------------------------------
 # Run App
 # -------------------------------------------------------
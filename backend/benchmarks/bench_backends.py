@@ -0,0 +1,74 @@
+"""
+Latency and throughput of each inference backend on the same images, plus
+how closely the ONNX tags agree with the PyTorch ones.
+
+Run from the backend folder:
+    python benchmarks/bench_backends.py --images 64 --batch-size 16
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_loader  # noqa: E402
+from benchmarks.corpus import make_images  # noqa: E402
+from onnx_backend import OnnxBackend  # noqa: E402
+
+MODELS_DIR = os.path.dirname(model_loader.MODEL_PATH)
+
+
+def build(name, threads):
+    if name == 'torch':
+        return model_loader.TorchBackend(model_loader.MODEL_PATH)
+    int8 = name == 'onnx-int8'
+    path = os.path.join(MODELS_DIR, 'yolo11n.int8.onnx' if int8 else 'yolo11n.onnx')
+    return OnnxBackend(path, pt_path=model_loader.MODEL_PATH, int8=int8, intra_op_threads=threads)
+
+
+def run(backend, images, batch_size):
+    backend.predict_tags(images[:2], model_loader.CONFIDENCE)  # warm-up
+    latencies, tags = [], []
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        t = time.perf_counter()
+        tags += backend.predict_tags(images[i:i + batch_size], model_loader.CONFIDENCE)
+        latencies.append(time.perf_counter() - t)
+    return time.perf_counter() - start, sorted(latencies), tags
+
+
+def agreement(reference, tags, tolerance):
+    """Fraction of images whose tag names match the reference, confidences within tolerance."""
+    same = 0
+    for ref, got in zip(reference, tags):
+        ref_conf = {t['name']: t['conf'] for t in ref}
+        got_conf = {t['name']: t['conf'] for t in got}
+        if ref_conf.keys() == got_conf.keys() and all(abs(ref_conf[n] - got_conf[n]) <= tolerance for n in ref_conf):
+            same += 1
+    return same / len(reference) if reference else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads (0 = default)")
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+
+    images = make_images(args.images)
+    reference = None
+    print(f"{'backend':>10} {'seconds':>9} {'img/s':>8} {'p50 batch ms':>13} {'agree':>7}")
+    for name in args.backends.split(","):
+        elapsed, latencies, tags = run(build(name, args.threads), images, args.batch_size)
+        if reference is None:
+            reference = tags
+        p50 = latencies[len(latencies) // 2] * 1000
+        agree = agreement(reference, tags, args.tolerance)
+        print(f"{name:>10} {elapsed:>9.2f} {len(images) / elapsed:>8.1f} {p50:>13.1f} {agree:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
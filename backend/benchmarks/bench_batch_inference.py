@@ -0,0 +1,37 @@
+"""
+Images/sec of get_image_tags_batch at different batch sizes.
+
+Run from the backend folder:
+    python benchmarks/bench_batch_inference.py --images 64
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_loader import get_image_tags_batch  # noqa: E402
+from benchmarks.corpus import make_images  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-sizes", default="1,8,16,32")
+    args = parser.parse_args()
+
+    images = make_images(args.images)
+    # Warm-up so the first forward pass does not skew batch size 1
+    get_image_tags_batch(images[:2], batch_size=2)
+
+    print(f"{'batch':>6} {'seconds':>9} {'img/s':>8}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        start = time.perf_counter()
+        get_image_tags_batch(images, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"{batch_size:>6} {elapsed:>9.2f} {len(images) / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
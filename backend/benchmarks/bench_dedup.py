@@ -0,0 +1,98 @@
+"""
+Near-duplicate lookup over N perceptual hashes (default 100k): the
+multi-index table in dedup.py against comparing every new hash with all
+earlier ones, which is what a naive dedup stage costs (quadratic). A share
+of the hashes are near-copies (a few bits flipped) of earlier ones, like
+burst shots. Also reports the per-image cost of dhash/phash.
+
+Run from the backend folder:
+    python benchmarks/bench_dedup.py --hashes 100000 --distance 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import dedup  # noqa: E402
+from benchmarks.corpus import make_image_bytes  # noqa: E402
+
+
+def make_hashes(count, near_share, max_flips, seed=0):
+    rand = random.Random(seed)
+    hashes = []
+    for _ in range(count):
+        if hashes and rand.random() < near_share:
+            h = rand.choice(hashes)
+            for _ in range(rand.randint(0, max_flips)):
+                h ^= 1 << rand.randrange(dedup.HASH_BITS)
+        else:
+            h = rand.getrandbits(dedup.HASH_BITS)
+        hashes.append(h)
+    return hashes
+
+
+def popcount64(x):
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def run_index(hashes, distance):
+    index = dedup.MultiIndexHash(distance)
+    found = 0
+    start = time.perf_counter()
+    for i, h in enumerate(hashes):
+        if index.nearest(h) is None:
+            index.add(h, i)
+        else:
+            found += 1
+    return time.perf_counter() - start, found
+
+
+def run_linear(hashes, distance, sample):
+    """Scans everything stored so far (vectorized); timed on `sample` evenly spread queries."""
+    stored = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    picks = np.linspace(1, len(hashes) - 1, sample).astype(int)
+    start = time.perf_counter()
+    for i in picks:
+        (popcount64(stored[:i] ^ stored[i]) <= distance).any()
+    per_query = (time.perf_counter() - start) / sample
+    return per_query * len(hashes)
+
+
+def hash_cost(method, count=50):
+    images = make_image_bytes(count, size=(1280, 960))
+    start = time.perf_counter()
+    for data in images:
+        dedup.image_hash(data, method)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hashes", type=int, default=100000)
+    parser.add_argument("--distance", type=int, default=5)
+    parser.add_argument("--near-share", type=float, default=0.3)
+    parser.add_argument("--linear-sample", type=int, default=2000)
+    args = parser.parse_args()
+
+    hashes = make_hashes(args.hashes, args.near_share, args.distance)
+    elapsed, found = run_index(hashes, args.distance)
+    linear = run_linear(hashes, args.distance, args.linear_sample)
+    print(f"{'lookup':>14} {'seconds':>9} {'us/hash':>9}")
+    print(f"{'multi-index':>14} {elapsed:>9.2f} {elapsed / args.hashes * 1e6:>9.1f}   ({found} near-duplicates)")
+    print(f"{'linear scan':>14} {linear:>9.2f} {linear / args.hashes * 1e6:>9.1f}   (numpy, extrapolated)")
+
+    print(f"\n{'hash':>14} {'ms/image':>9}   (1280x960 JPEG)")
+    for method in dedup.HASHES:
+        print(f"{method:>14} {hash_cost(method) * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Peak memory of a Drive folder sort (default 200 large JPEGs, local
+destination so every original is downloaded) by download sink:
+
+    bytesio   how downloads worked before: the whole file fetched as one
+              response and copied into a growing BytesIO
+    buffer    download_file into DownloadBuffers only (no memory limit)
+    budget    download_file with DRIVE_DOWNLOAD_MEMORY_MB (default 128):
+              buffers up to the limit, temporary files beyond it
+    disk      download_file into temporary files only (limit 0)
+
+and, with --destination gdrive-source --no-thumbnails, how many bytes the
+ranged preview of progressive JPEGs saves (range vs full).
+
+Each case runs in its own process; "peak MB" is its peak RSS minus the RSS
+once FakeDrive holds the folder. The model is left out (every image gets
+the same tag): only the transfer pipeline is measured.
+
+Run from the backend folder:
+    python benchmarks/bench_download_memory.py --images 200
+    python benchmarks/bench_download_memory.py --destination gdrive-source --no-thumbnails --progressive
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from googleapiclient.http import MediaIoBaseDownload  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import pipeline  # noqa: E402
+from config import Config  # noqa: E402
+from benchmarks.fake_drive import FakeDrive  # noqa: E402
+
+DISTINCT = 8  # distinct photos; the folder repeats them so setup stays cheap
+
+
+def make_photo(i, size, progressive):
+    rand = np.random.default_rng(i)
+    pixels = (rand.random((size[1] // 8, size[0] // 8, 3)) * 255).astype(np.uint8)
+    img = Image.fromarray(pixels).resize(size, Image.BICUBIC)
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=92, progressive=progressive)
+    return out.getvalue()
+
+
+def download_bytesio(service, file_id, size=None, head=b''):
+    """download_file as it was: one full-size response copied into a BytesIO."""
+    request_file = service.files().get_media(fileId=file_id)
+    fh = io.BytesIO()
+    downloader = MediaIoBaseDownload(fh, request_file)
+    done = False
+    while not done:
+        _, done = downloader.next_chunk()
+    fh.seek(0)
+    return fh
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:')) / 1024
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def run_case(args):
+    photos = []
+    for i in range(DISTINCT):
+        with open(os.path.join(args.photos, f"{i}.jpg"), 'rb') as f:
+            photos.append(f.read())
+    drive = FakeDrive()
+    folder_id = drive.add_folder('Photos')
+    for i in range(args.images):
+        drive.add_file(f"img_{i:05d}.jpg", photos[i % DISTINCT], folder_id)
+    if not args.thumbnails:
+        for file in drive.files.values():
+            file.pop('thumbnailLink', None)
+
+    pipeline.get_image_tags_batch = lambda images: [[{"name": "person", "conf": 0.9}] for _ in images]
+    Config.DEDUP_ENABLED = False
+    if args.sink == 'bytesio':
+        pipeline.download_file = download_bytesio
+    elif args.sink == 'buffer':
+        Config.DRIVE_DOWNLOAD_MEMORY_BYTES = 1 << 62
+    elif args.sink == 'disk':
+        Config.DRIVE_DOWNLOAD_MEMORY_BYTES = 0
+    if not args.range:
+        Config.DRIVE_PREVIEW_RANGE_BYTES = 0
+
+    baseline = rss_mb()
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as output_dir:
+        result = pipeline.sort_gdrive_folder(folder_id, args.destination, {}, {}, make_service=lambda creds: drive.service(),
+                                    output_dir=output_dir, incremental=False)
+    elapsed = time.perf_counter() - start
+    errors = sum(tags == ["Error"] for tags in result['results'].values())
+    if errors:
+        sys.exit(f"{errors} downloads failed")
+    print(json.dumps({
+        'peak_mb': peak_rss_mb() - baseline, 'seconds': elapsed, 'file_mb': len(photos[0]) / (1024 * 1024),
+        'down_mb': drive.bytes_down / (1024 * 1024),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--width", type=int, default=4000, help="photo width in px (4:3)")
+    parser.add_argument("--destination", choices=("local", "gdrive-source"), default="local")
+    parser.add_argument("--progressive", action="store_true", help="encode the photos as progressive JPEGs")
+    parser.add_argument("--no-thumbnails", dest="thumbnails", action="store_false",
+                        help="list files without thumbnailLink (gdrive-source falls back to the original)")
+    parser.add_argument("--sink", help=argparse.SUPPRESS)
+    parser.add_argument("--range", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--photos", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.sink:
+        return run_case(args)
+
+    photos = tempfile.mkdtemp()
+    for i in range(DISTINCT):
+        with open(os.path.join(photos, f"{i}.jpg"), 'wb') as f:
+            f.write(make_photo(i, (args.width, args.width * 3 // 4), args.progressive))
+
+    cases = [('bytesio', 0), ('buffer', 0), ('budget', 0), ('disk', 0)]
+    if args.destination == 'gdrive-source':
+        cases.append(('budget', 1))
+    print(f"{'sink':>8} {'range':>6} {'peak MB':>8} {'MB down':>8} {'seconds':>8}")
+    for sink, use_range in cases:
+        cmd = [sys.executable, os.path.abspath(__file__), '--sink', sink, '--range', str(use_range),
+               '--images', str(args.images), '--photos', photos, '--destination', args.destination]
+        cmd += ['--progressive'] if args.progressive else []
+        cmd += [] if args.thumbnails else ['--no-thumbnails']
+        out = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+        print(f"{sink:>8} {'yes' if use_range else 'no':>6} {out['peak_mb']:>8.0f} {out['down_mb']:>8.0f} "
+              f"{out['seconds']:>8.2f}   ({out['file_mb']:.1f} MB per file)")
+    shutil.rmtree(photos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Per-request cost of getting a Drive client, with the real googleapiclient
+and google-auth code against a local stand-in for Drive and Google's
+token endpoint:
+
+    build    what /files did before: a new client from the session's
+             credentials dict every request (API surface built, new
+             connection, and the session's token never updated, so once
+             it has expired every request gets a 401 and refreshes it)
+    pooled   drive_clients.DriveClientPool, with the refreshed token
+             written back to the session as gdrive.session_drive_service does
+
+Each request lists one page of files. --rtt-ms delays every response and
+--handshake-ms every new connection (TLS to Google costs one or two round
+trips); both default to 0, which leaves only local CPU cost.
+
+Run from the backend folder:
+    python benchmarks/bench_drive_clients.py --requests 200 --rtt-ms 0 --handshake-ms 0
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from googleapiclient.discovery import build  # noqa: E402
+
+from drive_clients import DriveClientPool  # noqa: E402
+from drive_service import credentials_from_dict  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.counts['connections'] += 1
+        time.sleep(self.server.handshake)
+
+    def _reply(self, status, body):
+        time.sleep(self.server.rtt)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        server = self.server
+        server.counts['refreshes'] += 1
+        token = f"token-{next(server.tokens)}"
+        server.valid.add(token)
+        self._reply(200, {'access_token': token, 'expires_in': 3600, 'token_type': 'Bearer'})
+
+    def do_GET(self):
+        server = self.server
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        if token not in server.valid:
+            server.counts['401'] += 1
+            return self._reply(401, {'error': {'code': 401, 'message': 'Invalid Credentials'}})
+        server.counts['list'] += 1
+        self._reply(200, {'files': server.files})
+
+
+def start_server(rtt, handshake):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    server.rtt, server.handshake = rtt, handshake
+    server.counts = Counter()
+    server.tokens = itertools.count()
+    server.valid = set()
+    server.files = [{'id': f"folder{i}", 'name': f"Folder {i}"} for i in range(20)]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+class LocalPool(DriveClientPool):
+    def __init__(self, base_url):
+        super().__init__(max_accounts=16, idle_clients=2, idle_seconds=900)
+        self.base_url = base_url
+
+    def build_service(self, http):
+        return build('drive', 'v3', http=http, client_options={'api_endpoint': self.base_url}, cache_discovery=False)
+
+
+def list_folders(service):
+    return service.files().list(q="'root' in parents", fields="files(id, name)").execute()['files']
+
+
+def run_build(session, base_url, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        service = build('drive', 'v3', credentials=credentials_from_dict(session),
+                        client_options={'api_endpoint': base_url}, cache_discovery=False)
+        list_folders(service)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_pooled(session, base_url, requests):
+    pool = LocalPool(base_url)
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        with pool.client(session) as service:
+            list_folders(service)
+        refreshed = pool.refreshed(session)
+        if refreshed:
+            session = refreshed
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=0)
+    parser.add_argument("--handshake-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    print(f"{'client':>8} {'p50 ms':>8} {'p95 ms':>8} {'connections':>12} {'refreshes':>10} {'401s':>6}")
+    for name, run in (('build', run_build), ('pooled', run_pooled)):
+        server, base_url = start_server(args.rtt_ms / 1000, args.handshake_ms / 1000)
+        # What a session holds an hour after login: the access token has expired
+        session = {
+            'token': 'expired', 'refresh_token': 'refresh', 'token_uri': base_url + 'token',
+            'client_id': 'client', 'client_secret': 'secret', 'scopes': ['https://www.googleapis.com/auth/drive'],
+        }
+        samples = sorted(run(session, base_url, args.requests))
+        counts = server.counts
+        print(f"{name:>8} {statistics.median(samples) * 1000:>8.2f} "
+              f"{samples[int(len(samples) * 0.95) - 1] * 1000:>8.2f} "
+              f"{counts['connections']:>12} {counts['refreshes']:>10} {counts['401']:>6}")
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
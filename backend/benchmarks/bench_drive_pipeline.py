@@ -0,0 +1,67 @@
+"""
+Drive folder -> Drive Output throughput against FakeDrive with artificial
+latency, sequential (1 download / 1 upload worker) versus concurrent.
+
+Run from the backend folder:
+    python benchmarks/bench_drive_pipeline.py --images 100 --latency 0.05
+Pass --fake-model to leave YOLO out and measure only the transfer pipeline,
+and --destination gdrive-destination to compare against re-uploading bytes
+(gdrive-source copies or moves server-side, see --placement).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline  # noqa: E402
+from config import Config  # noqa: E402
+from benchmarks.corpus import make_image_bytes  # noqa: E402
+from benchmarks.fake_drive import FakeDrive  # noqa: E402
+
+
+def build_drive(count, latency):
+    drive = FakeDrive(latency=latency)
+    folder_id = drive.add_folder('Photos')
+    for i, data in enumerate(make_image_bytes(count, size=(640, 480))):
+        drive.add_file(f"img_{i:05d}.jpg", data, folder_id)
+    return drive, folder_id
+
+
+def run(args, download_workers, upload_workers):
+    drive, folder_id = build_drive(args.images, args.latency)
+    Config.DRIVE_DOWNLOAD_WORKERS = download_workers
+    Config.DRIVE_UPLOAD_WORKERS = upload_workers
+    start = time.perf_counter()
+    pipeline.sort_gdrive_folder(folder_id, args.destination, {}, {}, make_service=lambda creds: drive.service(),
+                                placement=args.placement, incremental=False)
+    return time.perf_counter() - start, drive
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per simulated API call")
+    parser.add_argument("--workers", default="1:1,4:4,8:8", help="download:upload worker pairs")
+    parser.add_argument("--fake-model", action="store_true")
+    parser.add_argument("--destination", choices=("gdrive-source", "gdrive-destination"), default="gdrive-source")
+    parser.add_argument("--placement", choices=("copy", "move"), default="copy")
+    args = parser.parse_args()
+
+    if args.fake_model:
+        pipeline.get_image_tags_batch = lambda images: [[{"name": "person", "conf": 0.9}] for _ in images]
+
+    print(f"{'down:up':>8} {'seconds':>9} {'img/s':>8} {'MB down':>8} {'MB thumb':>9} {'MB up':>7} "
+          f"{'api calls':>10}  by method")
+    for pair in args.workers.split(","):
+        down, up = (int(x) for x in pair.split(":"))
+        elapsed, drive = run(args, down, up)
+        by_method = ", ".join(f"{k}={v}" for k, v in sorted(drive.calls.items()))
+        mb = [n / (1024 * 1024) for n in (drive.bytes_down, drive.bytes_thumbnails, drive.bytes_up)]
+        print(f"{pair:>8} {elapsed:>9.2f} {args.images / elapsed:>8.1f} {mb[0]:>8.2f} {mb[1]:>9.2f} {mb[2]:>7.2f} "
+              f"{sum(drive.calls.values()):>10}  {by_method}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Re-running a Drive-to-Drive sort of a large folder after a few files were
+added: a full run (no manifest) against an incremental one, which only asks
+the changes API what happened since the last run and handles just that.
+
+Run from the backend folder:
+    python benchmarks/bench_incremental.py --images 10000 --added 100
+The model is left out (every image is tagged 'person'), so the numbers are
+the listing and transfer work that incremental runs save.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline  # noqa: E402
+from benchmarks.corpus import make_image_bytes  # noqa: E402
+from benchmarks.fake_drive import FakeDrive  # noqa: E402
+from folder_manifest import FolderManifest  # noqa: E402
+
+
+def add_images(drive, folder_id, base, start, count):
+    # Trailing bytes after the JPEG end marker keep every file's md5 unique
+    for i in range(start, start + count):
+        drive.add_file(f"img_{i:06d}.jpg", base + i.to_bytes(4, 'big'), folder_id)
+
+
+def sort(drive, folder_id, args, incremental):
+    calls_before = sum(drive.calls.values())
+    start = time.perf_counter()
+    result = pipeline.sort_gdrive_folder(folder_id, args.destination, {}, {},
+                                         make_service=lambda creds: drive.service(), incremental=incremental)
+    return time.perf_counter() - start, len(result['results']), sum(drive.calls.values()) - calls_before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=10000)
+    parser.add_argument("--added", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per simulated API call")
+    parser.add_argument("--destination", choices=("gdrive-source", "gdrive-destination"), default="gdrive-source")
+    args = parser.parse_args()
+
+    pipeline.get_image_tags_batch = lambda images: [[{"name": "person", "conf": 0.9}] for _ in images]
+    base = make_image_bytes(1, size=(64, 48))[0]
+
+    with tempfile.TemporaryDirectory() as folder:
+        pipeline.folder_manifest = FolderManifest(os.path.join(folder, 'manifests.sqlite3'))
+        drive = FakeDrive(latency=args.latency)
+        folder_id = drive.add_folder('Photos')
+        add_images(drive, folder_id, base, 0, args.images)
+
+        print(f"{'run':>12} {'seconds':>9} {'sorted':>7} {'api calls':>10}")
+        elapsed, done, calls = sort(drive, folder_id, args, incremental=True)
+        print(f"{'first':>12} {elapsed:>9.2f} {done:>7} {calls:>10}")
+
+        add_images(drive, folder_id, base, args.images, args.added)
+        for label, incremental in (("full", False), ("incremental", True)):
+            elapsed, done, calls = sort(drive, folder_id, args, incremental)
+            print(f"{label:>12} {elapsed:>9.2f} {done:>7} {calls:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Images/sec of the multi-process inference pool with 1..N workers, each
+pinned to cores // workers threads, against inference in this process.
+
+Run from the backend folder:
+    python benchmarks/bench_inference_pool.py --images 128 --workers 1,2,4
+Pass --source bytes to send images through shared memory instead of paths.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_loader  # noqa: E402
+from benchmarks.corpus import make_image_bytes  # noqa: E402
+from inference_pool import InferencePool  # noqa: E402
+
+
+def write_corpus(folder, count):
+    paths = []
+    for i, data in enumerate(make_image_bytes(count, size=(1280, 960))):
+        path = os.path.join(folder, f"img_{i:05d}.jpg")
+        with open(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def load_sources(paths, kind):
+    if kind == 'path':
+        return paths
+    sources = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            sources.append(f.read())
+    return sources
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=128)
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})))
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--source", choices=("path", "bytes"), default="path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        sources = load_sources(write_corpus(folder, args.images), args.source)
+
+        print(f"{'workers':>8} {'threads':>8} {'seconds':>9} {'img/s':>8}")
+        model_loader.warm_up()
+        start = time.perf_counter()
+        model_loader.get_image_tags_batch(sources, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"{'inline':>8} {'-':>8} {elapsed:>9.2f} {len(sources) / elapsed:>8.1f}")
+
+        for workers in [int(w) for w in args.workers.split(",")]:
+            pool = InferencePool(workers)
+            try:
+                # Start every worker (each loads its model) before timing
+                pool.tag(sources[:workers * args.batch_size], batch_size=args.batch_size)
+                start = time.perf_counter()
+                pool.tag(sources, batch_size=args.batch_size)
+                elapsed = time.perf_counter() - start
+            finally:
+                pool.shutdown()
+            print(f"{workers:>8} {pool.threads_per_worker:>8} {elapsed:>9.2f} {len(sources) / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
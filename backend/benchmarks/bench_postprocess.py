@@ -0,0 +1,97 @@
+"""
+Detection post-processing: the old per-box Python loop versus the
+vectorized tags_from_results, on synthetic results with many boxes.
+No model is loaded; results only carry NumPy cls/conf arrays.
+
+Run from the backend folder:
+    python benchmarks/bench_postprocess.py --images 16 --boxes 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_loader import class_name_table, tags_from_results  # noqa: E402
+
+NAMES = {i: f"class_{i}" for i in range(80)}
+
+
+class FakeBoxes:
+    """Iterates like ultralytics Boxes: each item is a one-box slice."""
+
+    def __init__(self, cls, conf):
+        self.cls, self.conf = cls, conf
+
+    def __len__(self):
+        return len(self.cls)
+
+    def __iter__(self):
+        for i in range(len(self.cls)):
+            yield FakeBoxes(self.cls[i:i + 1], self.conf[i:i + 1])
+
+
+class FakeResult:
+    obb = None
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+def make_results(images, boxes, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        FakeResult(FakeBoxes(
+            rng.integers(0, len(NAMES), boxes).astype(np.float32),
+            rng.uniform(0.65, 1.0, boxes).astype(np.float32),
+        ))
+        for _ in range(images)
+    ]
+
+
+def per_box_loop(r, names):
+    """The previous implementation, kept here as the baseline."""
+    detected = {}
+    for box in r.boxes:
+        cls_id = int(box.cls[0]) if hasattr(box.cls, '__len__') else int(box.cls)
+        conf = float(box.conf[0]) if hasattr(box.conf, '__len__') else float(box.conf)
+        class_name = names.get(cls_id, str(cls_id)) if isinstance(names, dict) else names[cls_id]
+        if conf > detected.get(class_name, 0.0):
+            detected[class_name] = conf
+    return [{"name": k, "conf": round(float(v), 2)} for k, v in detected.items()]
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--boxes", default="10,300,2000", help="boxes per image, comma separated")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    table = class_name_table(NAMES)
+    print(f"{'boxes/img':>10} {'loop ms':>9} {'vector ms':>10} {'speedup':>8}  same")
+    for boxes in [int(b) for b in args.boxes.split(",")]:
+        results = make_results(args.images, boxes)
+        loop_s, expected = timed(lambda: [per_box_loop(r, NAMES) for r in results], args.repeat)
+        vec_s, got = timed(lambda: tags_from_results(results, table), args.repeat)
+        same = all(
+            {t['name']: t['conf'] for t in a} == {t['name']: t['conf'] for t in b}
+            for a, b in zip(expected, got)
+        )
+        print(f"{boxes:>10} {loop_s * 1000:>9.2f} {vec_s * 1000:>10.2f} {loop_s / vec_s:>7.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
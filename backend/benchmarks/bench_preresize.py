@@ -0,0 +1,101 @@
+"""
+Peak RSS and per-image latency of decoding large photos at full size versus
+straight to the model's input size (INFERENCE_DECODE_SIZE). Each mode runs in
+a fresh interpreter so peak RSS is its own.
+
+Run from the backend folder:
+    python benchmarks/bench_preresize.py --images 8 --megapixels 12,48
+Pass --infer to time get_image_tags_batch (model included) instead of the
+decode alone.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from PIL import Image
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from benchmarks.corpus import encode, make_images  # noqa: E402
+
+PROBE = r"""
+import json, resource, sys, time
+import model_loader
+
+
+def peak_rss_kb():
+    # VmHWM starts over at exec; ru_maxrss would include the parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+paths, infer = json.loads(sys.argv[1]), sys.argv[2] == '1'
+if infer:
+    model_loader.warm_up()
+latencies = []
+for path in paths:
+    start = time.perf_counter()
+    if infer:
+        model_loader.get_image_tags_batch([path])
+    else:
+        model_loader._load_image(path)
+    latencies.append(time.perf_counter() - start)
+latencies.sort()
+print(json.dumps({'p50': latencies[len(latencies) // 2], 'max_rss_kb': peak_rss_kb()}))
+"""
+
+
+def write_corpus(folder, count, megapixels, fmt):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    size = (width, width * 3 // 4)
+    paths = []
+    # Upscaled noise: smooth like a photo, so JPEG sizes are realistic
+    for i, small in enumerate(make_images(count, size=(size[0] // 32, size[1] // 32))):
+        data = encode(small.resize(size, Image.BICUBIC), fmt)
+        path = os.path.join(folder, f"{megapixels}mp_{i}.{fmt.lower()}")
+        with open(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def run(paths, decode_size, infer):
+    env = dict(os.environ, INFERENCE_DECODE_SIZE=str(decode_size))
+    out = subprocess.run([sys.executable, "-c", PROBE, json.dumps(paths), "1" if infer else "0"],
+                         cwd=BACKEND, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--megapixels", default="12,48")
+    parser.add_argument("--formats", default="JPEG,PNG")
+    parser.add_argument("--infer", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'image':>10} {'decode':>7} {'p50 ms':>8} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as folder:
+        for fmt in args.formats.split(","):
+            for mp in [int(m) for m in args.megapixels.split(",")]:
+                paths = write_corpus(folder, args.images, mp, fmt)
+                for decode_size in (0, 640):
+                    r = run(paths, decode_size, args.infer)
+                    label = "full" if decode_size == 0 else str(decode_size)
+                    print(f"{f'{mp}MP {fmt}':>10} {label:>7} {r['p50'] * 1000:>8.1f} {r['max_rss_kb'] / 1024:>12.1f}")
+                for path in paths:
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Cost of choosing categories with sorting rules, per batch of tag lists:
+
+    loop       each image checked against each rule in turn, in Python
+    compiled   sorting_rules.SortingRules: one comparison of the batch's
+               (images x classes) confidences against the rule thresholds
+
+Tag lists are drawn at random from the 80 COCO classes (up to --tags per
+image, best first), the rules from groups of --group classes each.
+
+Run from the backend folder:
+    python benchmarks/bench_rules.py --images 10000 --rules 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sorting_rules import SortingRules, UNCATEGORIZED  # noqa: E402
+
+CLASSES = [f"class{i}" for i in range(80)]
+
+
+def make_tags(rand, images, max_tags):
+    all_tags = []
+    for _ in range(images):
+        names = rand.sample(CLASSES, rand.randint(0, max_tags))
+        tags = [{"name": name, "conf": round(rand.uniform(0.25, 1.0), 2)} for name in names]
+        all_tags.append(sorted(tags, key=lambda t: -t["conf"]))
+    return all_tags
+
+
+def make_rules(rand, count, group):
+    rules = []
+    for i in range(count):
+        names = rand.sample(CLASSES, group)
+        if i % 2:
+            rules.append({"category": f"Rule{i}", "classes": {n: round(rand.uniform(0.3, 0.9), 2) for n in names}})
+        else:
+            rules.append({"category": f"Rule{i}", "classes": names, "min_conf": round(rand.uniform(0.3, 0.9), 2)})
+    return rules
+
+
+def categories_loop(rules, default_conf, all_tags):
+    """The same rules evaluated one image and one rule at a time."""
+    categories = []
+    for tags in all_tags:
+        category = None
+        for rule in rules:
+            classes = rule["classes"]
+            if not isinstance(classes, dict):
+                classes = dict.fromkeys(classes, rule.get("min_conf", default_conf))
+            if any(tag["name"] in classes and tag["conf"] >= classes[tag["name"]] for tag in tags):
+                category = rule["category"]
+                break
+        if category is None:
+            category = next((tag["name"] for tag in tags if tag["conf"] >= default_conf), UNCATEGORIZED)
+        categories.append(category)
+    return categories
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=16, help="images per categories_for call (the pipeline's batch)")
+    parser.add_argument("--rules", type=int, default=20)
+    parser.add_argument("--group", type=int, default=4, help="classes per rule")
+    parser.add_argument("--tags", type=int, default=6, help="most tags per image")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    all_tags = make_tags(rand, args.images, args.tags)
+    rules = make_rules(rand, args.rules, args.group)
+    compiled = SortingRules(rules, 0.65)
+    batches = [all_tags[i:i + args.batch] for i in range(0, len(all_tags), args.batch)]
+
+    loop_s, expected = best_of(args.repeat, lambda: [c for b in batches for c in categories_loop(rules, 0.65, b)])
+    compiled_s, got = best_of(args.repeat, lambda: [c for b in batches for c in compiled.categories_for(b)])
+    if got != expected:
+        sys.exit("compiled rules disagree with the loop")
+
+    print(f"{args.images} images in batches of {args.batch}, {args.rules} rules of {args.group} classes, "
+          f"inference at conf {compiled.min_confidence}")
+    print(f"{'rules':>9} {'ms':>8} {'us/image':>9}")
+    for name, seconds in (("loop", loop_s), ("compiled", compiled_s)):
+        print(f"{name:>9} {seconds * 1000:>8.1f} {seconds / args.images * 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
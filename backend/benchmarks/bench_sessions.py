@@ -0,0 +1,103 @@
+"""
+Session read/write latency as the number of stored sessions grows, for
+Flask-Session's filesystem backend (what app.py used before) and the
+memory and SQLite stores in session_store.py. Goes through each session
+interface's storage methods, the part of open_session/save_session that
+differs between backends.
+
+    read   load one session (every request)
+    touch  save an unchanged session (every request: sessions are permanent
+           and refreshed each time)
+    write  save a changed session (login, new job)
+
+Run from the backend folder:
+    python benchmarks/bench_sessions.py --sessions 100,1000,10000,50000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from flask_session.filesystem import FileSystemSessionInterface  # noqa: E402
+
+from session_store import MemorySessionStore, SQLiteSessionStore, StoreSessionInterface  # noqa: E402
+
+LIFETIME = timedelta(days=30)
+CREDENTIALS = {
+    'token': 'ya29.' + 'x' * 180, 'refresh_token': '1//' + 'y' * 100, 'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'z' * 72, 'client_secret': 's' * 35, 'scopes': ['https://www.googleapis.com/auth/drive'],
+}
+
+
+def make_interface(kind, folder, count):
+    app = Flask(__name__)
+    if kind == 'filesystem':
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            # threshold=0: no pruning, so every stored session stays readable
+            return FileSystemSessionInterface(app, cache_dir=os.path.join(folder, 'fs'), threshold=0)
+    if kind == 'memory':
+        return StoreSessionInterface(app, MemorySessionStore(max_entries=count))
+    return StoreSessionInterface(app, SQLiteSessionStore(os.path.join(folder, 'sessions.sqlite3'), 10000))
+
+
+def session_for(interface, sid, jobs):
+    session = interface.session_class({'credentials': CREDENTIALS, 'jobs': jobs}, sid=sid)
+    return session
+
+
+def timed_us(fn, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def run(kind, count, ops):
+    with tempfile.TemporaryDirectory() as folder:
+        interface = make_interface(kind, folder, count)
+        sids = [f"sid{i:08d}" for i in range(count)]
+        for sid in sids:
+            interface._upsert_session(LIFETIME, session_for(interface, sid, []), interface._get_store_id(sid))
+
+        rand = random.Random(0)
+        picks = [interface._get_store_id(rand.choice(sids)) for _ in range(ops)]
+        read = timed_us(interface._retrieve_session_data, [(store_id,) for store_id in picks])
+        touch = timed_us(interface._upsert_session, [
+            (LIFETIME, session_for(interface, store_id, []), store_id) for store_id in picks
+        ])
+        write = timed_us(interface._upsert_session, [
+            (LIFETIME, session_for(interface, store_id, [f"job-{i}"]), store_id) for i, store_id in enumerate(picks)
+        ])
+    return read, touch, write
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", default="100,1000,10000,50000")
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--backends", default="filesystem,memory,sqlite")
+    args = parser.parse_args()
+
+    print(f"{'backend':>10} {'sessions':>9} {'read p50':>9} {'p99':>7} {'touch p50':>10} {'p99':>7} "
+          f"{'write p50':>10} {'p99':>7}   (microseconds)")
+    for count in [int(n) for n in args.sessions.split(",")]:
+        for kind in args.backends.split(","):
+            read, touch, write = run(kind, count, args.ops)
+            print(f"{kind:>10} {count:>9} {read[0]:>9.1f} {read[1]:>7.1f} {touch[0]:>10.1f} {touch[1]:>7.1f} "
+                  f"{write[0]:>10.1f} {write[1]:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
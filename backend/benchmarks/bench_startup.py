@@ -0,0 +1,53 @@
+"""
+Import-to-first-request time of the Flask app, with the model loaded lazily
+(default) and eagerly (PRELOAD_MODEL=1). Each run is a fresh interpreter.
+
+Run from the backend folder:
+    python benchmarks/bench_startup.py --runs 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+client.get('/health')
+t2 = time.perf_counter()
+from model_loader import get_image_tags_batch
+from PIL import Image
+get_image_tags_batch([Image.new('RGB', (640, 480))])
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'first_request': t2 - t0, 'first_inference': t3 - t0}))
+"""
+
+
+def run(preload):
+    env = dict(os.environ, PRELOAD_MODEL="1" if preload else "0")
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} {'import s':>9} {'1st req s':>10} {'1st infer s':>12}")
+    for preload in (False, True):
+        samples = [run(preload) for _ in range(args.runs)]
+        best = {k: min(s[k] for s in samples) for k in samples[0]}
+        mode = "eager" if preload else "lazy"
+        print(f"{mode:>8} {best['import']:>9.2f} {best['first_request']:>10.2f} {best['first_inference']:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
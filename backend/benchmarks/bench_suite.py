@@ -0,0 +1,352 @@
+"""
+End-to-end throughput of the sorting pipeline through the real Flask
+routes (app.test_client), offline: every Drive client the app builds talks
+to FakeDrive (--latency seconds per call, --fail-rate of calls failing with
+a 503), and jobs run on the local thread pool.
+
+Scenarios (--scenarios, default all):
+
+    upload-local         POST /process-upload, poll /jobs/<id>, GET the zip
+    upload-gdrive        POST /process-upload into the Drive Output folder
+    gdrive-local         POST /auth/gdrive/process-folder/<id>, GET the zip
+    gdrive-source        same, sorted into the source account (server-side)
+    gdrive-destination   same, uploaded into a second account
+
+The corpus is --images synthetic photos cycling through --sizes and
+--formats. Each scenario runs in its own process and reports, as JSON:
+images/sec and wall seconds (from the first request until the result, and
+for local the zip, is in), per-stage latency percentiles (every timed()
+stage of metrics.py plus the routes themselves as route:*), peak RSS above
+the process's RSS before the run, and Drive API calls by method.
+
+Run from the backend folder:
+    python benchmarks/bench_suite.py --fake-model --output bench.json
+    python benchmarks/bench_suite.py --fake-model --baseline bench.json
+
+With --baseline the run is compared metric by metric with a saved
+--output file, and the exit status is 1 if any metric got worse by more
+than --tolerance (default 10%).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# Before anything reads Config: no Celery broker (jobs on the local pool),
+# sessions in memory, and nothing remembered between runs
+os.environ["CELERY_BROKER_URL"] = ""
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("RESULT_CACHE_ENABLED", "0")
+os.environ.setdefault("DRIVE_INCREMENTAL", "0")
+
+from benchmarks.corpus import make_corpus  # noqa: E402
+from benchmarks.fake_drive import FakeDrive  # noqa: E402
+
+SCENARIOS = {
+    # name: (source, destination)
+    'upload-local': ('upload', 'local'),
+    'upload-gdrive': ('upload', 'gdrive'),
+    'gdrive-local': ('gdrive', 'local'),
+    'gdrive-source': ('gdrive', 'gdrive-source'),
+    'gdrive-destination': ('gdrive', 'gdrive-destination'),
+}
+PERCENTILES = (50, 95, 99)
+MIN_PERCENTILE_SAMPLES = 20
+POLL_SECONDS = 0.01
+
+
+def _credentials(refresh_token):
+    return {
+        'token': 'token', 'refresh_token': refresh_token, 'token_uri': 'https://oauth2.googleapis.com/token',
+        'client_id': 'client', 'client_secret': 'secret', 'scopes': ['https://www.googleapis.com/auth/drive'],
+    }
+
+
+# ----------------------------------------------------------
+# Measurement
+# ----------------------------------------------------------
+class StageRecorder:
+    """
+    Stands in for metrics.stage_seconds: keeps every observation per stage
+    (for percentiles) and still feeds the real histogram.
+    """
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self.samples = defaultdict(list)
+
+    def labels(self, stage):
+        recorder, child = self, self._histogram.labels(stage)
+
+        class _Observer:
+            def observe(self, seconds):
+                recorder.samples[stage].append(seconds)
+                child.observe(seconds)
+        return _Observer()
+
+    def record(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    summary = {}
+    for stage, values in sorted(samples.items()):
+        values = sorted(values)
+        summary[stage] = {'count': len(values), 'total': round(sum(values), 4)}
+        summary[stage].update({f"p{p}": round(percentile(values, p), 6) for p in PERCENTILES})
+    return summary
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:')) / 1024
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+# ----------------------------------------------------------
+# One scenario (in a child process)
+# ----------------------------------------------------------
+def run_scenario(name, args):
+    import drive_clients
+    import metrics
+    import pipeline
+
+    source, destination = SCENARIOS[name]
+    corpus = []
+    for filename in sorted(os.listdir(args.corpus_dir)):
+        with open(os.path.join(args.corpus_dir, filename), 'rb') as f:
+            corpus.append((filename, f.read()))
+
+    drive = FakeDrive(latency=args.latency, fail_rate=args.fail_rate, seed=args.seed)
+    # Every client the app builds (drive_clients) is a FakeDrive one
+    drive_clients.build = lambda *a, **kw: drive.service()
+    drive_clients.authorized_http = lambda credentials: drive.http()
+    if args.fake_model:
+        pipeline.get_image_tags_batch = lambda images: [[{"name": "person", "conf": 0.9}] for _ in images]
+    else:
+        from inference_pool import warm_up
+        warm_up()
+
+    stages = StageRecorder(metrics.stage_seconds)
+    metrics.stage_seconds = stages
+
+    from app import app
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['credentials'] = _credentials('source-account')
+        session['destination_credentials'] = _credentials('destination-account')
+
+    folder_id = None
+    if source == 'gdrive':
+        folder_id = drive.add_folder('Photos')
+        for filename, data in corpus:
+            drive.add_file(filename, data, folder_id, 'image/png' if filename.endswith('.png') else 'image/jpeg')
+        drive.calls.clear()
+
+    baseline_rss = rss_mb()
+    start = time.perf_counter()
+
+    t = time.perf_counter()
+    if source == 'upload':
+        form = {'destination': destination, 'files': [(io.BytesIO(data), filename) for filename, data in corpus]}
+        response = client.post('/process-upload', data=form, content_type='multipart/form-data')
+        stages.record('route:process-upload', time.perf_counter() - t)
+    else:
+        response = client.post(f'/auth/gdrive/process-folder/{folder_id}',
+                               json={'destination': destination, 'incremental': False})
+        stages.record('route:process-folder', time.perf_counter() - t)
+    if response.status_code != 202:
+        sys.exit(f"{name}: {response.status_code} {response.get_data(as_text=True)}")
+    job_id = response.get_json()['job_id']
+
+    while True:
+        t = time.perf_counter()
+        body = client.get(f'/jobs/{job_id}?timings=1').get_json()
+        stages.record('route:job-status', time.perf_counter() - t)
+        if body['state'] in ('SUCCESS', 'FAILURE'):
+            break
+        time.sleep(POLL_SECONDS)
+    if body['state'] == 'FAILURE':
+        sys.exit(f"{name}: job failed: {body.get('error')}")
+
+    zip_bytes = 0
+    if body.get('download_url'):
+        t = time.perf_counter()
+        response = client.get(body['download_url'])
+        zip_bytes = sum(len(chunk) for chunk in response.response)
+        response.close()
+        stages.record('route:download', time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    results = body.get('results') or {}
+    return {
+        'images': len(corpus),
+        'sorted': len(results),
+        'errors': sum(tags == ["Error"] for tags in results.values()),
+        'seconds': round(elapsed, 4),
+        'images_per_sec': round(len(corpus) / elapsed, 2),
+        'peak_rss_mb': round(peak_rss_mb() - baseline_rss, 1),
+        'zip_mb': round(zip_bytes / (1024 * 1024), 2),
+        'api_calls': dict(sorted(drive.calls.items())),
+        'stages': summarize(stages.samples),
+    }
+
+
+# ----------------------------------------------------------
+# Baseline comparison
+# ----------------------------------------------------------
+def comparable_metrics(scenario):
+    """
+    (name, value, higher_is_better) of every metric worth comparing across
+    runs. Percentiles are only compared for stages with at least
+    MIN_PERCENTILE_SAMPLES observations; a p95 of five is noise.
+    """
+    yield 'images_per_sec', scenario['images_per_sec'], True
+    yield 'seconds', scenario['seconds'], False
+    yield 'peak_rss_mb', scenario['peak_rss_mb'], False
+    yield 'api_calls', sum(scenario['api_calls'].values()), False
+    for stage, summary in scenario['stages'].items():
+        yield f"{stage} total", summary['total'], False
+        if summary['count'] >= MIN_PERCENTILE_SAMPLES:
+            for p in PERCENTILES:
+                yield f"{stage} p{p}", summary[f"p{p}"], False
+
+
+def compare(report, baseline, tolerance, min_seconds):
+    """Prints each metric against the baseline; returns the regressions."""
+    regressions = []
+    print(f"\n{'scenario':<20} {'metric':<32} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, scenario in report['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            print(f"{name:<20} (not in baseline)")
+            continue
+        old_metrics = {metric: value for metric, value, _ in comparable_metrics(old)}
+        for metric, value, higher_is_better in comparable_metrics(scenario):
+            before = old_metrics.get(metric)
+            if before is None:
+                continue
+            change = (value - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            # Stages that take next to no time in both runs are scheduling noise
+            noise = ' ' in metric and max(value, before) < min_seconds
+            flag = ''
+            if worse > tolerance and not noise:
+                flag = '  REGRESSION'
+                regressions.append((name, metric))
+            print(f"{name:<20} {metric:<32} {before:>12.4g} {value:>12.4g} {change:>+7.1%}{flag}")
+    return regressions
+
+
+# ----------------------------------------------------------
+# Driver
+# ----------------------------------------------------------
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--images", type=int, default=60)
+    parser.add_argument("--sizes", default="640x480,1920x1080,4000x3000")
+    parser.add_argument("--formats", default="JPEG,PNG")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per FakeDrive call")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of FakeDrive calls failing with a 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fake-model", action="store_true", help="leave YOLO out: every image gets one tag")
+    parser.add_argument("--output", help="write the JSON report here (stdout otherwise)")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--min-seconds", type=float, default=0.01,
+                        help="stage timings below this in both runs are never regressions")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = run_scenario(args.run_scenario, args)
+        print("BENCH_RESULT " + json.dumps(result))
+        return
+
+    # One corpus on disk for every scenario, so a child's setup costs no memory the run would not
+    corpus_dir = tempfile.mkdtemp(prefix='bench-corpus-')
+    sizes = [tuple(int(n) for n in size.split('x')) for size in args.sizes.split(',')]
+    for filename, data in make_corpus(args.images, sizes, args.formats.split(','), seed=args.seed):
+        with open(os.path.join(corpus_dir, filename), 'wb') as f:
+            f.write(data)
+
+    options = ['--corpus-dir', corpus_dir, '--latency', str(args.latency), '--fail-rate', str(args.fail_rate),
+               '--seed', str(args.seed)]
+    options += ['--fake-model'] if args.fake_model else []
+    report = {
+        'meta': {
+            'commit': git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'options': {k: v for k, v in vars(args).items()
+                        if k not in ('output', 'baseline', 'run_scenario', 'corpus_dir')},
+        },
+        'scenarios': {},
+    }
+    names = args.scenarios.split(',')
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+    for name in names:
+        try:
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-scenario', name] + options,
+                                  cwd=BACKEND, capture_output=True, text=True)
+        finally:
+            if name == names[-1]:
+                shutil.rmtree(corpus_dir, ignore_errors=True)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith('BENCH_RESULT ')]
+        if proc.returncode != 0 or not lines:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+            sys.exit(f"{name} failed:\n{proc.stdout[-2000:]}{proc.stderr[-4000:]}")
+        scenario = json.loads(lines[-1][len('BENCH_RESULT '):])
+        report['scenarios'][name] = scenario
+        print(f"{name:<20} {scenario['images_per_sec']:>8.1f} img/s {scenario['seconds']:>8.2f} s "
+              f"{scenario['peak_rss_mb']:>7.0f} MB peak  {sum(scenario['api_calls'].values()):>5} API calls  "
+              f"{scenario['errors']} errors", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    elif not args.baseline:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
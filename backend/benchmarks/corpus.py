@@ -0,0 +1,47 @@
+"""Synthetic images for the benchmarks (random noise, so nothing is cached)."""
+import io
+
+import numpy as np
+from PIL import Image
+
+
+def make_images(count, size=(1280, 960), seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+        for _ in range(count)
+    ]
+
+
+def encode(img, fmt='JPEG', quality=90):
+    buf = io.BytesIO()
+    if fmt == 'JPEG':
+        img.save(buf, fmt, quality=quality)
+    else:
+        img.save(buf, fmt)
+    return buf.getvalue()
+
+
+def make_image_bytes(count, size=(1280, 960), fmt='JPEG', seed=0):
+    return [encode(img, fmt) for img in make_images(count, size, seed)]
+
+
+def make_photo(size, seed=0):
+    """Smooth, photo-like content (upscaled noise): compresses like a real photo, unlike make_images."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(1, size[1] // 16), max(1, size[0] // 16), 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+def make_corpus(count, sizes=((1280, 960),), formats=('JPEG',), seed=0):
+    """
+    `count` (filename, bytes) pairs cycling through every size x format
+    combination, each image distinct so no cache or dedup stage hits.
+    """
+    combos = [(size, fmt) for size in sizes for fmt in formats]
+    corpus = []
+    for i in range(count):
+        size, fmt = combos[i % len(combos)]
+        ext = 'jpg' if fmt == 'JPEG' else fmt.lower()
+        corpus.append((f"img_{i:05d}_{size[0]}x{size[1]}.{ext}", encode(make_photo(size, seed + i), fmt)))
+    return corpus
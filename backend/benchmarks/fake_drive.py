@@ -0,0 +1,308 @@
+"""
+In-process stand-in for the Drive v3 client used by drive_service/pipeline.
+
+FakeDrive holds the files; FakeDrive.service() returns a client object with
+the same call shapes as googleapiclient's (files().list(...).execute(),
+get_media() usable with MediaIoBaseDownload, create() with a media body,
+new_batch_http_request(), thumbnailLink fetched through ._http, and the
+changes API over a log of every file added or updated).
+Every call sleeps `latency` seconds and is counted in FakeDrive.calls, and
+`fail_rate` makes that fraction of calls fail with a 503.
+"""
+import hashlib
+import io
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from googleapiclient.errors import HttpError
+from PIL import Image
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+_QUOTED = r"'((?:[^'\\]|\\.)*)'"
+_ATOM_PATTERNS = [
+    (re.compile(rf"^{_QUOTED} in parents$"), lambda f, v: v in f['parents']),
+    (re.compile(rf"^name\s*=\s*{_QUOTED}$"), lambda f, v: f['name'] == v),
+    (re.compile(rf"^mimeType\s*=\s*{_QUOTED}$"), lambda f, v: f['mimeType'] == v),
+    (re.compile(rf"^mimeType\s*!=\s*{_QUOTED}$"), lambda f, v: f['mimeType'] != v),
+    (re.compile(rf"^mimeType contains {_QUOTED}$"), lambda f, v: v in f['mimeType']),
+    (re.compile(r"^trashed\s*=\s*(true|false)$"), lambda f, v: f['trashed'] == (v == 'true')),
+]
+
+
+class FakeResponse(dict):
+    """Looks enough like an httplib2.Response for googleapiclient."""
+
+    def __init__(self, status, headers=None):
+        super().__init__(headers or {})
+        self.status = status
+        self.reason = 'OK' if status < 400 else 'Error'
+
+
+def _matches(file, query):
+    if not query:
+        return True
+    for clause in re.split(r"\s+and\s+", query):
+        atoms = re.split(r"\s+or\s+", clause.strip().strip('()'))
+        if not any(_match_atom(file, atom.strip().strip('()')) for atom in atoms):
+            return False
+    return True
+
+
+def _match_atom(file, atom):
+    for pattern, test in _ATOM_PATTERNS:
+        m = pattern.match(atom)
+        if m:
+            return test(file, re.sub(r"\\(.)", r"\1", m.group(1)))
+    raise ValueError(f"FakeDrive does not understand query term: {atom}")
+
+
+def _public(file):
+    return {k: v for k, v in file.items() if k != 'data'}
+
+
+class FakeDrive:
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.files = {}
+        self.calls = Counter()
+        self.bytes_down = 0
+        self.bytes_up = 0
+        self.bytes_thumbnails = 0
+        self.change_log = []  # file ids in the order they changed; a page token is an index
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._rand = random.Random(seed)
+
+    # --- setup helpers ---
+    def add_folder(self, name, parent='root'):
+        return self._add({'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent]})
+
+    def add_file(self, name, data, parent, mime_type='image/jpeg'):
+        return self._add({'name': name, 'mimeType': mime_type, 'parents': [parent], 'data': data})
+
+    def _add(self, meta):
+        with self._lock:
+            self._next_id += 1
+            file_id = f"fake{self._next_id}"
+        data = meta.get('data')
+        file = {
+            'id': file_id, 'trashed': False,
+            'modifiedTime': datetime.now(timezone.utc).isoformat(),
+            **meta,
+        }
+        if data is not None:
+            file['size'] = str(len(data))
+            file['md5Checksum'] = hashlib.md5(data).hexdigest()
+            if file['mimeType'].startswith('image/'):
+                file['thumbnailLink'] = f"fake://thumbnail/{file_id}=s220"
+        with self._lock:
+            self.files[file_id] = file
+            self.change_log.append(file_id)
+        return file_id
+
+    def touch(self, file_id):
+        with self._lock:
+            self.files[file_id]['modifiedTime'] = datetime.now(timezone.utc).isoformat()
+            self.change_log.append(file_id)
+
+    def children(self, parent_id):
+        return [f for f in self.files.values() if parent_id in f['parents'] and not f['trashed']]
+
+    # --- simulated network ---
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            fail = self.fail_rate and self._rand.random() < self.fail_rate
+        if self.latency:
+            time.sleep(self.latency)
+        return fail
+
+    def service(self):
+        return FakeDriveService(self)
+
+    def http(self):
+        """An authorized transport of the account (thumbnailLink fetches)."""
+        return _ThumbnailHttp(self)
+
+
+class _Request:
+    def __init__(self, drive, name, fn):
+        self._drive, self._name, self._fn = drive, name, fn
+
+    def execute(self, num_retries=0, http=None):
+        for _ in range(num_retries + 1):
+            if not self._drive._call(self._name):
+                return self._fn()
+        raise HttpError(FakeResponse(503), b'{"error": "backendError"}')
+
+
+class _MediaHttp:
+    def __init__(self, drive, file_id):
+        self._drive, self._file_id = drive, file_id
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if self._drive._call('files.get_media'):
+            return FakeResponse(503), b''
+        data = self._drive.files[self._file_id]['data']
+        start, end = 0, len(data) - 1
+        m = re.match(r"bytes=(\d+)-(\d*)", (headers or {}).get('range', ''))
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)) if m.group(2) else end, end)
+        chunk = data[start:end + 1]
+        with self._drive._lock:
+            self._drive.bytes_down += len(chunk)
+        return FakeResponse(206, {'content-range': f"bytes {start}-{end}/{len(data)}"}), chunk
+
+
+class _MediaRequest:
+    """What files().get_media() returns; consumed by MediaIoBaseDownload."""
+
+    def __init__(self, drive, file_id):
+        self.uri = f"fake://drive/{file_id}?alt=media"
+        self.headers = {}
+        self.http = _MediaHttp(drive, file_id)
+
+
+class _ThumbnailHttp:
+    """An authorized transport as far as thumbnailLink fetches go."""
+
+    def __init__(self, drive):
+        self._drive = drive
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if self._drive._call('thumbnail'):
+            return FakeResponse(503), b''
+        m = re.match(r"fake://thumbnail/(\w+)=s(\d+)$", uri)
+        with Image.open(io.BytesIO(self._drive.files[m.group(1)]['data'])) as img:
+            img.thumbnail((int(m.group(2)), int(m.group(2))))
+            out = io.BytesIO()
+            img.convert('RGB').save(out, 'JPEG', quality=85)
+        with self._drive._lock:
+            self._drive.bytes_thumbnails += out.tell()
+        return FakeResponse(200, {'content-type': 'image/jpeg'}), out.getvalue()
+
+
+class _Files:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def list(self, q=None, pageSize=100, pageToken=None, fields=None, **kwargs):
+        def run():
+            with self._drive._lock:
+                files = list(self._drive.files.values())
+            matches = sorted((f for f in files if _matches(f, q)), key=lambda f: f['id'])
+            start = int(pageToken or 0)
+            page = matches[start:start + pageSize]
+            body = {'files': [_public(f) for f in page]}
+            if start + pageSize < len(matches):
+                body['nextPageToken'] = str(start + pageSize)
+            return body
+        return _Request(self._drive, 'files.list', run)
+
+    def get(self, fileId, fields=None, **kwargs):
+        return _Request(self._drive, 'files.get', lambda: _public(self._drive.files[fileId]))
+
+    def get_media(self, fileId, **kwargs):
+        return _MediaRequest(self._drive, fileId)
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        def run():
+            meta = dict(body or {})
+            meta.setdefault('mimeType', getattr(media_body, 'mimetype', lambda: None)() or 'application/octet-stream')
+            meta.setdefault('parents', ['root'])
+            if media_body is not None:
+                meta['data'] = media_body.getbytes(0, media_body.size())
+                with self._drive._lock:
+                    self._drive.bytes_up += len(meta['data'])
+            return {'id': self._drive._add(meta)}
+        return _Request(self._drive, 'files.create', run)
+
+    def copy(self, fileId, body=None, fields=None, **kwargs):
+        def run():
+            source = self._drive.files[fileId]
+            meta = {k: source[k] for k in ('name', 'mimeType', 'data') if k in source}
+            meta['parents'] = list(source['parents'])
+            meta.update(body or {})
+            return {'id': self._drive._add(meta)}
+        return _Request(self._drive, 'files.copy', run)
+
+    def update(self, fileId, body=None, addParents=None, removeParents=None, fields=None, **kwargs):
+        def run():
+            file = self._drive.files[fileId]
+            file.update(body or {})
+            if removeParents:
+                file['parents'] = [p for p in file['parents'] if p not in removeParents.split(',')]
+            if addParents:
+                file['parents'] += addParents.split(',')
+            self._drive.touch(fileId)
+            return {'id': fileId}
+        return _Request(self._drive, 'files.update', run)
+
+
+class _Changes:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return _Request(self._drive, 'changes.getStartPageToken',
+                        lambda: {'startPageToken': str(len(self._drive.change_log))})
+
+    def list(self, pageToken, pageSize=100, fields=None, **kwargs):
+        def run():
+            start = int(pageToken)
+            page = self._drive.change_log[start:start + pageSize]
+            body = {'changes': [
+                {'fileId': file_id, 'removed': False, 'file': _public(self._drive.files[file_id])} for file_id in page
+            ]}
+            if start + pageSize < len(self._drive.change_log):
+                body['nextPageToken'] = str(start + pageSize)
+            else:
+                body['newStartPageToken'] = str(start + len(page))
+            return body
+        return _Request(self._drive, 'changes.list', run)
+
+
+class _Batch:
+    """What new_batch_http_request() returns: one simulated round trip for all calls."""
+
+    def __init__(self, drive, callback):
+        self._drive, self._callback = drive, callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request_id or str(len(self._requests)), request, callback or self._callback))
+
+    def execute(self, http=None):
+        fail = self._drive._call('batch')
+        for request_id, request, callback in self._requests:
+            with self._drive._lock:
+                self._drive.calls[request._name] += 1
+            if fail:
+                callback(request_id, None, HttpError(FakeResponse(503), b'{"error": "backendError"}'))
+                continue
+            try:
+                response = request._fn()
+            except Exception as e:
+                callback(request_id, None, e)
+            else:
+                callback(request_id, response, None)
+
+
+class FakeDriveService:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def files(self):
+        return _Files(self._drive)
+
+    def changes(self):
+        return _Changes(self._drive)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self._drive, callback)
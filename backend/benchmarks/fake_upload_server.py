@@ -0,0 +1,187 @@
+"""
+Local HTTP stand-in for Drive's upload endpoint, speaking the resumable
+upload protocol, so the real googleapiclient code path can be exercised:
+
+    server = FakeUploadServer(fail_rate=0.2).start()
+    service = server.drive_service()
+    ...
+    server.stop()
+
+POST /upload/drive/v3/files?uploadType=resumable opens a session (Location
+header); PUTs with Content-Range append chunks and get a 308 with the Range
+received so far until the last byte, then 200 with {"id": ...}. A PUT with
+"bytes */total" reports progress. uploadType=multipart/media are accepted
+in one request. `fail_rate` of requests fail with a 503 (chunk data that
+arrived with a failing request is dropped), and `drop_rate` of chunk PUTs
+keep only the first half of the data before failing, like a cut connection.
+For tests, `fail_puts`/`drop_puts` pick those faults for given chunk PUTs
+(numbered from 1) instead, and `chunk_starts` records where each chunk PUT
+started ('*' for a progress query).
+"""
+import json
+import random
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _split_related(content_type, body):
+    """(metadata, media bytes) of a multipart/related upload body."""
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1).encode()
+    metadata_part, media_part = body.split(b'--' + boundary)[1:3]
+    metadata = json.loads(re.split(rb'\r?\n\r?\n', metadata_part, maxsplit=1)[1])
+    media = re.split(rb'\r?\n\r?\n', media_part, maxsplit=1)[1]
+    return metadata, re.sub(rb'\r?\n$', b'', media)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeDriveUpload/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def do_POST(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        upload_type = parse_qs(url.query).get('uploadType', [''])[0]
+        body = self._body()
+        fake.count('POST ' + upload_type, len(body))
+        if fake.should_fail():
+            return self._reply(503, {'error': {'code': 503, 'message': 'backendError'}})
+        if upload_type == 'resumable':
+            session = fake.open_session(json.loads(body or b'{}'), self.headers.get('X-Upload-Content-Length'))
+            return self._reply(200, headers={'Location': f"{fake.base_url}upload/session/{session}"})
+        if upload_type == 'multipart':
+            metadata, body = _split_related(self.headers.get('Content-Type', ''), body)
+            return self._reply(200, {'id': fake.store(metadata, body)})
+        return self._reply(200, {'id': fake.store({}, body)})
+
+    def do_PUT(self):
+        fake = self.server.fake
+        session_id = self.path.rsplit('/', 1)[-1]
+        session = fake.sessions.get(session_id)
+        body = self._body()
+        fake.count('PUT', len(body))
+        if session is None:
+            return self._reply(404, {'error': {'code': 404, 'message': 'Session not found'}})
+
+        m = re.match(r"bytes (\*|(\d+)-(\d+))/(\d+|\*)", self.headers.get('Content-Range', ''))
+        if not m:
+            return self._reply(400, {'error': {'code': 400, 'message': 'Bad Content-Range'}})
+        if m.group(1) == '*':
+            fake.chunk_starts.append('*')
+        else:
+            start = int(m.group(2))
+            fake.chunk_starts.append(start)
+            put = len([s for s in fake.chunk_starts if s != '*'])
+            if put in fake.drop_puts or fake.should_drop():
+                # Connection cut half way: keep what "arrived", then fail
+                if start == len(session['data']):
+                    session['data'] += body[:len(body) // 2]
+                return self._reply(503, {'error': {'code': 503, 'message': 'backendError'}})
+            if put in fake.fail_puts or fake.should_fail():
+                return self._reply(503, {'error': {'code': 503, 'message': 'backendError'}})
+            if start == len(session['data']):
+                session['data'] += body
+            elif start < len(session['data']):
+                # Overlapping resend: keep only the new tail
+                session['data'] = session['data'][:start] + body
+        total = m.group(4)
+        if total != '*' and len(session['data']) >= int(total):
+            file_id = fake.store(session['metadata'], bytes(session['data']))
+            del fake.sessions[session_id]
+            return self._reply(200, {'id': file_id})
+        headers = {'Range': f"bytes=0-{len(session['data']) - 1}"} if session['data'] else {}
+        return self._reply(308, headers=headers)
+
+
+class FakeUploadServer:
+    def __init__(self, fail_rate=0.0, drop_rate=0.0, seed=0, fail_puts=(), drop_puts=()):
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.fail_puts = set(fail_puts)
+        self.drop_puts = set(drop_puts)
+        self.chunk_starts = []
+        self.requests = Counter()
+        self.bytes_received = 0
+        self.files = {}
+        self.sessions = {}
+        self._rand = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.fake = self
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}/"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def drive_service(self):
+        """A real googleapiclient Drive client whose uploads go to this server."""
+        import httplib2
+        from googleapiclient.discovery import build
+
+        plain_base = self.base_url
+        secure_base = plain_base.replace('http://', 'https://')
+
+        class PlainHttp(httplib2.Http):
+            # googleapiclient moves upload URLs to the endpoint's host but
+            # keeps https; this server only speaks plain http. 308 means
+            # "resume incomplete" here, not a redirect (as in build_http).
+            def __init__(self):
+                super().__init__()
+                self.redirect_codes = self.redirect_codes - {308}
+
+            def request(self, uri, *args, **kwargs):
+                return super().request(uri.replace(secure_base, plain_base), *args, **kwargs)
+
+        return build('drive', 'v3', http=PlainHttp(), static_discovery=True,
+                     client_options={'api_endpoint': self.base_url})
+
+    # --- used by the handler ---
+    def count(self, name, size):
+        with self._lock:
+            self.requests[name] += 1
+            self.bytes_received += size
+
+    def should_fail(self):
+        with self._lock:
+            return self.fail_rate and self._rand.random() < self.fail_rate
+
+    def should_drop(self):
+        with self._lock:
+            return self.drop_rate and self._rand.random() < self.drop_rate
+
+    def open_session(self, metadata, size):
+        with self._lock:
+            self._next_id += 1
+            session_id = f"s{self._next_id}"
+        self.sessions[session_id] = {'metadata': metadata, 'size': size, 'data': bytearray()}
+        return session_id
+
+    def store(self, metadata, data):
+        with self._lock:
+            self._next_id += 1
+            file_id = f"f{self._next_id}"
+        self.files[file_id] = {'metadata': metadata, 'data': data}
+        return file_id
@@ -22,3 +22,145 @@ class Config:
 
     # This can be any random, secret string used for signing session cookies.
     SECRET_KEY = os.environ.get("SECRET_KEY") or "you-should-really-change-this"
+
+    # Background jobs: Celery when a broker is configured, otherwise an
+    # in-process thread pool with JOB_WORKERS threads (a single gunicorn
+    # worker only: each worker would see just its own jobs).
+    # Celery workers read the user's Google credentials from the session
+    # store (SESSION_BACKEND sqlite on the same host, or redis), and uploads
+    # and local results through the temp_uploads and sorted_output folders:
+    # a worker on another host needs both on a volume shared with the web
+    # hosts, mounted at the same path relative to the backend folder.
+    CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
+    CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND") or CELERY_BROKER_URL
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+
+    # Google Drive transfer concurrency. Downloads prefetch into a queue of at
+    # most DRIVE_PREFETCH files so memory stays bounded while inference runs.
+    DRIVE_DOWNLOAD_WORKERS = int(os.environ.get("DRIVE_DOWNLOAD_WORKERS", 4))
+    DRIVE_UPLOAD_WORKERS = int(os.environ.get("DRIVE_UPLOAD_WORKERS", 4))
+    DRIVE_PREFETCH = int(os.environ.get("DRIVE_PREFETCH", 32))
+
+    # Seconds to keep resolved Drive folder ids across jobs (0 = per job only)
+    DRIVE_FOLDER_CACHE_TTL = int(os.environ.get("DRIVE_FOLDER_CACHE_TTL", 0))
+
+    # Drive clients kept between requests (drive_clients.py): up to
+    # DRIVE_CLIENT_ACCOUNTS accounts, each with DRIVE_CLIENT_IDLE_PER_ACCOUNT
+    # spare clients, dropped after DRIVE_CLIENT_IDLE_SECONDS unused.
+    DRIVE_CLIENT_ACCOUNTS = int(os.environ.get("DRIVE_CLIENT_ACCOUNTS", 256))
+    DRIVE_CLIENT_IDLE_PER_ACCOUNT = int(os.environ.get("DRIVE_CLIENT_IDLE_PER_ACCOUNT", 2))
+    DRIVE_CLIENT_IDLE_SECONDS = int(os.environ.get("DRIVE_CLIENT_IDLE_SECONDS", 900))
+    DRIVE_HTTP_TIMEOUT = int(os.environ.get("DRIVE_HTTP_TIMEOUT", 60))
+
+    # Inference result cache: in-process LRU of at most RESULT_CACHE_MEMORY_MB
+    # backed by a SQLite file trimmed back when it outgrows RESULT_CACHE_DISK_MB.
+    # Set RESULT_CACHE_PATH to "" to keep only the in-memory tier.
+    RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+    RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH", os.path.join("cache", "results.sqlite3"))
+    RESULT_CACHE_MEMORY_BYTES = int(os.environ.get("RESULT_CACHE_MEMORY_MB", 32)) * 1024 * 1024
+    RESULT_CACHE_DISK_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MB", 512)) * 1024 * 1024
+
+    # Load (and warm up) the YOLO model at startup instead of on first use.
+    # With gunicorn's preload_app the weights load once in the master and
+    # forked workers share them copy-on-write (see gunicorn.conf.py).
+    PRELOAD_MODEL = os.environ.get("PRELOAD_MODEL", "0") == "1"
+
+    # Inference engine: "torch" (ultralytics) or "onnx" (onnxruntime, CPU).
+    # The ONNX model is exported from models/yolo11n.pt on first use if missing.
+    INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+    ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH")
+    ONNX_INT8 = os.environ.get("ONNX_INT8", "0") == "1"
+    ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", 0))
+    ONNX_INTER_OP_THREADS = int(os.environ.get("ONNX_INTER_OP_THREADS", 0))
+
+    # Inference worker processes, each holding one model ("auto" = the cores
+    # divided between the WEB_CONCURRENCY gunicorn workers, each of which
+    # starts its own pool; 0 = run inference on the job's own thread).
+    # INFERENCE_THREADS is the torch/onnxruntime thread count per worker
+    # (0 = cores // workers). Celery's prefork children cannot start
+    # processes: run the Celery worker with --pool threads (or solo) when
+    # this is set.
+    INFERENCE_WORKERS = os.environ.get("INFERENCE_WORKERS", "0")
+    WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+    INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 0))
+
+    # /process-upload limits, enforced while the body streams in. The job
+    # gives up on an upload that sends nothing for UPLOAD_IDLE_TIMEOUT seconds.
+    MAX_UPLOAD_FILE_BYTES = int(os.environ.get("MAX_UPLOAD_FILE_MB", 50)) * 1024 * 1024
+    MAX_UPLOAD_REQUEST_BYTES = int(os.environ.get("MAX_UPLOAD_REQUEST_MB", 2048)) * 1024 * 1024
+    UPLOAD_IDLE_TIMEOUT = int(os.environ.get("UPLOAD_IDLE_TIMEOUT", 300))
+
+    # Uploads to Drive: files above DRIVE_RESUMABLE_MIN_MB use a resumable
+    # session sent in DRIVE_UPLOAD_CHUNK_MB chunks (Drive wants multiples of
+    # 256 KB). 5xx/429s and dropped connections are retried with jittered
+    # exponential backoff: up to DRIVE_UPLOAD_RETRIES times per upload chunk,
+    # DRIVE_RETRIES times for other Drive calls (listings, folders, copies,
+    # moves, download chunks).
+    DRIVE_UPLOAD_CHUNK_BYTES = int(os.environ.get("DRIVE_UPLOAD_CHUNK_MB", 8)) * 1024 * 1024
+    DRIVE_RESUMABLE_MIN_BYTES = int(os.environ.get("DRIVE_RESUMABLE_MIN_MB", 5)) * 1024 * 1024
+    DRIVE_UPLOAD_RETRIES = int(os.environ.get("DRIVE_UPLOAD_RETRIES", 5))
+    DRIVE_RETRIES = int(os.environ.get("DRIVE_RETRIES", 5))
+    DRIVE_RETRY_BASE_SECONDS = float(os.environ.get("DRIVE_RETRY_BASE_SECONDS", 0.5))
+    DRIVE_RETRY_MAX_SECONDS = float(os.environ.get("DRIVE_RETRY_MAX_SECONDS", 32))
+
+    # Downloads from Drive come DRIVE_DOWNLOAD_CHUNK_MB at a time into a
+    # buffer of the file's size while all downloads held in memory by this
+    # process (prefetched, waiting for inference or upload) stay within
+    # DRIVE_DOWNLOAD_MEMORY_MB; beyond that, or of unknown size, into a
+    # temporary file on disk (TMPDIR).
+    # DRIVE_PREVIEW_RANGE_KB > 0: for gdrive-source, an image with no Drive
+    # thumbnail first has only its first KB fetched; a progressive JPEG
+    # whose low-resolution scans fit in them is tagged from those alone.
+    DRIVE_DOWNLOAD_CHUNK_BYTES = int(os.environ.get("DRIVE_DOWNLOAD_CHUNK_MB", 8)) * 1024 * 1024
+    DRIVE_DOWNLOAD_MEMORY_BYTES = int(os.environ.get("DRIVE_DOWNLOAD_MEMORY_MB", 128)) * 1024 * 1024
+    DRIVE_PREVIEW_RANGE_BYTES = int(os.environ.get("DRIVE_PREVIEW_RANGE_KB", 512)) * 1024
+
+    # Drive folder -> Output folder of the same account: originals are placed
+    # server-side, by "copy" (the source folder keeps its files) or "move".
+    # Inference runs on Drive's thumbnail of each image when it has one.
+    DRIVE_SOURCE_PLACEMENT = os.environ.get("DRIVE_SOURCE_PLACEMENT", "copy")
+    DRIVE_USE_THUMBNAILS = os.environ.get("DRIVE_USE_THUMBNAILS", "1") == "1"
+
+    # Drive-to-Drive sorts remember what they placed (MANIFEST_PATH), so a
+    # re-run of the same folder only handles files added or changed since.
+    DRIVE_INCREMENTAL = os.environ.get("DRIVE_INCREMENTAL", "1") == "1"
+    MANIFEST_PATH = os.environ.get("MANIFEST_PATH", os.path.join("cache", "manifests.sqlite3"))
+
+    # Exact copies within a job (same MD5) reuse the first copy's tags
+    # instead of going through the model. DEDUP_NEAR_DUPLICATES=1 also
+    # matches burst shots and re-encodes, by a 64-bit perceptual hash
+    # (DEDUP_HASH "dhash" or "phash") within DEDUP_MAX_DISTANCE bits: those
+    # are different photos, so it is off unless asked for.
+    # DEDUP_DUPLICATES_FOLDER=1 sorts copies into a "Duplicates" category
+    # instead of the first copy's.
+    DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "1") == "1"
+    DEDUP_NEAR_DUPLICATES = os.environ.get("DEDUP_NEAR_DUPLICATES", "0") == "1"
+    DEDUP_HASH = os.environ.get("DEDUP_HASH", "dhash")
+    DEDUP_MAX_DISTANCE = int(os.environ.get("DEDUP_MAX_DISTANCE", 5))
+    DEDUP_DUPLICATES_FOLDER = os.environ.get("DEDUP_DUPLICATES_FOLDER", "0") == "1"
+
+    # Sorting rules (sorting_rules.py): a JSON list in SORT_RULES, or a JSON
+    # file at SORT_RULES_PATH, e.g.
+    #   [{"category": "Vehicles", "classes": ["car", "truck", "bus"]},
+    #    {"category": "People", "classes": {"person": 0.8}}]
+    # An image goes to the first rule with any of its classes detected at the
+    # rule's confidence (min_conf, default TAG_CONFIDENCE), else to its best
+    # tag of at least TAG_CONFIDENCE. The model runs once, at the lowest
+    # confidence any rule needs. Rules that do not parse are logged at
+    # startup and ignored.
+    TAG_CONFIDENCE = float(os.environ.get("TAG_CONFIDENCE", 0.65))
+    SORT_RULES = os.environ.get("SORT_RULES", "")
+    SORT_RULES_PATH = os.environ.get("SORT_RULES_PATH", "")
+
+    # Server-side sessions: "sqlite" (SESSION_DB_PATH, shared by the workers
+    # of one host), "memory" (single process only), or Flask-Session's
+    # "redis" (SESSION_REDIS_URL, shared across hosts) and "filesystem".
+    # sqlite/memory keep up to SESSION_CACHE_ENTRIES sessions in each
+    # process, only rewrite an unchanged session every SESSION_TOUCH_SECONDS
+    # and sweep expired ones every SESSION_SWEEP_SECONDS.
+    SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")
+    SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", os.path.join("cache", "sessions.sqlite3"))
+    SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL") or CELERY_BROKER_URL
+    SESSION_CACHE_ENTRIES = int(os.environ.get("SESSION_CACHE_ENTRIES", 10000))
+    SESSION_TOUCH_SECONDS = int(os.environ.get("SESSION_TOUCH_SECONDS", 60))
+    SESSION_SWEEP_SECONDS = int(os.environ.get("SESSION_SWEEP_SECONDS", 300))
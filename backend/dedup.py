@@ -0,0 +1,162 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+from config import Config
+
+DUPLICATES_CATEGORY = "Duplicates"
+HASH_BITS = 64
+
+
+# ----------------------------------------------------------
+# Perceptual hashes (64-bit ints; similar images differ in few bits)
+# ----------------------------------------------------------
+def _small_gray(img, size):
+    # draft() lets the JPEG decoder skip most of the work at this size
+    img.draft('L', (size[0] * 4, size[1] * 4))
+    return np.asarray(img.convert('L').resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def dhash(img):
+    """Difference hash: is each pixel brighter than its right neighbour, on a 9x8 thumbnail."""
+    pixels = _small_gray(img, (9, 8))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] /= np.sqrt(2)
+    return m * np.sqrt(2 / n)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(img):
+    """DCT hash: the 8x8 lowest frequencies of a 32x32 thumbnail against their median."""
+    pixels = _small_gray(img, (32, 32))
+    low = (_DCT32 @ pixels @ _DCT32.T)[:8, :8].ravel()
+    return _bits_to_int(low > np.median(low[1:]))  # the DC term would skew the median
+
+
+HASHES = {'dhash': dhash, 'phash': phash}
+
+
+def image_hash(source, method=None):
+    """
+    Perceptual hash of a path, bytes or file object (rewound afterwards),
+    or None if it cannot be decoded.
+    """
+    fn = HASHES[method or Config.DEDUP_HASH]
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        with Image.open(source) as img:
+            return fn(img)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] Could not hash image: {e}")
+        return None
+    finally:
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+
+
+# ----------------------------------------------------------
+# Hamming-radius lookup
+# ----------------------------------------------------------
+class MultiIndexHash:
+    """
+    Finds a stored hash within `max_distance` bits of a query without
+    comparing against all of them. The bits are split into
+    max_distance + 1 chunks, each with its own table: two hashes that
+    differ in at most max_distance bits agree exactly on at least one
+    chunk, so only the entries sharing a chunk value are compared.
+    """
+
+    def __init__(self, max_distance, bits=HASH_BITS):
+        self.max_distance = max_distance
+        n = min(max_distance + 1, bits)
+        widths = [bits // n + (1 if i < bits % n else 0) for i in range(n)]
+        self._chunks, offset = [], 0
+        for width in widths:
+            self._chunks.append((offset, (1 << width) - 1))
+            offset += width
+        self._tables = [{} for _ in self._chunks]
+        self.size = 0
+
+    def add(self, h, value):
+        for (offset, mask), table in zip(self._chunks, self._tables):
+            table.setdefault((h >> offset) & mask, []).append((h, value))
+        self.size += 1
+
+    def nearest(self, h):
+        """(distance, value) of the closest stored hash within max_distance, or None."""
+        best = None
+        for (offset, mask), table in zip(self._chunks, self._tables):
+            for other, value in table.get((h >> offset) & mask, ()):
+                distance = (h ^ other).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, value)
+                    if distance == 0:
+                        return best
+        return best
+
+
+# ----------------------------------------------------------
+# Per-job duplicate index
+# ----------------------------------------------------------
+class DuplicateIndex:
+    """
+    The images seen so far in one job: exact copies are matched by MD5,
+    and with `near` (DEDUP_NEAR_DUPLICATES) near-duplicates (burst shots,
+    re-encodes, resizes) by perceptual hash. check() returns the entry of
+    the first copy, a dict whose 'tags' the caller fills in once that copy
+    has been tagged.
+    """
+
+    def __init__(self, max_distance=None, method=None, near=None):
+        self.max_distance = Config.DEDUP_MAX_DISTANCE if max_distance is None else max_distance
+        self.method = method or Config.DEDUP_HASH
+        self.near = Config.DEDUP_NEAR_DUPLICATES if near is None else near
+        self._by_md5 = {}
+        self._hashes = MultiIndexHash(self.max_distance)
+        self.duplicates = 0
+
+    def check(self, name, md5, source=None):
+        """
+        (entry, is_duplicate) for one image. An image that is not a
+        duplicate is registered, and later copies will match its entry.
+        `source` (path, bytes or file object) is only decoded when the MD5
+        is new and near-duplicates are matched; None skips the perceptual check.
+        """
+        entry = self._by_md5.get(md5) if md5 else None
+        h = None
+        if entry is None and source is not None and self.near:
+            h = image_hash(source, self.method)
+            if h is not None:
+                match = self._hashes.nearest(h)
+                entry = match[1] if match else None
+        if entry is not None:
+            self.duplicates += 1
+            if md5:
+                self._by_md5.setdefault(md5, entry)
+            return entry, True
+
+        entry = {'name': name, 'tags': None}
+        if md5:
+            self._by_md5[md5] = entry
+        if h is not None:
+            self._hashes.add(h, entry)
+        return entry, False
+
+
+def duplicate_index():
+    """A DuplicateIndex for a new job, or None if DEDUP_ENABLED is off."""
+    return DuplicateIndex() if Config.DEDUP_ENABLED else None
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import google_auth_httplib2
+import httplib2
+from googleapiclient.discovery import build
+
+from config import Config
+from drive_service import account_key, credentials_from_dict
+
+
+# ----------------------------------------------------------
+# Drive clients reused across requests
+# ----------------------------------------------------------
+def authorized_http(credentials):
+    """A keep-alive httplib2 transport that signs requests with (and refreshes) `credentials`."""
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=Config.DRIVE_HTTP_TIMEOUT))
+
+
+class _Account:
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.idle = []  # (service, its authorized_http) pairs
+        self.last_used = time.monotonic()
+
+
+class DriveClientPool:
+    """
+    Drive clients kept between requests, per account, so a request does
+    not pay for building the API surface, a new TLS connection and (with a
+    stale token in the session) a 401 followed by a token refresh.
+
+    A client is used by one thread at a time: client() checks one out for
+    the duration of a block and puts it back afterwards. Its httplib2
+    transport is not thread-safe, but keeps its connections alive between
+    requests. All clients of an account share one Credentials, so a token
+    refreshed through any of them is used by all; refreshed() gives the
+    session's credentials dict with that token. At most `max_accounts`
+    accounts are kept (least recently used first out), each with up to
+    `idle_clients` spare clients, and an account unused for `idle_seconds`
+    is dropped.
+    """
+
+    def __init__(self, max_accounts=None, idle_clients=None, idle_seconds=None):
+        self.max_accounts = Config.DRIVE_CLIENT_ACCOUNTS if max_accounts is None else max_accounts
+        self.idle_clients = Config.DRIVE_CLIENT_IDLE_PER_ACCOUNT if idle_clients is None else idle_clients
+        self.idle_seconds = Config.DRIVE_CLIENT_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self._accounts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build_service(self, http):
+        """A new client over `http`, its own authorized_http transport."""
+        return build('drive', 'v3', http=http, cache_discovery=False)
+
+    def _checkout(self, creds_data, take_idle=True):
+        key = account_key(creds_data)
+        now = time.monotonic()
+        dropped = []
+        with self._lock:
+            while self._accounts:
+                oldest_key, oldest = next(iter(self._accounts.items()))
+                if now - oldest.last_used < self.idle_seconds and len(self._accounts) < self.max_accounts:
+                    break
+                dropped.append(self._accounts.pop(oldest_key))
+            account = self._accounts.pop(key, None) or _Account(credentials_from_dict(creds_data))
+            self._accounts[key] = account
+            account.last_used = now
+            client = account.idle.pop() if take_idle and account.idle else None
+        for old in dropped:
+            _close(old)
+        return key, account, client
+
+    @contextmanager
+    def client(self, creds_data):
+        """A Drive client for the account behind `creds_data`, for this thread only."""
+        key, account, client = self._checkout(creds_data)
+        if client is None:
+            http = authorized_http(account.credentials)
+            client = (self.build_service(http), http)
+        try:
+            yield client[0]
+        finally:
+            with self._lock:
+                kept = self._accounts.get(key) is account and len(account.idle) < self.idle_clients
+                if kept:
+                    account.idle.append(client)
+            if not kept:
+                client[1].close()
+
+    def build_for(self, creds_data):
+        """
+        A client of its own for the account behind `creds_data`, never put
+        back in the pool: for a job thread that keeps one for the whole job.
+        It shares the account's Credentials with every other client, so the
+        token is refreshed once per account, not once per thread.
+        """
+        _, account, _ = self._checkout(creds_data, take_idle=False)
+        return self.build_service(authorized_http(account.credentials))
+
+    def build_http_for(self, creds_data):
+        """
+        Like build_for, but a bare authorized transport, for the URLs that
+        are not API methods (thumbnailLink).
+        """
+        _, account, _ = self._checkout(creds_data, take_idle=False)
+        return authorized_http(account.credentials)
+
+    def refreshed(self, creds_data):
+        """`creds_data` with the account's current token, or None if it already has it."""
+        with self._lock:
+            account = self._accounts.get(account_key(creds_data))
+        if account is None:
+            return None
+        credentials = account.credentials
+        if not credentials.token or credentials.token == creds_data.get('token'):
+            return None
+        return {
+            **creds_data,
+            'token': credentials.token,
+            'expiry': credentials.expiry.isoformat() if credentials.expiry else None,
+        }
+
+    def evict(self, creds_data):
+        """Forgets an account's clients and credentials (logout)."""
+        with self._lock:
+            account = self._accounts.pop(account_key(creds_data), None)
+        if account is not None:
+            _close(account)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._accounts)
+
+
+def _close(account):
+    for _, http in account.idle:
+        http.close()
+    account.idle = []
+
+
+drive_clients = DriveClientPool()
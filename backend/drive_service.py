@@ -0,0 +1,720 @@
+import hashlib
+import io
+import mimetypes
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import weakref
+from datetime import datetime
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+from config import Config
+from metrics import drive_bytes_total, drive_calls_total, timed
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+IMAGE_QUERY = "(mimeType='image/jpeg' or mimeType='image/png')"
+DRIVE_PAGE_SIZE = 1000  # Largest page files().list accepts
+
+# ----------------------------------------------------------
+# Helper: Credentials <-> session dict, and a Drive client from one
+# ----------------------------------------------------------
+def credentials_to_dict(creds):
+    return {
+        'token': creds.token,
+        'refresh_token': creds.refresh_token,
+        'token_uri': creds.token_uri,
+        'client_id': creds.client_id,
+        'client_secret': creds.client_secret,
+        'scopes': creds.scopes,
+        # Lets google-auth refresh an expired token before using it instead
+        # of after a 401 (naive UTC, as google-auth keeps it)
+        'expiry': creds.expiry.isoformat() if creds.expiry else None,
+    }
+
+
+def credentials_from_dict(creds_data):
+    data = dict(creds_data)
+    expiry = data.pop('expiry', None)
+    return Credentials(**data, expiry=datetime.fromisoformat(expiry) if expiry else None)
+
+# ----------------------------------------------------------
+# API call and byte counters (metrics.py)
+# ----------------------------------------------------------
+def count_call(name, n=1):
+    drive_calls_total.labels(name).inc(n)
+
+
+def count_bytes(kind, n):
+    """Image bytes moved: 'downloaded' (originals), 'thumbnails' or 'uploaded'. Copies and moves move none."""
+    drive_bytes_total.labels(kind).inc(n)
+
+
+def account_key(creds_data):
+    """Stable, non-secret id for the Drive account behind a credentials dict."""
+    secret = creds_data.get('refresh_token') or creds_data.get('token') or ''
+    return hashlib.sha256(secret.encode()).hexdigest()[:16]
+
+
+# ----------------------------------------------------------
+# Helper: Batch HTTP requests
+# ----------------------------------------------------------
+DRIVE_BATCH_LIMIT = 100  # Drive accepts at most 100 calls per batch request
+
+
+def execute_batch(service, requests):
+    """
+    Runs many Drive API calls in as few round trips as possible.
+
+    `requests` is a list of (key, request) where request is an unexecuted
+    call such as service.files().list(...). Calls are grouped into
+    service.new_batch_http_request() batches of up to DRIVE_BATCH_LIMIT.
+    Returns {key: response}; a call that failed maps to its exception.
+    """
+    results = {}
+    keys = {}
+
+    def callback(request_id, response, exception):
+        results[keys[request_id]] = exception if exception is not None else response
+
+    for start in range(0, len(requests), DRIVE_BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=callback)
+        for i, (key, request) in enumerate(requests[start:start + DRIVE_BATCH_LIMIT]):
+            keys[str(start + i)] = key
+            batch.add(request, request_id=str(start + i))
+        count_call('batch')
+        count_call('batched_requests', min(DRIVE_BATCH_LIMIT, len(requests) - start))
+        batch.execute()
+    return results
+
+
+def _quote(value):
+    """Escapes a value for use inside a single-quoted Drive query string."""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+# ----------------------------------------------------------
+# Helper: Find or create a folder (optionally cached)
+# ----------------------------------------------------------
+def _folder_query(name, parent_id):
+    return (f"mimeType='{FOLDER_MIME_TYPE}' and name='{_quote(name)}' "
+            f"and '{parent_id}' in parents and trashed=false")
+
+
+def find_or_create_folder(service, name, parent_id):
+    """
+    Returns the id of folder `name` inside parent_id, creating it if missing.
+    Retried as a whole, so a create that failed after all is found next time.
+    """
+    return with_retries(_find_or_create_folder, service, name, parent_id)
+
+
+def _find_or_create_folder(service, name, parent_id):
+    count_call('files.list')
+    items = service.files().list(q=_folder_query(name, parent_id), spaces='drive', fields="files(id)").execute().get('files', [])
+    if items:
+        return items[0]['id']
+    folder_metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent_id]}
+    count_call('files.create')
+    return service.files().create(body=folder_metadata, fields='id').execute().get('id')
+
+
+def find_or_create_folders(service, names, parent_id):
+    """
+    Batched find_or_create_folder for several names: one batch of
+    existence checks, then one batch creating whatever is missing.
+    Returns {name: folder_id}.
+    """
+    names = list(names)
+    if len(names) == 1:
+        return {names[0]: find_or_create_folder(service, names[0], parent_id)}
+
+    found = {}
+    pending = names
+    attempt = 0
+    while True:
+        failed = []
+        try:
+            listings = execute_batch(service, [
+                (name, service.files().list(q=_folder_query(name, parent_id), spaces='drive', fields="files(id)"))
+                for name in pending
+            ])
+            missing = []
+            for name in pending:
+                if isinstance(listings[name], Exception):
+                    failed.append((name, listings[name]))
+                elif listings[name].get('files'):
+                    found[name] = listings[name]['files'][0]['id']
+                else:
+                    missing.append(name)
+
+            created = execute_batch(service, [
+                (name, service.files().create(
+                    body={'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent_id]}, fields='id'))
+                for name in missing
+            ])
+            for name in missing:
+                if isinstance(created[name], Exception):
+                    failed.append((name, created[name]))
+                else:
+                    found[name] = created[name]['id']
+        except Exception as e:  # the batch request itself
+            failed = [(name, e) for name in pending if name not in found]
+        if not failed:
+            return found
+
+        # Names whose lookup or create failed are looked up again, in case a
+        # create went through after all
+        error = next((e for _, e in failed if not _is_retryable(e)), failed[0][1])
+        if attempt >= Config.DRIVE_RETRIES or not _is_retryable(error):
+            raise error
+        count_call('retries')
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+        pending = [name for name, _ in failed]
+
+
+class FolderCache:
+    """
+    Maps (account, parent_id, name) -> folder id so each category folder is
+    looked up (or created) once per job instead of once per file.
+
+    Safe to share between upload threads: lookups for the same key are
+    serialised, so two threads meeting a new category create one folder.
+    With a ttl the cache can outlive a job; entries older than ttl seconds
+    are resolved again.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._ids = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get_or_create(self, service, account, parent_id, name):
+        return self.resolve_many(service, account, parent_id, [name])[name]
+
+    def resolve_many(self, service, account, parent_id, names):
+        """Returns {name: folder_id}, resolving every uncached name in one batch."""
+        names = sorted(set(names))
+        keys = [(account, parent_id, name) for name in names]
+        with self._lock:
+            key_locks = [self._key_locks.setdefault(key, threading.Lock()) for key in keys]
+        # Always taken in sorted order, so overlapping calls cannot deadlock
+        for key_lock in key_locks:
+            key_lock.acquire()
+        try:
+            found, missing = {}, []
+            with self._lock:
+                now = time.monotonic()
+                for name, key in zip(names, keys):
+                    entry = self._ids.get(key)
+                    if entry and (self.ttl is None or now - entry[1] < self.ttl):
+                        self.hits += 1
+                        found[name] = entry[0]
+                    else:
+                        self.misses += 1
+                        missing.append(name)
+            if missing:
+                resolved = find_or_create_folders(service, missing, parent_id)
+                with self._lock:
+                    now = time.monotonic()
+                    for name, folder_id in resolved.items():
+                        self._ids[(account, parent_id, name)] = (folder_id, now)
+                found.update(resolved)
+            return found
+        finally:
+            for key_lock in key_locks:
+                key_lock.release()
+
+    def forget(self, account, parent_id, name):
+        with self._lock:
+            self._ids.pop((account, parent_id, name), None)
+
+
+_shared_folder_cache = FolderCache(ttl=Config.DRIVE_FOLDER_CACHE_TTL) if Config.DRIVE_FOLDER_CACHE_TTL > 0 else None
+
+
+def folder_cache_for_job():
+    """The process-wide cache when DRIVE_FOLDER_CACHE_TTL is set, else a fresh one."""
+    return _shared_folder_cache or FolderCache()
+
+
+# ----------------------------------------------------------
+# Helper: Ensure or Create Output Folder in Drive
+# ----------------------------------------------------------
+def get_or_create_output_folder(service_destination, folder_cache=None, account=None):
+    """Ensures 'Output' folder exists in root of destination drive."""
+    output_folder_name = 'Output'
+    try:
+        if folder_cache is not None:
+            return folder_cache.get_or_create(service_destination, account, 'root', output_folder_name)
+        return find_or_create_folder(service_destination, output_folder_name, 'root')
+    except Exception as e:
+        print(f"[ERROR] Failed to get/create Output folder: {e}")
+        raise
+
+# ----------------------------------------------------------
+# Helper: Upload File to Drive
+# ----------------------------------------------------------
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+_MAGIC_MIMETYPES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'BM', 'image/bmp'),
+]
+
+
+def guess_mimetype(name, head=b''):
+    """Mimetype from the file's first bytes, falling back to its extension."""
+    for magic, mimetype in _MAGIC_MIMETYPES:
+        if head.startswith(magic):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'image/heic'
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def _read_head(file_path, stream, size=32):
+    if stream is not None:
+        start = stream.tell()
+        head = stream.read(size)
+        stream.seek(start)
+        return head
+    with open(file_path, 'rb') as f:
+        return f.read(size)
+
+
+def _media_for(file_path, stream):
+    """
+    Media body for an upload. Files above DRIVE_RESUMABLE_MIN_BYTES go up
+    as a resumable session in DRIVE_UPLOAD_CHUNK_BYTES chunks; smaller ones
+    in a single request, which saves the session round trip.
+    """
+    mimetype = guess_mimetype(file_path, _read_head(file_path, stream))
+    if stream is not None:
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+    else:
+        size = os.path.getsize(file_path)
+    resumable = size > Config.DRIVE_RESUMABLE_MIN_BYTES
+    if stream is not None:
+        return MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=Config.DRIVE_UPLOAD_CHUNK_BYTES, resumable=resumable)
+    return MediaFileUpload(file_path, mimetype=mimetype, chunksize=Config.DRIVE_UPLOAD_CHUNK_BYTES, resumable=resumable)
+
+
+def _is_retryable(error):
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, OSError)  # connection reset, timeouts
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter: 0..base*2^attempt seconds, capped."""
+    return random.uniform(0, min(Config.DRIVE_RETRY_MAX_SECONDS, Config.DRIVE_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+def with_retries(call, *args, retries=None, **kwargs):
+    """
+    call(*args, **kwargs), retried after a 5xx/429 or a dropped connection
+    up to DRIVE_RETRIES times with jittered exponential backoff.
+    """
+    retries = Config.DRIVE_RETRIES if retries is None else retries
+    attempt = 0
+    while True:
+        try:
+            return call(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            count_call('retries')
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+def execute_upload(request, retries=None):
+    """
+    Runs a files().create/update request that carries media. A resumable
+    upload is sent chunk by chunk; after a 5xx/429 or a dropped connection
+    the next call asks Drive how much arrived and carries on from there,
+    so only the failed chunk is re-sent.
+    """
+    retries = Config.DRIVE_UPLOAD_RETRIES if retries is None else retries
+    resumable = getattr(request, 'resumable', None) is not None
+    attempt = 0
+    while True:
+        try:
+            if not resumable:
+                return request.execute()
+            status, response = request.next_chunk()
+            if response is not None:
+                return response
+            attempt = 0  # progress was made; the retry budget is per chunk
+        except Exception as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            count_call('upload_retries')
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+def upload_file_to_gdrive(service, file_path, folder_name, parent_id, stream=None,
+                          folder_cache=None, account=None):
+    """
+    Uploads file into a folder (category) inside parent_id (Output folder).
+    If `stream` is given its bytes are uploaded as-is under the name of
+    file_path, so nothing has to be written to disk first. With a
+    folder_cache the category folder is only resolved once per job.
+    Returns the number of bytes uploaded.
+    """
+    try:
+        if folder_cache is not None:
+            folder_id = folder_cache.get_or_create(service, account, parent_id, folder_name)
+        else:
+            folder_id = find_or_create_folder(service, folder_name, parent_id)
+
+        file_metadata = {'name': os.path.basename(file_path), 'parents': [folder_id]}
+        media = _media_for(file_path, stream)
+        try:
+            count_call('files.create')
+            execute_upload(service.files().create(body=file_metadata, media_body=media, fields='id'))
+        except HttpError as e:
+            # A cached folder may have been deleted in Drive since; resolve it once more
+            if folder_cache is None or e.resp.status != 404:
+                raise
+            folder_cache.forget(account, parent_id, folder_name)
+            file_metadata['parents'] = [folder_cache.get_or_create(service, account, parent_id, folder_name)]
+            media = _media_for(file_path, stream)
+            count_call('files.create')
+            execute_upload(service.files().create(body=file_metadata, media_body=media, fields='id'))
+        count_bytes('uploaded', media.size())
+        return media.size()
+
+    except Exception as e:
+        print(f"[ERROR] Upload failed for {file_path}: {e}")
+        raise
+
+# ----------------------------------------------------------
+# Helper: List and download images
+# ----------------------------------------------------------
+def iter_files(service, query, fields="id, name", page_size=DRIVE_PAGE_SIZE):
+    """
+    Yields every file matching `query`, one page of `page_size` at a time.
+    Only the requested per-file `fields` are fetched, and the next page is
+    only requested once the caller has consumed the previous one.
+    """
+    page_token = None
+    while True:
+        count_call('files.list')
+        with timed('list'):
+            response = with_retries(service.files().list(
+                q=query, pageSize=page_size, pageToken=page_token,
+                fields=f"nextPageToken, files({fields})",
+            ).execute)
+        yield from response.get('files', [])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def iter_folder_images(service, folder_id, recursive=False, fields="id, name", visited=None):
+    """
+    Yields the JPEG/PNG images inside folder_id, page by page, so processing
+    can start while the listing continues. With recursive=True subfolders
+    are walked too (each folder id is visited once, and added to `visited`
+    if a set is passed).
+    """
+    seen = visited if visited is not None else set()
+    seen.add(folder_id)
+    pending = [folder_id]
+    while pending:
+        current = pending.pop()
+        yield from iter_files(service, f"'{current}' in parents and {IMAGE_QUERY} and trashed=false", fields)
+        if recursive:
+            subfolders = iter_files(service, f"'{current}' in parents and mimeType='{FOLDER_MIME_TYPE}' and trashed=false", "id")
+            for folder in subfolders:
+                if folder['id'] not in seen:
+                    seen.add(folder['id'])
+                    pending.append(folder['id'])
+
+
+def get_start_page_token(service):
+    """Token for the changes API: changes().list from it returns what changed after now."""
+    count_call('changes.getStartPageToken')
+    return with_retries(service.changes().getStartPageToken().execute)['startPageToken']
+
+
+def list_changes(service, page_token, fields="id, name"):
+    """
+    Returns (changes, new_start_page_token) for everything in the account
+    that changed since page_token, latest state per file id. Each change
+    has 'fileId', 'removed' and, unless removed, 'file' with the requested
+    fields plus mimeType, parents and trashed.
+    """
+    wanted = [f.strip() for f in fields.split(',')]
+    file_fields = ", ".join(wanted + [f for f in ('mimeType', 'parents', 'trashed') if f not in wanted])
+    changes = {}
+    while True:
+        count_call('changes.list')
+        response = with_retries(service.changes().list(
+            pageToken=page_token, pageSize=DRIVE_PAGE_SIZE, spaces='drive', includeRemoved=True,
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({file_fields}))",
+        ).execute)
+        for change in response.get('changes', []):
+            changes.pop(change['fileId'], None)
+            changes[change['fileId']] = change
+        if 'newStartPageToken' in response:
+            return list(changes.values()), response['newStartPageToken']
+        page_token = response['nextPageToken']
+
+
+def copy_file_to_folder(service, file_id, name, folder_id):
+    """Server-side copy of a Drive file into folder_id; no bytes pass through us."""
+    count_call('files.copy')
+    return with_retries(service.files().copy(fileId=file_id, body={'name': name, 'parents': [folder_id]}, fields='id').execute)
+
+
+def move_file_to_folder(service, file_id, folder_id, old_parents):
+    """Server-side move of a Drive file from old_parents into folder_id."""
+    count_call('files.update')
+    return with_retries(service.files().update(
+        fileId=file_id, addParents=folder_id, removeParents=','.join(old_parents), fields='id'
+    ).execute)
+
+
+# ----------------------------------------------------------
+# Downloads
+# ----------------------------------------------------------
+_THUMBNAIL_SIZE = re.compile(r'=s\d+$')
+
+
+def download_thumbnail(http, image, size):
+    """
+    Fetches Drive's own rendition of `image` (listed with thumbnailLink)
+    scaled to `size` px on its longest side, as a BytesIO. thumbnailLink is
+    not an API method, so `http` is an authorized transport for the account
+    (drive_clients.build_http_for). Returns None when Drive has no thumbnail
+    for it or the fetch fails, so the caller can fall back to download_file.
+    """
+    link = image.get('thumbnailLink')
+    if not link:
+        return None
+    url = _THUMBNAIL_SIZE.sub(f'=s{size}', link) if _THUMBNAIL_SIZE.search(link) else link
+    count_call('thumbnails')
+    try:
+        resp, content = http.request(url)
+    except Exception:
+        return None
+    if resp.status != 200 or not content:
+        return None
+    count_bytes('thumbnails', len(content))
+    return io.BytesIO(content)
+
+
+class _MemoryBudget:
+    """Bytes of DownloadBuffers alive in this process, against DRIVE_DOWNLOAD_MEMORY_BYTES."""
+
+    def __init__(self):
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self, n):
+        with self._lock:
+            if self.used + n > Config.DRIVE_DOWNLOAD_MEMORY_BYTES:
+                return False
+            self.used += n
+            return True
+
+    def release(self, n):
+        with self._lock:
+            self.used -= n
+
+
+download_memory = _MemoryBudget()
+
+
+class DownloadBuffer(io.RawIOBase):
+    """
+    Seekable file object over one bytearray of a download's size, filled in
+    place: unlike a BytesIO it never regrows (and copies) while chunks come
+    in, and getbuffer() hands the bytes on (to inference, shared memory or
+    disk) as a memoryview.
+    """
+
+    def __init__(self, size, budget=None):
+        super().__init__()
+        self._buf = bytearray(size)
+        self._release = weakref.finalize(self, budget.release, size) if budget is not None else None
+        self._end = 0
+        self._pos = 0
+
+    def close(self):
+        """Gives the bytes back to the budget now rather than when collected."""
+        if self._release is not None:
+            self._release()
+        self._buf = bytearray()
+        self._end = self._pos = 0
+        super().close()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        end = self._pos + len(data)
+        if end > len(self._buf):  # more than the listing said
+            self._buf.extend(bytes(end - len(self._buf)))
+        self._buf[self._pos:end] = data
+        self._pos = end
+        self._end = max(self._end, end)
+        return len(data)
+
+    def read(self, size=-1):
+        end = self._end if size is None or size < 0 else min(self._end, self._pos + size)
+        data = bytes(memoryview(self._buf)[self._pos:end])
+        self._pos = max(self._pos, end)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._end}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def getbuffer(self):
+        return memoryview(self._buf)[:self._end]
+
+
+def download_file(service, file_id, size=None, head=b''):
+    """
+    Downloads a Drive file and returns it rewound: in a DownloadBuffer when
+    its size (the listing's `size`) is known and fits in what is left of
+    DRIVE_DOWNLOAD_MEMORY_BYTES, otherwise in a temporary file, so however
+    many downloads are in flight their memory stays bounded. Only one
+    DRIVE_DOWNLOAD_CHUNK_BYTES chunk is held on top of that. `head`, the
+    start of the file already fetched by download_head, is not fetched again.
+    The caller closes it once done, which deletes a temporary file at once.
+    """
+    size = int(size) if size else None
+    if size is not None and download_memory.take(size):
+        fh = DownloadBuffer(size, download_memory)
+    else:
+        fh = tempfile.TemporaryFile()
+    fh.write(head)
+    if size is None or len(head) < size:
+        request_file = service.files().get_media(fileId=file_id)
+        offset, chunk = len(head), Config.DRIVE_DOWNLOAD_CHUNK_BYTES
+        while True:
+            count_call('files.get_media')  # each ranged GET is a request of its own
+            content, total = with_retries(_get_range, request_file, offset, chunk)
+            count_bytes('downloaded', len(content))
+            fh.write(content)
+            offset += len(content)
+            if len(content) < chunk or offset == total:
+                break
+    fh.seek(0)
+    return fh
+
+
+def _get_range(request_file, start, length):
+    """
+    Up to `length` bytes from `start` of a files().get_media() request, in
+    one ranged GET on its (authorized) transport, and the file's total size
+    if the response says (None if not). Raises HttpError on failure, as execute() does.
+    """
+    headers = dict(request_file.headers, range=f"bytes={start}-{start + length - 1}")
+    resp, content = request_file.http.request(request_file.uri, headers=headers)
+    if resp.status == 416:  # nothing left from start on
+        return b'', start
+    if resp.status >= 300:
+        raise HttpError(resp, content, uri=request_file.uri)
+    if resp.status == 200:  # range ignored: the rest of the file is here
+        return content[start:], len(content)
+    total = re.search(r'/(\d+)$', resp.get('content-range', ''))
+    return content, int(total.group(1)) if total else None
+
+
+def download_head(service, file_id, nbytes):
+    """The first `nbytes` of a Drive file in one ranged request, or None if the fetch fails."""
+    count_call('files.get_media')
+    request_file = service.files().get_media(fileId=file_id)
+    try:
+        content, _ = _get_range(request_file, 0, nbytes)
+    except Exception:
+        return None
+    count_bytes('downloaded', len(content))
+    return content
+
+
+def _next_marker(data, i):
+    """Offset of the first JPEG marker at or after i (skips entropy-coded data), or None."""
+    while True:
+        i = data.find(b'\xff', i)
+        if i < 0 or i + 1 >= len(data):
+            return None
+        if data[i + 1] != 0 and not 0xD0 <= data[i + 1] <= 0xD7:  # stuffed byte / restart marker
+            return i
+        i += 2
+
+
+def progressive_jpeg_preview(head):
+    """
+    A progressive JPEG sends the DC coefficients of every block first: on
+    their own they are the image at 1/8 scale, which is all a draft decode
+    down to DECODE_SIZE of a large photo needs. Returns `head` cut before
+    its first AC scan and closed with an EOI marker (a complete, blurrier
+    JPEG), or None for a baseline JPEG, which needs every byte, and when
+    the DC scans do not end within `head`.
+    """
+    if not head.startswith(b'\xff\xd8'):
+        return None
+    i, progressive = 2, False
+    while i is not None and i + 4 <= len(head):
+        if head[i] != 0xFF:
+            return None
+        marker = head[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0xD9:
+            return None
+        length = int.from_bytes(head[i + 2:i + 4], 'big')
+        if length < 2 or i + 2 + length > len(head):
+            return None
+        if marker == 0xC2:
+            progressive = True
+        elif marker == 0xDA:
+            if not progressive:
+                return None
+            components = head[i + 4]
+            spectral_end = head[i + 6 + 2 * components]
+            if spectral_end != 0:
+                return head[:i] + b'\xff\xd9'
+            i = _next_marker(head, i + 2 + length)
+            continue
+        i += 2 + length
+    return None
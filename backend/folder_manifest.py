@@ -0,0 +1,218 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from config import Config
+from drive_service import FOLDER_MIME_TYPE, get_start_page_token, iter_folder_images, list_changes
+
+IMAGE_MIME_TYPES = ('image/jpeg', 'image/png')  # Same as drive_service.IMAGE_QUERY
+
+
+class FolderManifest:
+    """
+    What earlier Drive-to-Drive sorts of a folder already placed: file id,
+    md5Checksum, modifiedTime and category per file, plus the changes-API
+    page token and known subfolders of the last complete run. Rows are
+    keyed by a run key naming the account, source folder and destination
+    (see run_key), in a SQLite file shared by every worker on the host.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    @property
+    def _db(self):
+        """This process's connection; like ResultCache's, never shared across a fork."""
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs (run_key TEXT PRIMARY KEY, page_token TEXT, "
+                "folders TEXT NOT NULL, finished REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (run_key TEXT NOT NULL, file_id TEXT NOT NULL, md5 TEXT, "
+                "modified_time TEXT, category TEXT, PRIMARY KEY (run_key, file_id))"
+            )
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def last_run(self, run_key):
+        """(page_token, subfolder ids) of the last complete run, or (None, set())."""
+        with self._lock:
+            row = self._db.execute("SELECT page_token, folders FROM runs WHERE run_key = ?", (run_key,)).fetchone()
+        return (row[0], set(json.loads(row[1]))) if row else (None, set())
+
+    def save_run(self, run_key, page_token, folders):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO runs (run_key, page_token, folders, finished) VALUES (?, ?, ?, ?)",
+                (run_key, page_token, json.dumps(sorted(folders)), time.time()),
+            )
+
+    def known(self, run_key, file_ids):
+        """{file_id: (md5, modified_time)} for the ids already placed."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(file_ids), 500):
+                chunk = file_ids[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT file_id, md5, modified_time FROM files WHERE run_key = ? AND file_id IN ({marks})",
+                    [run_key, *chunk],
+                ).fetchall()
+                found.update((file_id, (md5, modified)) for file_id, md5, modified in rows)
+        return found
+
+    def record_many(self, run_key, rows):
+        """rows: (file_id, md5, modified_time, category)"""
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files (run_key, file_id, md5, modified_time, category) VALUES (?, ?, ?, ?, ?)",
+                [(run_key, *row) for row in rows],
+            )
+
+    def forget_many(self, run_key, file_ids):
+        if not file_ids:
+            return
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM files WHERE run_key = ? AND file_id = ?", [(run_key, file_id) for file_id in file_ids]
+            )
+
+
+def _unchanged(placed, image):
+    """Same content as when placed: md5Checksum decides, modifiedTime if Drive has no md5."""
+    if placed is None:
+        return False
+    md5, modified_time = placed
+    if md5:
+        return md5 == image.get('md5Checksum')
+    return modified_time == image.get('modifiedTime')
+
+
+def run_key(account, folder_id, destination, destination_account, recursive):
+    return f"{account}:{folder_id}:{destination}:{destination_account}:{'recursive' if recursive else 'flat'}"
+
+
+class IncrementalRun:
+    """
+    One sort of a Drive folder against its manifest. images() yields only
+    files that are new or whose content changed since they were placed:
+    after a complete run that is just what the changes API reports since
+    then, otherwise the folder listing minus what the manifest knows.
+    record() notes each placed file; finish() saves the page token only if
+    nothing failed, so a failed file is offered again next time.
+    """
+
+    FLUSH_EVERY = 200
+
+    def __init__(self, manifest, service, folder_id, key, recursive=False, fields="id, name"):
+        self.manifest = manifest
+        self.service = service
+        self.folder_id = folder_id
+        self.key = key
+        self.recursive = recursive
+        wanted = [f.strip() for f in fields.split(',')]
+        self.fields = ", ".join(wanted + [f for f in ('md5Checksum', 'modifiedTime') if f not in wanted])
+        self.skipped = 0
+        self.failed = False
+        self.folders = set()
+        self._new_token = None
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    def images(self):
+        page_token, folders = self.manifest.last_run(self.key)
+        if page_token:
+            try:
+                changes, self._new_token = list_changes(self.service, page_token, self.fields)
+            except HttpError as e:
+                # An expired or invalid token: fall back to a full listing
+                if e.resp.status not in (400, 404, 410):
+                    raise
+            else:
+                yield from self._unplaced(self._changed_images(changes, folders))
+                return
+
+        # Taken before listing, so anything changing during this run shows up next time
+        self._new_token = get_start_page_token(self.service)
+        yield from self._unplaced(iter_folder_images(
+            self.service, self.folder_id, self.recursive, self.fields, visited=self.folders))
+
+    def _changed_images(self, changes, folders):
+        self.folders = (folders | {self.folder_id}) if self.recursive else {self.folder_id}
+        gone = [c['fileId'] for c in changes if c.get('removed') or c.get('file', {}).get('trashed')]
+        self.manifest.forget_many(self.key, gone)
+        live = [c['file'] for c in changes if not c.get('removed') and not c['file'].get('trashed')]
+
+        new_folders = []
+        if self.recursive:
+            self.folders -= set(gone)
+            # Repeat until stable: a new folder may sit inside another new one
+            added = True
+            while added:
+                added = False
+                for f in live:
+                    if (f['mimeType'] == FOLDER_MIME_TYPE and f['id'] not in self.folders
+                            and self.folders.intersection(f.get('parents', []))):
+                        self.folders.add(f['id'])
+                        new_folders.append(f['id'])
+                        added = True
+
+        for f in live:
+            if f['mimeType'] in IMAGE_MIME_TYPES and self.folders.intersection(f.get('parents', [])):
+                yield f
+        # A folder moved in brings files that have no change entries of their own
+        for folder_id in new_folders:
+            yield from iter_folder_images(self.service, folder_id, True, self.fields, visited=self.folders)
+
+    def _unplaced(self, images, chunk=500):
+        batch, seen = [], set()
+        for image in images:
+            if image['id'] in seen:
+                continue
+            seen.add(image['id'])
+            batch.append(image)
+            if len(batch) >= chunk:
+                yield from self._filter(batch)
+                batch = []
+        yield from self._filter(batch)
+
+    def _filter(self, images):
+        known = self.manifest.known(self.key, [i['id'] for i in images])
+        for image in images:
+            if _unchanged(known.get(image['id']), image):
+                self.skipped += 1
+                continue
+            yield image
+
+    def record(self, image, category):
+        with self._pending_lock:
+            self._pending.append((image['id'], image.get('md5Checksum'), image.get('modifiedTime'), category))
+            if len(self._pending) < self.FLUSH_EVERY:
+                return
+            rows, self._pending = self._pending, []
+        self.manifest.record_many(self.key, rows)
+
+    def finish(self, complete):
+        """Writes outstanding records; advances the page token only for a complete run."""
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+        self.manifest.record_many(self.key, rows)
+        if complete and not self.failed and self._new_token:
+            self.manifest.save_run(self.key, self._new_token, self.folders)
+
+
+folder_manifest = FolderManifest(Config.MANIFEST_PATH) if Config.DRIVE_INCREMENTAL else None
@@ -1,13 +1,11 @@
 import os
-import io
-import shutil
+from contextlib import contextmanager
 from flask import Blueprint, redirect, request, url_for, session, jsonify
 from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
 from config import Config
-from model_loader import get_image_tags
+from drive_clients import drive_clients
+from drive_service import credentials_to_dict, iter_files
+from tasks import credentials_ref, enqueue_job, remember_job, job_response
 
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 gdrive_blueprint = Blueprint('gdrive', __name__)
@@ -30,68 +28,23 @@ client_config = {
 }
 
 # ----------------------------------------------------------
-# Helper: Convert credentials to dict (FULL version)
+# Helper: Drive client for a session account
 # ----------------------------------------------------------
-def credentials_to_dict(creds):
-    return {
-        'token': creds.token,
-        'refresh_token': creds.refresh_token,
-        'token_uri': creds.token_uri,
-        'client_id': creds.client_id,
-        'client_secret': creds.client_secret,
-        'scopes': creds.scopes
-    }
-
-# ----------------------------------------------------------
-# Helper: Ensure or Create Output Folder in Drive
-# ----------------------------------------------------------
-def get_or_create_output_folder(service_destination):
-    """Ensures 'Output' folder exists in root of destination drive."""
-    output_folder_name = 'Output'
-    try:
-        results = service_destination.files().list(
-            q=f"name='{output_folder_name}' and mimeType='application/vnd.google-apps.folder' and 'root' in parents and trashed=false",
-            spaces='drive',
-            fields='files(id)'
-        ).execute()
-        items = results.get('files', [])
-        if items:
-            return items[0]['id']
-        folder_metadata = {'name': output_folder_name, 'mimeType': 'application/vnd.google-apps.folder'}
-        folder = service_destination.files().create(body=folder_metadata, fields='id').execute()
-        return folder.get('id')
-    except Exception as e:
-        print(f"[ERROR] Failed to get/create Output folder: {e}")
-        raise
-
-# ----------------------------------------------------------
-# Helper: Upload File to Drive
-# ----------------------------------------------------------
-def upload_file_to_gdrive(service, file_path, folder_name, parent_id):
-    """Uploads file into a folder (category) inside parent_id (Output folder)."""
+@contextmanager
+def session_drive_service(key='credentials'):
+    """
+    A pooled Drive client (see drive_clients.py) for the account in
+    session[key]. A token refreshed while it was in use is saved back to
+    the session, so the next request starts with a valid one.
+    """
+    creds_data = session[key]
     try:
-        query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and '{parent_id}' in parents and trashed=false"
-        results = service.files().list(q=query, fields="files(id)").execute()
-        items = results.get('files', [])
-
-        if not items:
-            folder_metadata = {
-                'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [parent_id]
-            }
-            folder = service.files().create(body=folder_metadata, fields='id').execute()
-            folder_id = folder.get('id')
-        else:
-            folder_id = items[0]['id']
-
-        file_metadata = {'name': os.path.basename(file_path), 'parents': [folder_id]}
-        media = MediaFileUpload(file_path, mimetype='image/jpeg')
-        service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-
-    except Exception as e:
-        print(f"[ERROR] Upload failed for {file_path}: {e}")
-        raise
+        with drive_clients.client(creds_data) as service:
+            yield service
+    finally:
+        refreshed = drive_clients.refreshed(creds_data)
+        if refreshed:
+            session[key] = refreshed
 
 # ----------------------------------------------------------
 # Google Drive Auth Routes
@@ -156,10 +109,21 @@ def gdrive_callback_destination():
     return redirect(f"{Config.FRONTEND_URL}/dashboard")
 #  # changed
 
+@gdrive_blueprint.route('/logout')
+def gdrive_logout():
+    """Clears source credentials."""
+    creds_data = session.pop('credentials', None)
+    if creds_data:
+        drive_clients.evict(creds_data)
+    return redirect(f"{Config.FRONTEND_URL}/dashboard")
+
+
 @gdrive_blueprint.route('/logout-destination')
 def gdrive_logout_destination():
     """Clears destination credentials."""
-    session.pop('destination_credentials', None)
+    creds_data = session.pop('destination_credentials', None)
+    if creds_data:
+        drive_clients.evict(creds_data)
     return redirect(f"{Config.FRONTEND_URL}/dashboard")
 
 
@@ -179,14 +143,11 @@ def gdrive_status():
 def list_gdrive_files():
     if 'credentials' not in session:
         return jsonify({"error": "User not authenticated"}), 401
-    creds = Credentials(**session['credentials'])
-    service = build('drive', 'v3', credentials=creds)
-    results = service.files().list(
-        q="mimeType='application/vnd.google-apps.folder' and 'root' in parents",
-        pageSize=20,
-        fields="files(id, name)"
-    ).execute()
-    return jsonify(results.get('files', []))
+    with session_drive_service() as service:
+        folders = list(iter_files(
+            service, "mimeType='application/vnd.google-apps.folder' and 'root' in parents and trashed=false",
+        ))
+    return jsonify(folders)
 
 
 @gdrive_blueprint.route('/process-folder/<folder_id>', methods=['POST'])
@@ -195,57 +156,25 @@ def process_gdrive_folder(folder_id):
         return jsonify({"error": "User not authenticated"}), 401
 
     destination = request.json.get('destination', 'local')
+    recursive = bool(request.json.get('recursive', False))
+    incremental = bool(request.json.get('incremental', True))  # false: re-sort files already placed
+    placement = request.json.get('placement')  # gdrive-source only: 'copy' or 'move'
+    if destination not in ('local', 'gdrive-source', 'gdrive-destination'):
+        return jsonify({"error": "destination must be 'local', 'gdrive-source' or 'gdrive-destination'"}), 400
     if destination == 'gdrive-destination' and 'destination_credentials' not in session:
         return jsonify({"error": "Destination Google Drive not connected"}), 401
+    if placement not in (None, 'copy', 'move'):
+        return jsonify({"error": "placement must be 'copy' or 'move'"}), 400
 
     try:
-        creds_source = Credentials(**session['credentials'])
-        service_source = build('drive', 'v3', credentials=creds_source)
-
-        service_destination, output_parent_id = None, None
-        if destination == 'gdrive-source':
-            service_destination = service_source
-            output_parent_id = get_or_create_output_folder(service_destination)
-        elif destination == 'gdrive-destination':
-            creds_dest = Credentials(**session['destination_credentials'])
-            service_destination = build('drive', 'v3', credentials=creds_dest)
-            output_parent_id = get_or_create_output_folder(service_destination)
-
-        query = f"'{folder_id}' in parents and (mimeType='image/jpeg' or mimeType='image/png')"
-        images = service_source.files().list(q=query, fields="files(id, name)").execute().get('files', [])
-        if not images:
-            return jsonify({"message": "No images found.", "results": {}})
-
-        UPLOAD_FOLDER, OUTPUT_FOLDER = 'temp_uploads', 'sorted_output'
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        results = {}
-
-        for image in images:
-            image_name, image_id = image['name'], image['id']
-            temp_path = os.path.join(UPLOAD_FOLDER, image_name)
-
-            request_file = service_source.files().get_media(fileId=image_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request_file)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
-            with open(temp_path, 'wb') as f:
-                f.write(fh.getvalue())
-
-            tags = get_image_tags(temp_path)
-            category = tags[0]["name"] if tags and tags[0]["name"] != "Error" else "Uncategorized"
-
-            if destination == 'local':
-                os.makedirs(os.path.join(OUTPUT_FOLDER, category), exist_ok=True)
-                shutil.move(temp_path, os.path.join(OUTPUT_FOLDER, category, image_name))
-            else:
-                upload_file_to_gdrive(service_destination, temp_path, category, output_parent_id)
-                os.remove(temp_path)
-
-            results[image_name] = tags
-
-        return jsonify({"message": "Processing complete!", "results": results})
+        destination_ref = credentials_ref('destination_credentials') if 'destination_credentials' in session else None
+        job_id = enqueue_job(
+            {'type': 'gdrive', 'folder_id': folder_id, 'recursive': recursive, 'incremental': incremental,
+             'credentials': credentials_ref('credentials')},
+            {'type': destination, 'credentials': destination_ref, 'placement': placement},
+        )
+        remember_job(job_id)
+        return job_response(job_id)
 
     except Exception as e:
         print(f"[ERROR] Failed to process folder: {e}")
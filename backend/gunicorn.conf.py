@@ -0,0 +1,22 @@
+# gunicorn.conf.py — used by render.yaml: gunicorn -c gunicorn.conf.py app:app
+import os
+
+# With PRELOAD_MODEL=1 the app (and the YOLO weights, see app.py) is
+# imported once in the master; forked workers share those pages copy-on-write
+# instead of each loading their own copy.
+preload_app = os.environ.get("PRELOAD_MODEL", "0") == "1"
+
+
+def post_fork(server, worker):
+    # torch thread pools (and inference pool processes) must start after the
+    # fork, so each worker warms up its own rather than inheriting the master's
+    if preload_app:
+        from inference_pool import warm_up
+        warm_up()
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR set, a dead worker's live gauges
+    # (queue depths) must stop counting towards /metrics
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
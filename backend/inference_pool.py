@@ -0,0 +1,255 @@
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+
+import model_loader
+from config import Config
+from metrics import queue_depth
+
+# ----------------------------------------------------------
+# Multi-process inference
+# ----------------------------------------------------------
+# With INFERENCE_WORKERS > 0, get_image_tags_batch hands batches to K
+# worker processes, each holding one model with its torch/onnxruntime
+# threads pinned to cores // K. Pixels are never pickled: files go over as
+# paths and in-memory uploads/downloads as their encoded bytes in one
+# shared-memory block per batch; workers decode them themselves.
+
+
+def _pin_threads(threads):
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    if Config.INFERENCE_BACKEND == 'onnx':
+        Config.ONNX_INTRA_OP_THREADS = Config.ONNX_INTRA_OP_THREADS or threads
+        Config.ONNX_INTER_OP_THREADS = 0
+    else:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+
+
+def _init_worker(threads):
+    _pin_threads(threads)
+    model_loader.warm_up()
+
+
+def _attach(name):
+    # Python 3.13+ can skip registering with the resource tracker; older
+    # versions register, which is harmless here since the parent unlinks
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _tag_in_worker(items, shm_name, batch_size):
+    """Runs in a pool process. items: ('path', path) or ('shm', offset, size)."""
+    block = _attach(shm_name) if shm_name else None
+    try:
+        sources = [
+            item[1] if item[0] == 'path' else bytes(block.buf[item[1]:item[1] + item[2]])
+            for item in items
+        ]
+    finally:
+        if block is not None:
+            block.close()
+    return model_loader.get_image_tags_batch(sources, batch_size=batch_size)
+
+
+def _status_in_worker():
+    return model_loader.model_status()
+
+
+def _encoded_bytes(source):
+    """The encoded image bytes of an in-memory source, or None for decoded pixels."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, 'getbuffer'):
+        return source.getbuffer()
+    if hasattr(source, 'read'):
+        start = source.tell() if hasattr(source, 'tell') else 0
+        data = source.read()
+        source.seek(start)
+        return data
+    return None
+
+
+class InferencePool:
+    """K model-holding worker processes fed with paths and shared memory."""
+
+    def __init__(self, workers, threads_per_worker=None):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self._executor = self._start_executor()
+        self._executor_lock = threading.Lock()
+        # Kept here so /health never queues behind running batches
+        self._status = {
+            'state': 'loading', 'backend': Config.INFERENCE_BACKEND, 'error': None,
+            'workers': workers, 'threads_per_worker': self.threads_per_worker,
+        }
+
+    def _start_executor(self):
+        # spawn, not fork: torch's thread pools do not survive a fork
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=get_context('spawn'),
+            initializer=_init_worker, initargs=(self.threads_per_worker,),
+        )
+
+    def _restart(self, broken):
+        """Replaces the executor after a worker died, unless another caller already has."""
+        with self._executor_lock:
+            if self._executor is broken:
+                print("Inference worker died; restarting the inference pool")
+                broken.shutdown(wait=False)
+                self._executor = self._start_executor()
+
+    def _submit(self, executor, chunk, batch_size):
+        items, blobs, offset = [], [], 0
+        for source in chunk:
+            if isinstance(source, (str, os.PathLike)):
+                items.append(('path', os.fspath(source)))
+                continue
+            data = _encoded_bytes(source)
+            if data is None:
+                return None
+            items.append(('shm', offset, len(data)))
+            blobs.append(data)
+            offset += len(data)
+
+        block = None
+        if offset:
+            block = shared_memory.SharedMemory(create=True, size=offset)
+            pos = 0
+            for data in blobs:
+                block.buf[pos:pos + len(data)] = data
+                pos += len(data)
+        try:
+            future = executor.submit(_tag_in_worker, items, block.name if block else None, batch_size)
+        except BaseException:
+            if block is not None:
+                block.close()
+                block.unlink()
+            raise
+        return future, block
+
+    def tag(self, sources, batch_size=model_loader.DEFAULT_BATCH_SIZE):
+        """
+        Same contract as model_loader.get_image_tags_batch. Chunks of
+        batch_size run on different workers at once; chunks holding decoded
+        images (PIL/NumPy) run in this process instead. If a worker dies (OOM
+        kill, segfault) the pool is restarted and the batch retried once.
+        """
+        sources = list(sources)
+        batch_size = max(1, int(batch_size))
+        executor = self._executor
+        try:
+            return self._tag(executor, sources, batch_size)
+        except BrokenProcessPool:
+            self._restart(executor)
+            return self._tag(self._executor, sources, batch_size)
+
+    def _tag(self, executor, sources, batch_size):
+        pending, queued = [], 0
+        all_tags = []
+        try:
+            for start in range(0, len(sources), batch_size):
+                chunk = sources[start:start + batch_size]
+                submitted = self._submit(executor, chunk, batch_size)
+                pending.append((chunk, submitted))
+                if submitted is not None:
+                    queue_depth.labels('inference').inc(len(chunk))
+                    queued += len(chunk)
+
+            for chunk, submitted in pending:
+                if submitted is None:
+                    all_tags.extend(model_loader.get_image_tags_batch(chunk, batch_size=batch_size))
+                    continue
+                try:
+                    all_tags.extend(submitted[0].result())
+                    self._status['state'] = 'ready'
+                except Exception as e:
+                    self._status.update(state='failed', error=str(e))
+                    raise
+        finally:
+            queue_depth.labels('inference').dec(queued)
+            for _, submitted in pending:
+                if submitted is not None and submitted[1] is not None:
+                    submitted[1].close()
+                    submitted[1].unlink()
+        return all_tags
+
+    def start(self):
+        """Waits until a worker has loaded its model; returns its model_status()."""
+        try:
+            worker_status = self._executor.submit(_status_in_worker).result()
+        except Exception as e:
+            self._status.update(state='failed', error=str(e))
+            raise
+        self._status.update(state=worker_status['state'], error=worker_status['error'])
+        return worker_status
+
+    def status(self):
+        return dict(self._status)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def inference_workers():
+    """
+    INFERENCE_WORKERS as a number: 'auto' shares the cores between the
+    WEB_CONCURRENCY serving processes that each start a pool, 0 means no pool.
+    """
+    value = Config.INFERENCE_WORKERS
+    if value == 'auto':
+        return max(1, (os.cpu_count() or 1) // max(1, Config.WEB_CONCURRENCY))
+    return int(value)
+
+
+def get_pool():
+    """The process-wide InferencePool, started on first use; None when disabled."""
+    global _pool
+    if _pool is None and inference_workers() > 0:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool(inference_workers(), Config.INFERENCE_THREADS or None)
+    return _pool
+
+
+def get_image_tags_batch(images, batch_size=model_loader.DEFAULT_BATCH_SIZE):
+    """Tags images on the inference pool if one is configured, else in this process."""
+    pool = get_pool()
+    if pool is None:
+        return model_loader.get_image_tags_batch(images, batch_size=batch_size)
+    return pool.tag(images, batch_size=batch_size)
+
+
+def load_model():
+    """Starts the pool and waits for a worker's model, or loads the model in this process."""
+    pool = get_pool()
+    if pool is None:
+        return model_loader.load_model()
+    return pool.start()['state'] == 'ready'
+
+
+def warm_up():
+    """Startup hook for a serving process: starts the pool, or warms the in-process model."""
+    if inference_workers() > 0:
+        return load_model()
+    return model_loader.warm_up()
+
+
+def model_status():
+    """model_status() of whichever processes run inference."""
+    if inference_workers() == 0:
+        return model_loader.model_status()
+    if _pool is None:
+        return {'state': 'not_loaded', 'backend': Config.INFERENCE_BACKEND, 'error': None,
+                'workers': inference_workers()}
+    return _pool.status()
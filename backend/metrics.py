@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+# Every process (gunicorn and Celery workers, inference pool processes)
+# keeps its own samples. With PROMETHEUS_MULTIPROC_DIR set to an empty
+# directory shared by all of them, each writes its samples there and
+# /metrics reports the sum; without it /metrics only sees the web process
+# (which is everything when jobs run on the local thread pool).
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+stage_seconds = Histogram(
+    'pixclad_stage_seconds', 'Time spent in each pipeline stage', ['stage'], buckets=STAGE_BUCKETS,
+)
+images_total = Counter('pixclad_images', 'Images sorted, by where their tags came from', ['source'])
+drive_bytes_total = Counter('pixclad_drive_bytes', 'Image bytes moved to and from Drive', ['kind'])
+drive_calls_total = Counter('pixclad_drive_api_calls', 'Drive API requests', ['call'])
+cache_lookups_total = Counter('pixclad_result_cache_lookups', 'Result cache lookups', ['result'])
+jobs_total = Counter('pixclad_jobs', 'Finished jobs', ['source', 'outcome'])
+queue_depth = Gauge(
+    'pixclad_queue_depth', 'Items waiting in a worker pool', ['queue'], multiprocess_mode='livesum',
+)
+model_load_seconds = Gauge('pixclad_model_load_seconds', 'Duration of the last model load', multiprocess_mode='max')
+
+
+class JobTimings:
+    """
+    Per-stage totals (seconds, count) for one job, reported in its result
+    next to the process-wide histograms. Safe to add to from the job's
+    download and upload threads.
+    """
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, count=1):
+        with self._lock:
+            total = self._totals.setdefault(stage, [0.0, 0])
+            total[0] += seconds
+            total[1] += count
+
+    def as_dict(self):
+        with self._lock:
+            return {stage: {'seconds': round(s, 3), 'count': n} for stage, (s, n) in self._totals.items()}
+
+
+@contextmanager
+def timed(stage, timings=None):
+    """Observes the block's duration in stage_seconds (and in `timings`, a JobTimings)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.labels(stage).observe(elapsed)
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def render():
+    """(body, content type) of the Prometheus text exposition for /metrics."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drops a finished process's live gauges (gunicorn child_exit)."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
@@ -1,62 +1,286 @@
-from ultralytics import YOLO
+import hashlib
+import io
 import os
+import threading
+import time
+
+import numpy as np
 from PIL import Image
 
+from config import Config
+from metrics import model_load_seconds, timed
+from sorting_rules import sorting_rules
+
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models', 'yolo11n.pt')
+ONNX_MODEL_PATH = Config.ONNX_MODEL_PATH or os.path.join(
+    os.path.dirname(__file__), 'models', 'yolo11n.int8.onnx' if Config.ONNX_INT8 else 'yolo11n.onnx')
+# Lowest confidence any sorting rule needs; tags below it are never used
+CONFIDENCE = sorting_rules.min_confidence
+DEFAULT_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", 16))
+# Files are decoded straight to about the model's input size (longest side,
+# pixels); YOLO would shrink them to 640 anyway. 0 decodes at full size.
+DECODE_SIZE = int(os.environ.get("INFERENCE_DECODE_SIZE", 640))
 
-try:
-    model = YOLO(MODEL_PATH)
-    print("YOLO model loaded successfully.")
-except Exception as e:
-    print(f"FATAL: Could not load YOLO model. Error: {e}")
-    model = None
+# The ultralytics predictor keeps per-call state, so jobs running on
+# different threads take turns on the model
+_predict_lock = threading.Lock()
 
-def get_image_tags(image_path):
-    if model is None:
-        return ["Error: Model not loaded"]
-    try:
-        img = Image.open(image_path)
-        img.convert('RGB').save(image_path, 'jpeg')
-        results = model.predict(image_path, stream = True, conf = 0.65)
-        names = model.names
-        # Map class name -> highest confidence seen
-        detected= {}
-        for r in results:
-            obbs = getattr(r, 'obb', None)
-            if obbs is None:
-                obbs = getattr(r, 'boxes', None)
-            if not obbs:
-                continue
-            for obb in obbs:
+# ----------------------------------------------------------
+# Inference backends
+# ----------------------------------------------------------
+# INFERENCE_BACKEND picks the engine: 'torch' (ultralytics/PyTorch, the
+# default) or 'onnx' (onnxruntime on the exported model, optionally INT8).
+# Both expose .names, .weights_path and predict_tags(images, conf).
+class TorchBackend:
+    name = 'torch'
+
+    def __init__(self, pt_path):
+        from ultralytics import YOLO
+        self.model = YOLO(pt_path)
+        self.names = self.model.names
+        self.name_table = class_name_table(self.names)
+        self.weights_path = pt_path
+
+    def predict_tags(self, images, conf):
+        results = self.model.predict(images, conf=conf, batch=len(images), verbose=False)
+        return tags_from_results(results, self.name_table)
+
+
+def _create_backend():
+    if Config.INFERENCE_BACKEND == 'onnx':
+        from onnx_backend import OnnxBackend
+        return OnnxBackend(
+            ONNX_MODEL_PATH, pt_path=MODEL_PATH, int8=Config.ONNX_INT8,
+            intra_op_threads=Config.ONNX_INTRA_OP_THREADS, inter_op_threads=Config.ONNX_INTER_OP_THREADS,
+        )
+    return TorchBackend(MODEL_PATH)
+
+
+# ----------------------------------------------------------
+# Lazy model singleton
+# ----------------------------------------------------------
+# Importing this module does not pull in ultralytics/torch; the model is
+# loaded on first use (or up front via load_model/warm_up), so routes that
+# never run inference start serving immediately.
+_backend = None
+_model_lock = threading.Lock()
+_status = {'state': 'not_loaded', 'backend': Config.INFERENCE_BACKEND, 'load_seconds': None, 'warm': False, 'error': None}
+
+
+def get_backend():
+    """Returns the configured inference backend, loading it once; None if loading failed."""
+    global _backend
+    if _backend is None and _status['state'] != 'failed':
+        with _model_lock:
+            if _backend is None and _status['state'] != 'failed':
+                _status['state'] = 'loading'
+                start = time.perf_counter()
                 try:
-                    # different result types expose class/conf differently; handle common shapes
-                    if hasattr(obb, 'cls'):
-                        cls_val = obb.cls
-                        cls_id = int(cls_val[0]) if hasattr(cls_val, '__len__') else int(cls_val)
-                    elif hasattr(obb, 'cls_id'):
-                        cls_id = int(obb.cls_id)
-                    else:
-                        continue
-                    if hasattr(obb, 'conf'):
-                        conf_val = obb.conf
-                        conf = float(conf_val[0]) if hasattr(conf_val, '__len__') else float(conf_val)
-                    elif hasattr(obb, 'confidence'):
-                        conf = float(obb.confidence)
-                    else:
-                        conf = 0.0
-                except Exception:
-                    continue
-                # Resolve class name from model.names which may be dict or list
-                if isinstance(names, dict):
-                    class_name = names.get(cls_id, str(cls_id))
-                else:
-                    class_name = names[cls_id]
-                prev_conf = detected.get(class_name, 0.0)
-                if conf > prev_conf:
-                    detected[class_name] = conf
-        # Return list of {name, confidence}
-        return [{"name": k, "conf": round(float(v), 2)} for k, v in detected.items()]
-    
-    except Exception as e:
-        print(f"Error processing image with YOLO model: {e}")
-        return ["Error"]
\ No newline at end of file
+                    _backend = _create_backend()
+                    _status.update(state='ready', load_seconds=round(time.perf_counter() - start, 3))
+                    model_load_seconds.set(_status['load_seconds'])
+                    print(f"YOLO model loaded successfully ({_backend.name}).")
+                except Exception as e:
+                    _status.update(state='failed', error=str(e))
+                    print(f"FATAL: Could not load YOLO model. Error: {e}")
+    return _backend
+
+
+def load_model():
+    """Loads the weights now. Call before forking workers so they share them copy-on-write."""
+    return get_backend() is not None
+
+
+def warm_up():
+    """Loads the model and runs one dummy inference so the first request doesn't pay for it."""
+    backend = get_backend()
+    if backend is None:
+        return False
+    with _predict_lock:
+        backend.predict_tags([Image.new('RGB', (640, 640))], CONFIDENCE)
+    _status['warm'] = True
+    return True
+
+
+def model_status():
+    """{'state': not_loaded|loading|ready|failed, 'backend', 'load_seconds', 'warm', 'error'}"""
+    return dict(_status)
+
+
+_model_fingerprint = None
+
+
+def model_fingerprint():
+    """
+    Short hash of the weights file, backend, threshold and decode size, for
+    cache keys. The ONNX backend hashes its .onnx file (the .pt until that
+    has been exported).
+    """
+    global _model_fingerprint
+    if _model_fingerprint is None:
+        weights = MODEL_PATH
+        if Config.INFERENCE_BACKEND == 'onnx' and os.path.exists(ONNX_MODEL_PATH):
+            weights = ONNX_MODEL_PATH
+        digest = hashlib.sha256()
+        try:
+            with open(weights, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        except OSError:
+            digest.update(weights.encode())
+        engine = Config.INFERENCE_BACKEND + ('-int8' if Config.INFERENCE_BACKEND == 'onnx' and Config.ONNX_INT8 else '')
+        _model_fingerprint = f"{digest.hexdigest()[:16]}:{engine}@{CONFIDENCE}/{DECODE_SIZE}"
+    return _model_fingerprint
+
+
+def _decode(img, max_size):
+    """
+    Decodes an opened image to RGB, no larger than max_size on its longest
+    side. JPEGs are scaled in the DCT domain while decoding (draft), other
+    formats are shrunk by an integer factor (reduce) before the final resize,
+    so a 48 MP photo never exists in memory at full resolution.
+    """
+    if max_size and max(img.size) > max_size:
+        img.draft('RGB', (max_size, max_size))
+        img.thumbnail((max_size, max_size), Image.BILINEAR, reducing_gap=2.0)
+    return img.convert('RGB')
+
+
+def _load_image(source, max_size=None):
+    """
+    Decodes `source` in memory into an RGB image YOLO can stack into a batch.
+
+    Accepts a path, raw bytes, a file-like object (Flask FileStorage, BytesIO
+    from a Drive download), a PIL image or a NumPy array. Encoded sources
+    are decoded at no more than `max_size` (default DECODE_SIZE). Nothing is
+    written back: file-like sources are rewound so the caller can still hand
+    the original bytes on to the output stage.
+    """
+    if max_size is None:
+        max_size = DECODE_SIZE
+    if isinstance(source, Image.Image):
+        return source.convert('RGB') if source.mode != 'RGB' else source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    if isinstance(source, (str, os.PathLike)):
+        with Image.open(source) as img:
+            return _decode(img, max_size)
+    if hasattr(source, 'read'):
+        start = source.tell() if hasattr(source, 'tell') else 0
+        try:
+            with Image.open(source) as img:
+                return _decode(img, max_size)
+        finally:
+            source.seek(start)
+    # NumPy arrays are passed straight through (YOLO expects HWC, BGR)
+    return source
+
+
+def class_name_table(names):
+    """model.names (dict or list) as an object array indexable by class id."""
+    if isinstance(names, dict):
+        return np.array([names.get(i, str(i)) for i in range(max(names, default=-1) + 1)], dtype=object)
+    return np.array(list(names), dtype=object)
+
+
+def _as_numpy(values):
+    if hasattr(values, 'cpu'):
+        values = values.cpu().numpy()
+    return np.asarray(values).reshape(-1)
+
+
+def tags_from_results(results, name_table):
+    """
+    Tag lists (class name -> highest confidence, best first) for a batch of
+    YOLO results, computed on whole arrays: the cls/conf tensors of every
+    result are pulled out once, concatenated, and max-reduced per
+    (image, class) in a single scatter (tags_from_detections).
+    """
+    owners, classes, confs = [], [], []
+    for i, r in enumerate(results):
+        boxes = getattr(r, 'obb', None)
+        if boxes is None:
+            boxes = getattr(r, 'boxes', None)
+        if boxes is None or len(boxes) == 0:
+            continue
+        cls = _as_numpy(boxes.cls).astype(np.int64)
+        owners.append(np.full(len(cls), i, dtype=np.int64))
+        classes.append(cls)
+        confs.append(_as_numpy(boxes.conf).astype(np.float64))
+    if not owners:
+        return [[] for _ in results]
+    return tags_from_detections(len(results), np.concatenate(owners), np.concatenate(classes),
+                                np.concatenate(confs), name_table)
+
+
+def tags_from_detections(count, owner, cls, conf, name_table):
+    """
+    Tag lists for `count` images from flat detection arrays: detection k
+    belongs to image owner[k] and is class cls[k] with confidence conf[k].
+    """
+    all_tags = [[] for _ in range(count)]
+    if not len(owner):
+        return all_tags
+
+    # Grouped max: one row per image, one column per class
+    num_classes = max(len(name_table), int(cls.max()) + 1)
+    if num_classes > len(name_table):
+        extra = [str(c) for c in range(len(name_table), num_classes)]
+        name_table = np.concatenate([name_table, np.array(extra, dtype=object)])
+    best = np.full((count, num_classes), -1.0)
+    np.maximum.at(best, (owner, cls), conf)
+
+    for i in np.unique(owner).tolist():
+        scores = best[i]
+        class_ids = np.flatnonzero(scores >= 0)
+        class_ids = class_ids[np.argsort(-scores[class_ids], kind='stable')]  # best first
+        all_tags[i] = [
+            {"name": name, "conf": c}  # exact: rules compare it; jobs report it rounded
+            for name, c in zip(name_table[class_ids].tolist(), scores[class_ids].tolist())
+        ]
+    return all_tags
+
+
+def get_image_tags_batch(images, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Runs YOLO over many images, `batch_size` images per forward pass.
+
+    Accepts anything _load_image does and returns one tag list per
+    input, in input order, in the same format as get_image_tags.
+    """
+    images = list(images)
+    backend = get_backend()
+    if backend is None:
+        return [["Error: Model not loaded"] for _ in images]
+
+    batch_size = max(1, int(batch_size))
+    all_tags = []
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+
+        # Decode the chunk; a file that fails to open only fails its own slot
+        loaded, slots = [], []
+        chunk_tags = [["Error"] for _ in chunk]
+        for i, source in enumerate(chunk):
+            try:
+                with timed('decode'):
+                    loaded.append(_load_image(source))
+                slots.append(i)
+            except Exception as e:
+                print(f"Error loading image for YOLO model: {e}")
+
+        if loaded:
+            try:
+                with _predict_lock, timed('inference'):
+                    predicted = backend.predict_tags(loaded, CONFIDENCE)
+                for i, tags in zip(slots, predicted):
+                    chunk_tags[i] = tags
+            except Exception as e:
+                print(f"Error processing image with YOLO model: {e}")
+
+        all_tags.extend(chunk_tags)
+    return all_tags
+
+
+def get_image_tags(image_path):
+    return get_image_tags_batch([image_path], batch_size=1)[0]
@@ -0,0 +1,102 @@
+import ast
+import os
+
+import numpy as np
+from PIL import Image
+
+from model_loader import class_name_table, tags_from_detections
+
+INPUT_SIZE = 640
+PAD_VALUE = 114  # Same grey ultralytics pads letterboxed images with
+
+
+def export_onnx(pt_path, onnx_path, int8=False):
+    """
+    Exports the ultralytics .pt weights to ONNX (dynamic batch) next to
+    onnx_path, optionally followed by dynamic INT8 weight quantization.
+    Needs ultralytics + onnx; only runs when the .onnx file is missing.
+    """
+    from ultralytics import YOLO
+    exported = YOLO(pt_path).export(format='onnx', imgsz=INPUT_SIZE, dynamic=True, simplify=True)
+    fp32_path = onnx_path.replace('.int8.onnx', '.onnx')
+    if os.path.abspath(exported) != os.path.abspath(fp32_path):
+        os.replace(exported, fp32_path)
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, onnx_path, weight_type=QuantType.QUInt8)
+    return onnx_path
+
+
+def letterbox(img, size=INPUT_SIZE):
+    """
+    Resizes an RGB PIL image, or a NumPy array as YOLO takes them (HWC,
+    BGR), to fit size x size, keeping aspect, padded grey.
+    """
+    if isinstance(img, np.ndarray):
+        if img.ndim == 2:
+            img = Image.fromarray(img).convert('RGB')
+        else:
+            img = Image.fromarray(np.ascontiguousarray(img[..., 2::-1]))  # BGR(A) -> RGB
+    w, h = img.size
+    scale = min(size / w, size / h)
+    new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+    if (new_w, new_h) != (w, h):
+        img = img.resize((new_w, new_h), Image.BILINEAR)
+    canvas = np.full((size, size, 3), PAD_VALUE, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = np.asarray(img)
+    return canvas
+
+
+def tags_from_output(output, conf, name_table):
+    """
+    Tag lists from the raw detection output, (N, 4 + classes, anchors): box,
+    then per-class scores. As in ultralytics' non_max_suppression, each
+    anchor is one detection of its best-scoring class, kept if that score
+    is above conf. Tags only need the best confidence per class, and NMS
+    never drops the top-scoring box of a class, so NMS itself is skipped.
+    """
+    scores = output[:, 4:, :]
+    cls = scores.argmax(axis=1)  # (N, anchors)
+    best = np.take_along_axis(scores, cls[:, None, :], axis=1)[:, 0, :]
+    owner, anchor = np.nonzero(best > conf)
+    return tags_from_detections(len(output), owner, cls[owner, anchor], best[owner, anchor].astype(np.float64),
+                                name_table)
+
+
+class OnnxBackend:
+    """Runs an exported YOLO detection model with onnxruntime on CPU."""
+
+    name = 'onnx'
+
+    def __init__(self, onnx_path, pt_path=None, int8=False, intra_op_threads=0, inter_op_threads=0):
+        import onnxruntime as ort
+
+        if not os.path.exists(onnx_path):
+            if not pt_path:
+                raise FileNotFoundError(onnx_path)
+            print(f"Exporting {pt_path} to {onnx_path} ...")
+            export_onnx(pt_path, onnx_path, int8=int8)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.weights_path = onnx_path
+
+        # ultralytics stores the class names in the model metadata
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(meta['names']) if 'names' in meta else {}
+        self.name_table = class_name_table(self.names)
+
+    def predict_tags(self, images, conf):
+        """images: RGB PIL images (or HWC BGR arrays). Returns one tag list per image."""
+        batch = np.stack([letterbox(img) for img in images]).transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+        output = self.session.run(None, {self.input_name: batch})[0]
+        return tags_from_output(output, conf, self.name_table)
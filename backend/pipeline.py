@@ -0,0 +1,701 @@
+import hashlib
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from config import Config
+from inference_pool import get_image_tags_batch
+from model_loader import model_fingerprint, DECODE_SIZE, DEFAULT_BATCH_SIZE
+from drive_service import (
+    account_key, copy_file_to_folder, download_file, download_head, download_thumbnail,
+    folder_cache_for_job, get_or_create_output_folder, iter_folder_images, move_file_to_folder,
+    progressive_jpeg_preview, upload_file_to_gdrive,
+)
+from dedup import DUPLICATES_CATEGORY, duplicate_index
+from drive_clients import drive_clients
+from folder_manifest import IncrementalRun, folder_manifest, run_key
+from metrics import JobTimings, images_total, queue_depth, timed
+from result_cache import result_cache
+from sorting_rules import sorting_rules
+
+UPLOAD_FOLDER = "temp_uploads"
+OUTPUT_FOLDER = "sorted_output"
+
+
+def categories_for(all_tags, duplicate_of):
+    """Folder names for a batch of tag lists from get_image_tags (duplicate_of: see tag_batch)."""
+    categories = sorting_rules.categories_for(all_tags)
+    if Config.DEDUP_DUPLICATES_FOLDER:
+        categories = [DUPLICATES_CATEGORY if dup else c for c, dup in zip(categories, duplicate_of)]
+    return categories
+
+
+def rounded_tags(tags):
+    """tags as job results show them, confidences to 2 decimals (categories are picked on the exact ones)."""
+    return [{**tag, 'conf': round(tag['conf'], 2)} if isinstance(tag, dict) else tag for tag in tags]
+
+
+def unique_name(name, taken):
+    """name, or name with a _1, _2, ... suffix if `taken` has it already (as UploadSpool does); adds it to taken."""
+    stem, ext = os.path.splitext(name)
+    n = 0
+    while name in taken:
+        n += 1
+        name = f"{stem}_{n}{ext}"
+    taken.add(name)
+    return name
+
+
+def _noop_progress(current, total, status):
+    pass
+
+
+def timed_batches(batches, stage, timings=None):
+    """Yields from batches, timing each wait for the next one as `stage` (see metrics.timed)."""
+    batches = iter(batches)
+    while True:
+        with timed(stage, timings):
+            batch = next(batches, None)
+        if batch is None:
+            return
+        yield batch
+
+
+# ----------------------------------------------------------
+# Inference with the result cache in front
+# ----------------------------------------------------------
+def content_md5(source):
+    """MD5 of a file path's or file object's bytes; same as Drive's md5Checksum."""
+    digest = hashlib.md5()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    elif hasattr(source, 'getbuffer'):
+        digest.update(source.getbuffer())
+        source.seek(0)
+    else:
+        for chunk in iter(lambda: source.read(1 << 20), b''):
+            digest.update(chunk)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def file_size(fh):
+    """Length of a rewound file object's contents."""
+    size = fh.seek(0, io.SEEK_END)
+    fh.seek(0)
+    return size
+
+
+def save_file(fh, path):
+    """Writes a rewound file object to path (a memoryview of in-memory downloads, no copy)."""
+    with open(path, 'wb') as f:
+        if hasattr(fh, 'getbuffer'):
+            f.write(fh.getbuffer())
+        else:
+            shutil.copyfileobj(fh, f)
+            fh.seek(0)
+
+
+# What the model saw of an image, part of its cache key: the original, or
+# (gdrive-source) Drive's thumbnail or a progressive JPEG's first scans.
+# Tags of the original serve any of them; tags from a thumbnail or preview
+# never stand in for the original's.
+FULL, THUMBNAIL, PREVIEW = 'full', 'thumbnail', 'preview'
+
+
+def cache_key(md5, seen=FULL):
+    return f"{md5}:{seen}:{model_fingerprint()}"
+
+
+def lookup_cached_tags(md5s, seen=None, record_misses=True):
+    """
+    Tags the result cache has for each digest in md5s, or None. seen[i]
+    (default FULL) is what the model would see of image i.
+    """
+    found = [None] * len(md5s)
+    if result_cache is None:
+        return found
+    seen = seen or [FULL] * len(md5s)
+
+    def look(indexes, kind_of, record):
+        keys = {i: cache_key(md5s[i], kind_of(i)) for i in indexes}
+        if keys:
+            hits = result_cache.get_many(list(set(keys.values())), record)
+            for i, key in keys.items():
+                found[i] = hits.get(key)
+
+    reduced = [i for i, m in enumerate(md5s) if m and seen[i] != FULL]
+    look([i for i, m in enumerate(md5s) if m and seen[i] == FULL], lambda i: FULL, record_misses)
+    # A thumbnail or preview takes the original's tags first, then its own kind's
+    look(reduced, lambda i: FULL, False)
+    look([i for i in reduced if found[i] is None], lambda i: seen[i], record_misses)
+    return found
+
+
+def tag_images(sources, md5s, seen=None):
+    """
+    get_image_tags_batch, skipping inference for images whose content the
+    result cache has seen. md5s[i] is the digest of the image sources[i]
+    shows (None means uncacheable) and seen[i] which of FULL, THUMBNAIL or
+    PREVIEW it is (default FULL); fresh results are stored unless inference
+    failed.
+    """
+    seen = seen or [FULL] * len(md5s)
+    tags = lookup_cached_tags(md5s, seen)
+    todo = [i for i, t in enumerate(tags) if t is None]
+    images_total.labels('cached').inc(len(tags) - len(todo))
+    if todo:
+        images_total.labels('inferred').inc(len(todo))
+        fresh = get_image_tags_batch([sources[i] for i in todo])
+        store = {}
+        for i, t in zip(todo, fresh):
+            tags[i] = t
+            if md5s[i] and all(isinstance(tag, dict) for tag in t):
+                store[cache_key(md5s[i], seen[i])] = t
+        if result_cache is not None:
+            result_cache.put_many(store)
+    return tags
+
+
+def tag_batch(names, sources, md5s, dedup=None, known=None, timings=None, seen=None):
+    """
+    tag_images for one batch of a job, with copies of images already seen
+    in the job (dedup: its DuplicateIndex, or None) taking the first copy's
+    tags without any lookup or inference. known[i], if given and not None,
+    are tags image i already has (sources[i] may then be None); seen is
+    passed on to tag_images. Time spent is added to `timings` (the job's
+    JobTimings) as 'dedup' and 'tag'.
+
+    Returns (tags, duplicate_of): duplicate_of[i] is the name of the image
+    that image i duplicates, or None.
+    """
+    known = known or [None] * len(names)
+    seen = seen or [FULL] * len(names)
+    if dedup is None:
+        entries = [{'name': name, 'tags': tags} for name, tags in zip(names, known)]
+        duplicate_of = [None] * len(names)
+    else:
+        entries, duplicate_of = [], []
+        with timed('dedup', timings):
+            for name, source, md5 in zip(names, sources, md5s):
+                entry, duplicate = dedup.check(name, md5, source)
+                entries.append(entry)
+                duplicate_of.append(entry['name'] if duplicate else None)
+        for entry, original, tags in zip(entries, duplicate_of, known):
+            if original is None and tags is not None:
+                entry['tags'] = tags
+        images_total.labels('duplicate').inc(sum(1 for d in duplicate_of if d))
+    images_total.labels('cached').inc(sum(1 for d, t in zip(duplicate_of, known) if d is None and t is not None))
+
+    todo = [i for i, e in enumerate(entries) if duplicate_of[i] is None and e['tags'] is None]
+    if todo:
+        with timed('tag', timings):
+            fresh = tag_images([sources[i] for i in todo], [md5s[i] for i in todo], [seen[i] for i in todo])
+        for i, tags in zip(todo, fresh):
+            entries[i]['tags'] = tags
+    return [e['tags'] for e in entries], duplicate_of
+
+
+# ----------------------------------------------------------
+# Concurrent Drive transfers
+# ----------------------------------------------------------
+def per_thread_service(creds_data, make_service=drive_clients.build_for):
+    """
+    Returns a function giving each calling thread its own Drive client.
+    The httplib2 transport behind a client is not thread-safe, so worker
+    threads must not share one.
+    """
+    local = threading.local()
+
+    def get_service():
+        if getattr(local, 'service', None) is None:
+            local.service = make_service(creds_data)
+        return local.service
+    return get_service
+
+
+def prefetch_downloads(items, download, batch_size, workers=None, prefetch=None):
+    """
+    Runs download(item) on `workers` threads and yields lists of up to
+    `batch_size` (item, data, error) tuples in completion order.
+
+    A batch is handed out as soon as at least one download is ready, so
+    inference never waits for a full batch while the network is slow. At
+    most `prefetch` finished downloads wait in the queue; workers block once
+    it is full, so a slow consumer bounds memory. Closing the generator
+    early stops the workers. If `items` itself raises, the downloads
+    already started are still yielded and the error is raised after them.
+    """
+    workers = workers or Config.DRIVE_DOWNLOAD_WORKERS
+    prefetch = prefetch or Config.DRIVE_PREFETCH
+    results = queue.Queue(maxsize=max(1, prefetch))
+    source = iter(items)
+    source_lock = threading.Lock()
+    stop = threading.Event()
+    finished = object()
+    listing_errors = []
+
+    depth = queue_depth.labels('downloads')
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                results.put(entry, timeout=0.1)
+                if entry is not finished:
+                    depth.inc()
+                return
+            except queue.Full:
+                continue
+
+    def worker():
+        while not stop.is_set():
+            try:
+                with source_lock:
+                    item = next(source, finished)
+            except Exception as e:
+                listing_errors.append(e)
+                break
+            if item is finished:
+                break
+            try:
+                put((item, download(item), None))
+            except Exception as e:
+                put((item, None, e))
+        put(finished)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    try:
+        remaining = len(threads)
+        while remaining:
+            batch = []
+            entry = results.get()
+            while True:
+                if entry is finished:
+                    remaining -= 1
+                else:
+                    depth.dec()
+                    batch.append(entry)
+                if len(batch) >= batch_size or not remaining:
+                    break
+                try:
+                    entry = results.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                yield batch
+        if listing_errors:
+            raise listing_errors[0]
+    finally:
+        stop.set()
+        # Downloads left behind by a consumer that stopped early
+        while True:
+            try:
+                if results.get_nowait() is not finished:
+                    depth.dec()
+            except queue.Empty:
+                break
+
+
+class UploadPool:
+    """
+    Runs uploads on `workers` threads with at most 2 * workers queued, so
+    submit() blocks (backpressure) instead of piling up file buffers.
+    The first upload error is re-raised by close().
+    """
+
+    def __init__(self, workers=None):
+        workers = max(1, workers or Config.DRIVE_UPLOAD_WORKERS)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._errors = []
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        queue_depth.labels('uploads').inc()
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        queue_depth.labels('uploads').dec()
+        self._slots.release()
+        if future.exception() is not None:
+            self._errors.append(future.exception())
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._errors:
+            raise self._errors[0]
+
+
+# ----------------------------------------------------------
+# Per-job local output and its streamed ZIP
+# ----------------------------------------------------------
+ZIP_STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic'}
+ZIP_CHUNK_SIZE = 256 * 1024
+OUTPUT_RETENTION = 24 * 60 * 60  # Undownloaded job outputs are removed after a day
+
+
+def job_output_dir(job_id):
+    return os.path.join(OUTPUT_FOLDER, job_id)
+
+
+def prune_old_outputs(max_age=OUTPUT_RETENTION):
+    """Removes job output folders nobody downloaded within max_age seconds."""
+    cutoff = time.time() - max_age
+    for entry in os.scandir(OUTPUT_FOLDER) if os.path.isdir(OUTPUT_FOLDER) else []:
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def zip_name_for_now():
+    zip_timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%SZ")
+    return f"PixClad_Output_{zip_timestamp}.zip"
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable file object that collects what ZipFile writes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(output_dir):
+    """
+    Yields a ZIP of output_dir (category/filename entries) as it is written,
+    so the first bytes go out before the archive is complete and no archive
+    is ever stored on disk. JPEG/PNG entries are STORED since deflating them
+    only costs CPU.
+    """
+    # Observed as the zip stage, including the time the client takes to read it
+    with timed('zip'):
+        sink = _ZipSink()
+        # An unseekable sink makes ZipFile write data descriptors after each entry
+        with zipfile.ZipFile(sink, 'w') as zf:
+            for root, dirs, files_in_dir in os.walk(output_dir):
+                dirs.sort()
+                for fname in sorted(files_in_dir):
+                    full_path = os.path.join(root, fname)
+                    zinfo = zipfile.ZipInfo.from_file(full_path, os.path.relpath(full_path, output_dir))
+                    if os.path.splitext(fname)[1].lower() in ZIP_STORED_EXTENSIONS:
+                        zinfo.compress_type = zipfile.ZIP_STORED
+                    else:
+                        zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    force_zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT
+                    with open(full_path, 'rb') as src, zf.open(zinfo, 'w', force_zip64=force_zip64) as dst:
+                        while True:
+                            chunk = src.read(ZIP_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+                            data = sink.drain()
+                            if data:
+                                yield data
+                    yield sink.drain()
+        yield sink.drain()
+
+
+# ----------------------------------------------------------
+# Uploaded files (already saved under temp_uploads/<job_id>)
+# ----------------------------------------------------------
+def sort_uploaded_files(batches, destination, creds_data=None, progress=_noop_progress, output_dir=None):
+    """
+    Tags and sorts files saved by /process-upload.
+
+    `batches` yields lists of (filename, temp_path) as the upload arrives
+    (see upload_spool.iter_spooled_batches). For the 'local' destination
+    the originals are moved into output_dir/<category> (one folder per job)
+    and the result names that folder for download; for 'gdrive' they are
+    uploaded into the Output folder of the account in creds_data. Copies
+    of an image already seen in the job reuse its tags (see tag_batch) and
+    are listed in the result's "duplicates". The result's "timings" has the
+    job's seconds per stage.
+    """
+    results = {}
+    received = 0
+    timings = JobTimings()
+    gdrive_service, output_parent_id = None, None
+    folders, account = folder_cache_for_job(), None
+    if destination == 'gdrive':
+        gdrive_service = drive_clients.build_for(creds_data)
+        account = account_key(creds_data)
+        output_parent_id = get_or_create_output_folder(gdrive_service, folders, account)
+
+    dedup, duplicates, sorted_into = duplicate_index(), {}, {}
+    done = 0
+    progress(done, received, 'Starting...')
+    for chunk in timed_batches(batches, 'receive', timings):
+        received += len(chunk)
+        paths = [path for _, path in chunk]
+        all_tags, duplicate_of = tag_batch([name for name, _ in chunk], paths, [content_md5(p) for p in paths],
+                                           dedup, timings=timings)
+        categories = categories_for(all_tags, duplicate_of)
+        if gdrive_service:
+            # Create this chunk's new category folders in one batch request
+            folders.resolve_many(gdrive_service, account, output_parent_id, set(categories))
+        for (filename, temp_path), tags, category, original in zip(chunk, all_tags, categories, duplicate_of):
+            results[filename], sorted_into[filename] = rounded_tags(tags), category
+            if original:
+                duplicates[filename] = original
+
+            if destination == 'local':
+                with timed('write', timings):
+                    category_folder = os.path.join(output_dir, category)
+                    os.makedirs(category_folder, exist_ok=True)
+                    shutil.move(temp_path, os.path.join(category_folder, filename))
+            elif destination == 'gdrive':
+                with timed('upload', timings):
+                    upload_file_to_gdrive(gdrive_service, temp_path, category, output_parent_id,
+                                          folder_cache=folders, account=account)
+                os.remove(temp_path)
+
+            done += 1
+            progress(done, received, f'Processing {filename}')
+
+    result = {"message": "Processing complete", "results": results, "categories": sorted_into,
+              "duplicates": duplicates, "timings": timings.as_dict()}
+    if destination == 'local':
+        result["output_dir"], result["zip_name"] = output_dir, zip_name_for_now()
+    return result
+
+
+# ----------------------------------------------------------
+# Google Drive source folder
+# ----------------------------------------------------------
+def sort_gdrive_folder(folder_id, destination, source_creds, destination_creds=None,
+                       progress=_noop_progress, make_service=drive_clients.build_for, recursive=False,
+                       output_dir=None, placement=None, incremental=True, make_http=drive_clients.build_http_for):
+    """
+    Tags and sorts the images of a Drive folder.
+
+    destination is 'local' (output_dir on this host, downloadable as a
+    zip), 'gdrive-source' (Output folder of the same account) or
+    'gdrive-destination' (Output folder of the account in
+    destination_creds). With recursive=True images in subfolders are
+    sorted too.
+
+    For 'gdrive-source' no image bytes are uploaded: the model sees Drive's
+    thumbnail (or a cached result) and the original is copied or moved into
+    its category folder on the Drive side (placement, default
+    DRIVE_SOURCE_PLACEMENT).
+
+    Drive destinations are incremental (unless incremental=False or
+    DRIVE_INCREMENTAL is off): files the folder manifest shows as already
+    placed with the same content are skipped. Copies of an image already
+    seen in the job reuse its tags (see tag_batch).
+
+    Downloads and uploads run on their own thread pools (see Config.DRIVE_*)
+    while this thread runs inference on whatever has been prefetched.
+    make_service and make_http build a Drive client and an authorized
+    transport from a credentials dict (drive_clients by default).
+    """
+    service_source = make_service(source_creds)
+    source_service = per_thread_service(source_creds, make_service)
+
+    # Category folders are resolved once per job and shared by the upload threads
+    folders, account = folder_cache_for_job(), None
+    destination_service, output_parent_id = None, None
+    if destination == 'gdrive-source':
+        destination_service = source_service
+        account = account_key(source_creds)
+        output_parent_id = get_or_create_output_folder(service_source, folders, account)
+    elif destination == 'gdrive-destination':
+        destination_service = per_thread_service(destination_creds, make_service)
+        account = account_key(destination_creds)
+        output_parent_id = get_or_create_output_folder(make_service(destination_creds), folders, account)
+
+    # When the result goes back into the same account the original never
+    # passes through us: a file whose md5Checksum is already cached needs no
+    # download at all, and the rest only need Drive's thumbnail for the model
+    same_account = destination == 'gdrive-source'
+    thumbnail_http = per_thread_service(source_creds, make_http)
+    placement = placement or Config.DRIVE_SOURCE_PLACEMENT
+    transferred = Counter()
+    transferred_lock = threading.Lock()
+    timings = JobTimings()
+
+    def count(kind, n):
+        with transferred_lock:
+            transferred[kind] += n
+
+    def download(image):
+        with timed('download', timings):
+            return fetch(image)
+
+    def fetch(image):
+        """(file, cached tags, what the file is: FULL, THUMBNAIL or PREVIEW)"""
+        thumbnails = same_account and Config.DRIVE_USE_THUMBNAILS and DECODE_SIZE
+        if same_account and result_cache is not None and image.get('md5Checksum'):
+            seen = THUMBNAIL if thumbnails and image.get('thumbnailLink') else FULL
+            hit = lookup_cached_tags([image['md5Checksum']], [seen], record_misses=False)[0]
+            if hit is not None:
+                return None, hit, seen
+        if thumbnails:
+            # Same size the model would decode the original down to
+            fh = download_thumbnail(thumbnail_http(), image, DECODE_SIZE)
+            if fh is not None:
+                count('thumbnails', len(fh.getbuffer()))
+                return fh, None, THUMBNAIL
+        head = b''
+        if (same_account and Config.DRIVE_PREVIEW_RANGE_BYTES and DECODE_SIZE
+                and image.get('mimeType') == 'image/jpeg'
+                and int(image.get('size') or 0) > Config.DRIVE_PREVIEW_RANGE_BYTES):
+            # Without a thumbnail, a progressive JPEG's first scans may do;
+            # otherwise the download carries on after the bytes fetched
+            head = download_head(source_service(), image['id'], Config.DRIVE_PREVIEW_RANGE_BYTES) or b''
+            preview = progressive_jpeg_preview(head)
+            if preview is not None:
+                count('previews', len(head))
+                return io.BytesIO(preview), None, PREVIEW
+        fh = download_file(source_service(), image['id'], image.get('size'), head)
+        count('downloaded', file_size(fh))
+        return fh, None, FULL
+
+    def upload(image, name, category, fh):
+        try:
+            with timed('upload', timings):
+                place(image, name, category, fh)
+        except Exception:
+            if run is not None:
+                run.failed = True
+            raise
+        finally:
+            if fh is not None:
+                fh.close()
+        if run is not None:
+            run.record(image, category)
+
+    def place(image, name, category, fh):
+        if same_account:
+            folder_id = folders.get_or_create(destination_service(), account, output_parent_id, category)
+            if placement == 'move':
+                # The file itself keeps its name
+                move_file_to_folder(destination_service(), image['id'], folder_id, image.get('parents') or [])
+            else:
+                copy_file_to_folder(destination_service(), image['id'], name, folder_id)
+        else:
+            count('uploaded', upload_file_to_gdrive(destination_service(), name, category, output_parent_id,
+                                                    stream=fh, folder_cache=folders, account=account))
+
+    # The listing is consumed lazily by the download workers, so work starts
+    # after the first page; `listed` is the total known so far
+    listed = 0
+
+    fields = "id, name, md5Checksum, size, parents" + (", mimeType, thumbnailLink" if same_account else "")
+    run = None
+    if destination_service and incremental and folder_manifest is not None:
+        key = run_key(account_key(source_creds), folder_id, destination, account, recursive)
+        run = IncrementalRun(folder_manifest, service_source, folder_id, key, recursive, fields)
+
+    def images():
+        nonlocal listed
+        if run is not None:
+            listing = run.images()
+        else:
+            listing = iter_folder_images(service_source, folder_id, recursive, fields=fields)
+        if same_account and placement == 'move':
+            # Moving files out of the folder while it is paged through would
+            # shift later pages, so the listing is taken in full first
+            listing = list(listing)
+        for image in listing:
+            listed += 1
+            yield image
+
+    # Results and output files are keyed by name; files of the same name
+    # (in different subfolders, or side by side, which Drive allows) get
+    # unique_name suffixes in the order they are processed
+    results, duplicates, sorted_into, names = {}, {}, {}, set()
+    dedup = duplicate_index()
+    done = 0
+    progress(done, 0, 'Listing folder...')
+    uploads = UploadPool() if destination_service else None
+    complete = False
+    try:
+        downloads = prefetch_downloads(images(), download, DEFAULT_BATCH_SIZE)
+        for batch in timed_batches(downloads, 'download_wait', timings):
+            ok, all_tags, seen = [], [], []
+            for image, data, error in batch:
+                name = unique_name(image['name'], names)
+                if error is not None:
+                    print(f"[ERROR] Download failed for {image['name']}: {error}")
+                    images_total.labels('error').inc()
+                    results[name] = ["Error"]
+                    if run is not None:
+                        run.failed = True
+                    continue
+                fh, cached, kind = data
+                ok.append((image, name, fh))
+                all_tags.append(cached)
+                seen.append(kind)
+
+            # Only downloads without cached tags (or an earlier copy) go through the model
+            all_tags, duplicate_of = tag_batch(
+                [name for _, name, _ in ok],
+                [fh for _, _, fh in ok],
+                [image.get('md5Checksum') or (fh is not None and content_md5(fh)) or None for image, _, fh in ok],
+                dedup, known=all_tags, timings=timings, seen=seen,
+            )
+            categories = categories_for(all_tags, duplicate_of)
+
+            if destination_service and ok:
+                # Create this batch's new category folders in one batch request
+                folders.resolve_many(destination_service(), account, output_parent_id, set(categories))
+            for (image, name, fh), tags, category, original in zip(ok, all_tags, categories, duplicate_of):
+                if original:
+                    duplicates[name] = original
+
+                # The original downloaded bytes go to the output untouched
+                # (for gdrive-source, fh may be just the thumbnail)
+                if destination == 'local':
+                    with timed('write', timings):
+                        os.makedirs(os.path.join(output_dir, category), exist_ok=True)
+                        save_file(fh, os.path.join(output_dir, category, name))
+                    fh.close()  # a temporary file is deleted now, not when collected
+                else:
+                    uploads.submit(upload, image, name, category, fh)
+                results[name], sorted_into[name] = rounded_tags(tags), category
+
+            done += len(batch)
+            progress(done, listed, f"Processing {batch[-1][0]['name']}")
+        complete = True
+    finally:
+        try:
+            if uploads:
+                uploads.close()
+        finally:
+            if run is not None:
+                # Only a run that got through every file moves the changes token on
+                run.finish(complete)
+
+    skipped = run.skipped if run is not None else 0
+    if not results:
+        message = "No new or changed images." if skipped else "No images found."
+        return {"message": message, "results": {}, "skipped": skipped}
+    result = {"message": "Processing complete!", "results": results, "categories": sorted_into,
+              "bytes_transferred": dict(transferred), "skipped": skipped, "duplicates": duplicates,
+              "timings": timings.as_dict()}
+    if destination == 'local':
+        result["output_dir"], result["zip_name"] = output_dir, zip_name_for_now()
+    return result
@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from metrics import cache_lookups_total
+
+
+class ResultCache:
+    """
+    Two-tier cache of tag lists keyed by image content.
+
+    Keys are built by the caller (see pipeline.cache_key) from the image's
+    MD5 (Drive's md5Checksum for Drive files), what the model saw of it, the
+    model file hash and the confidence threshold, so a new model or
+    threshold never reuses old tags. The first tier is an in-process LRU
+    holding at most `memory_bytes` of keys and tags; the second is a SQLite
+    table shared by every worker on the host, trimmed (least recently used
+    first) whenever the pages it fills grow past `disk_bytes`.
+    """
+
+    TRIM_EVERY = 500  # Puts between size checks of the SQLite tier
+
+    def __init__(self, path, memory_bytes=32 * 1024 * 1024, disk_bytes=512 * 1024 * 1024):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (tags, size)
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._puts_since_trim = 0
+
+        self.path = path
+        self._conn = None
+        self._conn_pid = None
+
+    @property
+    def _db(self):
+        """
+        This process's SQLite connection, opened on first use. A connection
+        must not cross a fork (gunicorn preload_app), so a forked worker
+        opens its own.
+        """
+        if not self.path:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, tags TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def get_many(self, keys, record_misses=True):
+        """
+        Returns {key: tags} for the keys found in either tier. Pass
+        record_misses=False for speculative lookups that will be retried.
+        """
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key][0]
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+
+            if missing and self._db is not None:
+                rows = []
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    marks = ",".join("?" * len(chunk))
+                    rows += self._db.execute(f"SELECT key, tags FROM results WHERE key IN ({marks})", chunk).fetchall()
+                if rows:
+                    self._db.executemany(
+                        "UPDATE results SET last_used = ? WHERE key = ?", [(time.time(), key) for key, _ in rows]
+                    )
+                for key, tags in rows:
+                    found[key] = json.loads(tags)
+                    self._remember(key, found[key], len(key) + len(tags))
+                self.disk_hits += len(rows)
+            memory_hits = len(keys) - len(missing)
+            if record_misses:
+                self.misses += len(keys) - len(found)
+        if memory_hits:
+            cache_lookups_total.labels('memory_hit').inc(memory_hits)
+        if len(found) > memory_hits:
+            cache_lookups_total.labels('disk_hit').inc(len(found) - memory_hits)
+        if record_misses and len(keys) > len(found):
+            cache_lookups_total.labels('miss').inc(len(keys) - len(found))
+        return found
+
+    def put_many(self, entries):
+        """Stores {key: tags} in both tiers."""
+        if not entries:
+            return
+        rows = [(key, json.dumps(tags)) for key, tags in entries.items()]
+        with self._lock:
+            for (key, tags), (_, data) in zip(entries.items(), rows):
+                self._remember(key, tags, len(key) + len(data))
+            if self._db is None:
+                return
+            now = time.time()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO results (key, tags, last_used) VALUES (?, ?, ?)",
+                [(key, data, now) for key, data in rows],
+            )
+            self._puts_since_trim += len(entries)
+            if self._puts_since_trim >= self.TRIM_EVERY:
+                self._puts_since_trim = 0
+                self._trim_disk()
+
+    def _remember(self, key, tags, size):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= old[1]
+        self._memory[key] = (tags, size)
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes and self._memory:
+            self._memory_size -= self._memory.popitem(last=False)[1][1]
+
+    def _disk_size(self):
+        """Bytes of the SQLite file in use (pages freed by deletes are reused, so they do not count)."""
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+        free = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def _trim_disk(self):
+        size = self._disk_size()
+        if size <= self.disk_bytes:
+            return
+        (count,) = self._db.execute("SELECT COUNT(*) FROM results").fetchone()
+        if not count:
+            return
+        # Rows take about size / count bytes each (with their index entries);
+        # trim to 90% so the next few puts don't trigger another trim
+        excess = min(count, int((size - self.disk_bytes * 0.9) * count / size) + 1)
+        self._db.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)", (excess,)
+        )
+
+    def stats(self):
+        """Hits, misses and the bytes each tier holds, for /health."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_size,
+                'disk_bytes': self._disk_size() if self._db is not None else 0,
+            }
+
+
+result_cache = ResultCache(
+    Config.RESULT_CACHE_PATH,
+    memory_bytes=Config.RESULT_CACHE_MEMORY_BYTES,
+    disk_bytes=Config.RESULT_CACHE_DISK_BYTES,
+) if Config.RESULT_CACHE_ENABLED else None
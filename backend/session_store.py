@@ -0,0 +1,241 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask_session import Session
+from flask_session.base import ServerSideSessionInterface
+from flask_session.defaults import Defaults
+
+from config import Config
+
+
+# ----------------------------------------------------------
+# Stores: (serialized data, expiry timestamp) per session id
+# ----------------------------------------------------------
+class MemorySessionStore:
+    """
+    Sessions in this process only, for a single-process deployment: an
+    LRU of at most `max_entries` sessions, each dropped once it expires.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        """(data, expires) of a live session, or None."""
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry
+
+    def set(self, sid, data, expires):
+        with self._lock:
+            self._entries[sid] = (data, expires)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            for sid in [sid for sid, (_, expires) in self._entries.items() if expires <= now]:
+                del self._entries[sid]
+
+
+class SQLiteSessionStore:
+    """
+    Sessions in a SQLite file (WAL) shared by every worker on the host.
+
+    Reads are served from a per-process LRU of `cache_entries` sessions.
+    The cache is dropped whenever SQLite's data_version shows that another
+    process has written to the file since, so a session changed by one
+    worker is never served stale by another; writes from this process go
+    to both.
+    """
+
+    SWEEP_BATCH = 1000
+
+    def __init__(self, path, cache_entries=10000):
+        self.path = path
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._data_version = None
+
+    @property
+    def _db(self):
+        """This process's connection; like ResultCache's, never shared across a fork."""
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+            self._conn, self._conn_pid = conn, os.getpid()
+            self._cache.clear()
+            self._data_version = None
+        return self._conn
+
+    def _validate_cache(self):
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def _remember(self, sid, entry):
+        self._cache[sid] = entry
+        self._cache.move_to_end(sid)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+
+    def get(self, sid):
+        """(data, expires) of a live session, or None."""
+        now = time.time()
+        with self._lock:
+            self._validate_cache()
+            entry = self._cache.get(sid)
+            if entry is None:
+                row = self._db.execute("SELECT data, expires FROM sessions WHERE id = ?", (sid,)).fetchone()
+                if row is None:
+                    return None
+                entry = (bytes(row[0]), row[1])
+                self._remember(sid, entry)
+            else:
+                self._cache.move_to_end(sid)
+            return entry if entry[1] > now else None
+
+    def set(self, sid, data, expires):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)", (sid, data, expires),
+            )
+            self._remember(sid, (data, expires))
+
+    def delete(self, sid):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+            self._cache.pop(sid, None)
+
+    def sweep(self):
+        """Deletes expired sessions SWEEP_BATCH at a time, so no single write holds the lock for long."""
+        now = time.time()
+        while True:
+            with self._lock:
+                deleted = self._db.execute(
+                    "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions WHERE expires <= ? LIMIT ?)",
+                    (now, self.SWEEP_BATCH),
+                ).rowcount
+            if deleted < self.SWEEP_BATCH:
+                return
+
+
+# ----------------------------------------------------------
+# Flask-Session interface over a store
+# ----------------------------------------------------------
+class StoreSessionInterface(ServerSideSessionInterface):
+    """
+    Flask-Session interface over a MemorySessionStore or SQLiteSessionStore.
+
+    Sessions are permanent and refreshed on every request (see
+    make_session_permanent in app.py), which would make every request a
+    write. Here a session whose data did not change is only rewritten to
+    push its expiry out once `touch_interval` seconds have passed. Expired
+    sessions are swept at most every `sweep_interval` seconds.
+    """
+
+    ttl = True  # Expiry is handled here, not by Flask-Session's cleanup hooks
+
+    def __init__(self, app, store, touch_interval=60, sweep_interval=300):
+        config = app.config
+        super().__init__(
+            app,
+            key_prefix=config.get("SESSION_KEY_PREFIX", Defaults.SESSION_KEY_PREFIX),
+            permanent=config.get("SESSION_PERMANENT", Defaults.SESSION_PERMANENT),
+            sid_length=config.get("SESSION_ID_LENGTH", Defaults.SESSION_ID_LENGTH),
+            serialization_format=config.get("SESSION_SERIALIZATION_FORMAT", Defaults.SESSION_SERIALIZATION_FORMAT),
+        )
+        self.store = store
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+
+    def _retrieve_session_data(self, store_id):
+        entry = self.store.get(store_id)
+        return self.serializer.decode(entry[0]) if entry else None
+
+    def _delete_session(self, store_id):
+        self.store.delete(store_id)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        now = time.time()
+        data = self.serializer.encode(session)
+        expires = now + session_lifetime.total_seconds()
+        saved = self.store.get(store_id)
+        if saved is None or saved[0] != data or expires - saved[1] >= self.touch_interval:
+            self.store.set(store_id, data, expires)
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.store.sweep()
+
+
+# The app's session interface, for reading sessions outside a request
+_interface = None
+
+
+def session_data(sid):
+    """
+    The saved data of session `sid` outside any request, or None if it has
+    ended. Jobs read the credentials they were pointed to with it (see
+    tasks.job_credentials); a Celery worker, which never imported the web
+    app, sets sessions up the way the app does on first use.
+    """
+    if _interface is None:
+        import app  # noqa: F401  (calls init_sessions)
+    return _interface._retrieve_session_data(_interface.key_prefix + sid)
+
+
+def init_sessions(app):
+    """
+    Server-side sessions for `app` as configured by SESSION_BACKEND:
+    'sqlite' (default, shared by the workers of one host), 'memory'
+    (single process), or Flask-Session's own 'redis' (shared across hosts)
+    and 'filesystem'.
+    """
+    global _interface
+    backend = Config.SESSION_BACKEND
+    if backend in ('sqlite', 'memory'):
+        if backend == 'sqlite':
+            store = SQLiteSessionStore(Config.SESSION_DB_PATH, Config.SESSION_CACHE_ENTRIES)
+        else:
+            store = MemorySessionStore(Config.SESSION_CACHE_ENTRIES)
+        app.session_interface = StoreSessionInterface(
+            app, store, touch_interval=Config.SESSION_TOUCH_SECONDS, sweep_interval=Config.SESSION_SWEEP_SECONDS,
+        )
+    else:
+        app.config["SESSION_TYPE"] = backend
+        if backend == 'redis':
+            import redis
+            app.config["SESSION_REDIS"] = redis.from_url(Config.SESSION_REDIS_URL)
+        elif backend == 'filesystem':
+            app.config["SESSION_FILE_DIR"] = "flask_session"
+            os.makedirs("flask_session", exist_ok=True)
+        Session(app)
+    _interface = app.session_interface
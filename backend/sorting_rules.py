@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+
+from config import Config
+
+UNCATEGORIZED = "Uncategorized"
+
+
+# ----------------------------------------------------------
+# Category rules, compiled into threshold tables
+# ----------------------------------------------------------
+class SortingRules:
+    """
+    Picks each image's category from its tags. A rule sends an image to
+    its category when any of its classes was detected with at least the
+    rule's confidence (min_conf, default `default_conf`), or per class:
+
+        {"category": "Vehicles", "classes": ["car", "truck", "bus"], "min_conf": 0.5}
+        {"category": "People", "classes": {"person": 0.8}}
+
+    Rules are tried in order and the first match wins; an image no rule
+    matches goes to its best tag of at least `default_conf` (the behaviour
+    without rules), or Uncategorized.
+
+    The class names the rules mention are numbered and the rules compiled
+    into a (rules x classes) table of thresholds, inf where a rule does not
+    name a class. A batch's tags are flattened into (image, class, conf)
+    arrays, scattered into an (images x classes) table of confidences, and
+    matched in one comparison against it. Confidences are compared as the
+    model gave them, not rounded. min_confidence is the lowest
+    threshold any rule needs: the model runs at that, once, and the cached
+    tags serve any rules that need no less.
+    """
+
+    def __init__(self, rules=(), default_conf=0.65):
+        self.default_conf = default_conf
+        self.categories = []
+        self.class_ids = {}
+        compiled = []
+        for rule in rules:
+            classes = rule.get('classes') if isinstance(rule, dict) else None
+            if not isinstance(rule, dict) or not rule.get('category') or not classes:
+                raise ValueError(f"A sorting rule needs a category and classes: {rule!r}")
+            if not isinstance(classes, (list, dict)):
+                raise ValueError(f"Classes of rule {rule['category']!r} must be a list or an object: {classes!r}")
+            if not isinstance(classes, dict):
+                classes = dict.fromkeys(classes, rule.get('min_conf', default_conf))
+            row = {}
+            for name, conf in classes.items():
+                if not 0 <= float(conf) <= 1:
+                    raise ValueError(f"Confidence for {name!r} in rule {rule['category']!r} is not between 0 and 1")
+                row[self.class_ids.setdefault(name, len(self.class_ids))] = float(conf)
+            compiled.append(row)
+            self.categories.append(str(rule['category']))
+
+        # Rule class names sorted, with their columns, to look tags up in bulk
+        order = sorted(self.class_ids)
+        self._names = np.array(order, dtype=str)
+        self._columns = np.array([self.class_ids[name] for name in order], dtype=np.int64)
+
+        self.thresholds = np.full((len(compiled), len(self.class_ids)), np.inf)
+        for r, row in enumerate(compiled):
+            for c, conf in row.items():
+                self.thresholds[r, c] = conf
+        self.min_confidence = min([default_conf] + [conf for row in compiled for conf in row.values()])
+
+    def _default(self, tags):
+        for tag in tags:
+            if isinstance(tag, dict) and tag['conf'] >= self.default_conf:
+                return tag['name']
+        return UNCATEGORIZED
+
+    def categories_for(self, all_tags):
+        """Category of each tag list of a batch (lists from get_image_tags, best first)."""
+        categories = [self._default(tags) for tags in all_tags]
+        if not self.categories or not all_tags:
+            return categories
+
+        detected = [(i, tag['name'], tag['conf']) for i, tags in enumerate(all_tags) for tag in tags
+                    if isinstance(tag, dict)]
+        if not detected:
+            return categories
+        owner, names, conf = zip(*detected)
+        owner, names, conf = np.array(owner), np.array(names, dtype=str), np.array(conf, dtype=np.float64)
+
+        # Tag names -> rule columns, dropping classes no rule mentions
+        pos = np.minimum(np.searchsorted(self._names, names), len(self._names) - 1)
+        known = self._names[pos] == names
+        scores = np.full((len(all_tags), len(self.class_ids)), -1.0)
+        np.maximum.at(scores, (owner[known], self._columns[pos[known]]), conf[known])
+        matched = (scores[:, None, :] >= self.thresholds[None, :, :]).any(axis=2)  # images x rules
+        first = matched.argmax(axis=1)
+        for i in np.flatnonzero(matched.any(axis=1)).tolist():
+            categories[i] = self.categories[first[i]]
+        return categories
+
+
+def load_sorting_rules():
+    """
+    SortingRules from SORT_RULES (a JSON list) or the JSON file at
+    SORT_RULES_PATH; without either, images go to their best tag as before.
+    Rules that cannot be read or are malformed are logged and ignored, so a
+    bad setting does not keep the app from starting.
+    """
+    try:
+        text = Config.SORT_RULES
+        if not text and Config.SORT_RULES_PATH:
+            with open(Config.SORT_RULES_PATH) as f:
+                text = f.read()
+        rules = json.loads(text) if text else []
+        if not isinstance(rules, list):
+            raise ValueError(f"Sorting rules must be a JSON list, not {type(rules).__name__}")
+        return SortingRules(rules, Config.TAG_CONFIDENCE)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"[ERROR] Ignoring SORT_RULES/SORT_RULES_PATH, images go to their best tag: {e}")
+        return SortingRules([], Config.TAG_CONFIDENCE)
+
+
+sorting_rules = load_sorting_rules()
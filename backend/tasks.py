@@ -1,14 +1,43 @@
 from celery import Celery
-from model_loader import get_image_tags
-import os
-import time  # For demonstration purposes
+from celery.result import AsyncResult
+from celery.signals import worker_process_init
+from concurrent.futures import ThreadPoolExecutor
+import shutil
+import threading
+import time
+import uuid
+
+from flask import jsonify, session
+
+from config import Config
+from inference_pool import warm_up
+from metrics import jobs_total, queue_depth, timed
+from model_loader import DEFAULT_BATCH_SIZE
+from pipeline import job_output_dir, prune_old_outputs, sort_uploaded_files, sort_gdrive_folder
+from session_store import session_data
+from upload_spool import iter_spooled_batches
 
 # --- Celery Configuration ---
-# Replace 'redis://localhost:6379/0' with your Redis server URL if different.
+# Set CELERY_BROKER_URL (e.g. redis://localhost:6379/0) to run jobs on Celery
+# workers. Without it, jobs run on a small in-process thread pool instead, so
+# the app works (and can be tested) without Redis.
+USE_CELERY = bool(Config.CELERY_BROKER_URL)
+
+# Jobs get a reference to the user's session instead of their Google
+# credentials (see credentials_ref), so workers must be able to read the
+# session store: sessions held in the web process's memory cannot be.
+if USE_CELERY and Config.SESSION_BACKEND == 'memory':
+    raise RuntimeError("SESSION_BACKEND=memory cannot be read by Celery workers; use sqlite (one host) or redis")
+
+# Without a broker a job's state lives in the process that runs it, so a
+# /jobs/<id> poll or download served by another gunicorn worker would 404.
+if not USE_CELERY and Config.WEB_CONCURRENCY > 1:
+    raise RuntimeError("WEB_CONCURRENCY > 1 needs CELERY_BROKER_URL: local jobs are only visible to their own worker")
+
 celery_app = Celery(
     'tasks',
-    broker='redis://localhost:6379/0',
-    backend='redis://localhost:6379/0'
+    broker=Config.CELERY_BROKER_URL or 'memory://',
+    backend=Config.CELERY_RESULT_BACKEND or 'cache+memory://'
 )
 
 # Optional Celery configuration
@@ -18,58 +47,190 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    task_track_started=True,
 )
 
 
-@celery_app.task(bind=True)
-def process_image_folder(self, source_info, destination_info, user_id):
+@worker_process_init.connect
+def _warm_up_worker(**kwargs):
+    """Each Celery worker process loads the model before taking its first job."""
+    if Config.PRELOAD_MODEL:
+        warm_up()
+
+
+def _process_image_folder(task, source_info, destination_info, user_id):
     """
-    A background task to download, analyze, and re-upload an image folder.
+    Downloads/reads, analyzes and sorts one job's images.
 
     Args:
-        source_info (dict): Info about the source (e.g., {'type': 'gdrive', 'folder_id': 'xyz'}).
-        destination_info (dict): Info about the destination.
+        task: The bound Celery task (or its local stand-in) used for progress.
+        source_info (dict): {'type': 'upload', 'folder': 'temp_uploads/<job_id>'} or
+            {'type': 'gdrive', 'folder_id': 'xyz', 'recursive': False, 'incremental': True,
+            'credentials': credentials_ref(...)}.
+        destination_info (dict): {'type': 'local' | 'gdrive' | 'gdrive-source' |
+            'gdrive-destination', 'credentials': credentials_ref(...) or None,
+            'placement': 'copy' | 'move'}.
         user_id (str): The ID of the user who initiated the task.
     """
+    def progress(current, total, status):
+        task.update_state(state='PROGRESS', meta={'current': current, 'total': total, 'status': status})
+
+    outcome = 'failure'
     try:
-        total_files = 10  # Placeholder: Get the actual number of files
-        files_processed = 0
-
-        self.update_state(state='PROGRESS', meta={'current': 0, 'total': total_files, 'status': 'Starting...'})
-        
-        # --- PHASE 1: Download files from source (G-Drive, S3, etc.) ---
-        # (Placeholder for cloud logic)
-        print(f"Downloading files from {source_info['type']} for user {user_id}...")
-        time.sleep(2) # Simulate download time
-
-        # --- PHASE 2: Process each file ---
-        # (This is a simplified loop for demonstration)
-        image_files = ["image1.jpg", "image2.png", "image3.jpg"] # Placeholder for actual file paths
-        
-        for filename in image_files:
-            # Simulate creating a temporary path for the downloaded file
-            temp_image_path = os.path.join('temp_uploads', filename)
-            
-            # 1. Get AI tags for the image
-            tags = get_image_tags(temp_image_path)
-            print(f"File: {filename}, Tags: {tags}")
-            
-            # 2. Determine the destination folder name (e.g., use the first tag)
-            target_folder = tags[0] if tags else "Uncategorized"
-
-            # --- PHASE 3: Upload the file to the correct sorted folder in the destination ---
-            # (Placeholder for cloud upload logic)
-            print(f"Uploading {filename} to {destination_info['type']} in folder '{target_folder}'...")
-            time.sleep(1) # Simulate upload time
-
-            files_processed += 1
-            self.update_state(
-                state='PROGRESS',
-                meta={'current': files_processed, 'total': total_files, 'status': f'Processing {filename}'}
+        print(f"Job {task.request.id}: {source_info['type']} -> {destination_info['type']} for user {user_id}")
+        with timed('job'):
+            result = _sort_job(task.request.id, source_info, destination_info, progress)
+        outcome = 'success'
+        return result
+
+    except Exception as e:
+        print(f"[ERROR] Job {task.request.id} failed: {e}")
+        task.update_state(state='FAILURE', meta={'exc_type': type(e).__name__, 'exc_message': str(e)})
+        return {'status': 'Task failed', 'error': str(e)}
+    finally:
+        jobs_total.labels(source_info['type'], outcome).inc()
+
+
+def credentials_ref(key):
+    """
+    What a job is given instead of session[key]: this session's id and the
+    key. The credentials (refresh token, client secret) then never pass
+    through the Celery broker or result backend; the job reads them from
+    the session store when it starts (job_credentials).
+    """
+    return {'session': session.sid, 'key': key}
+
+
+def job_credentials(ref):
+    """The credentials dict a credentials_ref points to."""
+    if not ref:
+        return None
+    data = session_data(ref['session'])
+    if not data or not data.get(ref['key']):
+        raise RuntimeError("Google Drive was disconnected before the job started")
+    return data[ref['key']]
+
+
+def _sort_job(job_id, source_info, destination_info, progress):
+    prune_old_outputs()
+    output_dir = job_output_dir(job_id)
+    if source_info['type'] == 'upload':
+        try:
+            return sort_uploaded_files(
+                iter_spooled_batches(source_info['folder'], DEFAULT_BATCH_SIZE), destination_info['type'],
+                job_credentials(destination_info.get('credentials')), progress=progress, output_dir=output_dir,
             )
+        finally:
+            shutil.rmtree(source_info['folder'], ignore_errors=True)
+    if source_info['type'] == 'gdrive':
+        return sort_gdrive_folder(
+            source_info['folder_id'], destination_info['type'], job_credentials(source_info['credentials']),
+            job_credentials(destination_info.get('credentials')), progress=progress,
+            recursive=source_info.get('recursive', False), output_dir=output_dir,
+            placement=destination_info.get('placement'), incremental=source_info.get('incremental', True),
+        )
+    raise ValueError(f"Unknown source type: {source_info['type']}")
 
-        return {'current': total_files, 'total': total_files, 'status': 'Task completed!', 'result': 'Success'}
 
-    except Exception as e:
-        self.update_state(state='FAILURE', meta={'exc_type': type(e).__name__, 'exc_message': str(e)})
-        return {'status': 'Task failed', 'error': str(e)}
\ No newline at end of file
+@celery_app.task(bind=True)
+def process_image_folder(self, source_info, destination_info, user_id):
+    """A background task to download, analyze, and re-upload an image folder."""
+    return _process_image_folder(self, source_info, destination_info, user_id)
+
+
+# --- Local in-process fallback ---
+_local_executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix='job')
+_local_jobs = {}
+_local_jobs_lock = threading.Lock()
+LOCAL_JOB_TTL = 60 * 60  # Forget finished local jobs after an hour
+
+
+class _LocalRequest:
+    def __init__(self, job_id):
+        self.id = job_id
+
+
+class _LocalTask:
+    """Stands in for a bound Celery task when a job runs on the local pool."""
+
+    def __init__(self, job_id):
+        self.request = _LocalRequest(job_id)
+
+    def update_state(self, state, meta):
+        with _local_jobs_lock:
+            _local_jobs[self.request.id].update(state=state, info=meta)
+
+
+def _run_local_job(job_id, source_info, destination_info, user_id):
+    queue_depth.labels('jobs').dec()
+    result = _process_image_folder(_LocalTask(job_id), source_info, destination_info, user_id)
+    with _local_jobs_lock:
+        _local_jobs[job_id].update(state='SUCCESS', info=result, finished_at=time.time())
+
+
+def _prune_local_jobs():
+    cutoff = time.time() - LOCAL_JOB_TTL
+    with _local_jobs_lock:
+        for job_id in [j for j, job in _local_jobs.items() if job.get('finished_at', cutoff + 1) < cutoff]:
+            del _local_jobs[job_id]
+
+
+def new_job_id():
+    return str(uuid.uuid4())
+
+
+def enqueue_job(source_info, destination_info, user_id=None, job_id=None):
+    """Queues a sorting job and returns its id without waiting for it."""
+    job_id = job_id or new_job_id()
+    if USE_CELERY:
+        process_image_folder.apply_async(args=(source_info, destination_info, user_id), task_id=job_id)
+        return job_id
+
+    _prune_local_jobs()
+    with _local_jobs_lock:
+        _local_jobs[job_id] = {'state': 'PENDING', 'info': None}
+    queue_depth.labels('jobs').inc()
+    _local_executor.submit(_run_local_job, job_id, source_info, destination_info, user_id)
+    return job_id
+
+
+# --- Session helpers for the job routes ---
+MAX_SESSION_JOBS = 50
+
+
+def remember_job(job_id):
+    """Records job_id in the session so only its owner can poll or download it."""
+    session['jobs'] = (session.get('jobs') or [])[-(MAX_SESSION_JOBS - 1):] + [job_id]
+
+
+def owns_job(job_id):
+    return job_id in (session.get('jobs') or [])
+
+
+def job_response(job_id):
+    return jsonify({"message": "Processing started", "job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+
+def get_job(job_id):
+    """
+    Returns {'state', 'info'} for a job, or None if it is unknown.
+
+    info is the progress meta while the job runs and the task's return value
+    once it has finished. A finished job whose result carries an 'error' is
+    reported as FAILURE.
+    """
+    if USE_CELERY:
+        res = AsyncResult(job_id, app=celery_app)
+        state, info = res.state, res.info
+        if isinstance(info, Exception):
+            info = {'error': str(info)}
+    else:
+        with _local_jobs_lock:
+            job = _local_jobs.get(job_id)
+            if job is None:
+                return None
+            state, info = job['state'], job['info']
+
+    if state == 'SUCCESS' and isinstance(info, dict) and 'error' in info:
+        state = 'FAILURE'
+    return {'state': state, 'info': info}
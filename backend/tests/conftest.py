@@ -0,0 +1,34 @@
+"""
+Offline tests: Drive is benchmarks.fake_drive.FakeDrive, jobs run on the
+local thread pool. Run from the backend folder:
+    python -m pytest tests
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# Before anything reads Config: no Celery broker (jobs on the local pool),
+# sessions in memory, and nothing remembered between runs
+os.environ["CELERY_BROKER_URL"] = ""
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("RESULT_CACHE_ENABLED", "0")
+os.environ.setdefault("DRIVE_INCREMENTAL", "0")
+
+# temp_uploads, sorted_output and the like land in a scratch folder, not the checkout
+_scratch = tempfile.mkdtemp(prefix='pixclad-tests-')
+atexit.register(shutil.rmtree, _scratch, True)
+os.chdir(_scratch)
+
+
+@pytest.fixture
+def drive():
+    """A FakeDrive with a few ms of latency per call, so threads really interleave."""
+    from benchmarks.fake_drive import FakeDrive
+    return FakeDrive(latency=0.002)
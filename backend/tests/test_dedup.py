@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from benchmarks.corpus import encode, make_photo
+from dedup import HASH_BITS, DuplicateIndex, MultiIndexHash
+
+
+def _flip(h, bits, rand):
+    for bit in rand.sample(range(HASH_BITS), bits):
+        h ^= 1 << bit
+    return h
+
+
+def _brute_force(stored, h, max_distance):
+    distances = [((h ^ other).bit_count(), value) for other, value in stored]
+    within = [d for d, _ in distances if d <= max_distance]
+    return min(within) if within else None
+
+
+@pytest.mark.parametrize('max_distance', [0, 1, 5, 10, 63, 64])
+def test_lookup_matches_a_brute_force_scan(max_distance):
+    rand = random.Random(max_distance)
+    index, stored = MultiIndexHash(max_distance), []
+    for i in range(300):
+        # Clusters of near copies among unrelated hashes
+        h = rand.getrandbits(HASH_BITS) if i % 3 == 0 or not stored else _flip(stored[-1][0], rand.randrange(12), rand)
+        index.add(h, i)
+        stored.append((h, i))
+
+    for _ in range(500):
+        h = _flip(rand.choice(stored)[0], rand.randrange(16), rand)
+        found = index.nearest(h)
+        expected = _brute_force(stored, h, max_distance)
+        assert (found and found[0]) == expected
+        if found:
+            assert (h ^ dict((v, o) for o, v in stored)[found[1]]).bit_count() == found[0]
+
+
+@pytest.mark.parametrize('max_distance', [0, 3, 5, 8])
+def test_distance_boundary(max_distance):
+    rand = random.Random(1)
+    h = rand.getrandbits(HASH_BITS)
+    index = MultiIndexHash(max_distance)
+    index.add(h, 'first')
+    for _ in range(20):
+        assert index.nearest(_flip(h, max_distance, rand)) == (max_distance, 'first')
+        assert index.nearest(_flip(h, max_distance + 1, rand)) is None
+
+
+def test_closest_of_several_matches_wins():
+    index = MultiIndexHash(5)
+    index.add(0b111, 'three bits away')
+    index.add(0b1, 'one bit away')
+    assert index.nearest(0) == (1, 'one bit away')
+
+
+def test_exact_copies_only_by_default():
+    index = DuplicateIndex()
+    assert not index.near
+    photo, burst = encode(make_photo((64, 48), 1)), encode(make_photo((64, 48), 1), quality=70)
+    assert index.check('a.jpg', 'md5-a', photo) == ({'name': 'a.jpg', 'tags': None}, False)
+    entry, duplicate = index.check('copy.jpg', 'md5-a', photo)
+    assert duplicate and entry['name'] == 'a.jpg'
+    assert index.check('burst.jpg', 'md5-b', burst)[1] is False
+
+
+def test_near_duplicates_when_asked_for():
+    index = DuplicateIndex(max_distance=5, near=True)
+    photo, other = make_photo((64, 48), 1), make_photo((64, 48), 2)
+    index.check('a.jpg', 'md5-a', encode(photo))
+    entry, duplicate = index.check('reencoded.jpg', 'md5-b', encode(photo, quality=60))
+    assert duplicate and entry['name'] == 'a.jpg'
+    assert index.check('other.jpg', 'md5-c', encode(other))[1] is False
+    assert index.duplicates == 1
@@ -0,0 +1,57 @@
+import threading
+
+import drive_clients
+from drive_clients import DriveClientPool
+from pipeline import per_thread_service
+
+CREDS = {'token': 'old', 'refresh_token': 'refresh', 'token_uri': 'https://oauth2.example/token',
+         'client_id': 'id', 'client_secret': 'secret'}
+
+
+class CredentialsPool(DriveClientPool):
+    """Clients are just the Credentials their transport signs with."""
+
+    def build_service(self, http):
+        return http.credentials
+
+
+def test_job_threads_share_the_accounts_credentials():
+    pool = CredentialsPool()
+    get_service = per_thread_service(CREDS, pool.build_for)
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(get_service())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with pool.client(CREDS) as request_client:
+        pass
+    assert len({id(credentials) for credentials in seen + [request_client]}) == 1
+
+
+def test_token_refreshed_by_a_job_reaches_the_session():
+    pool = CredentialsPool()
+    credentials = pool.build_for(CREDS)
+    credentials.token = 'new'  # as a refresh through any client would
+    assert pool.refreshed(CREDS)['token'] == 'new'
+    assert pool.build_for({**CREDS, 'token': 'stale'}) is credentials
+
+
+def test_job_clients_are_not_handed_to_requests():
+    pool = CredentialsPool(idle_clients=2)
+    with pool.client(CREDS):
+        pass
+    pool.build_for(CREDS)
+    assert len(pool._accounts[next(iter(pool._accounts))].idle) == 1
+
+
+def test_transports_are_closed_when_not_kept(monkeypatch):
+    closed = []
+    monkeypatch.setattr(drive_clients.httplib2.Http, 'close', lambda self: closed.append(self))
+    pool = CredentialsPool(idle_clients=1)
+    with pool.client(CREDS):
+        with pool.client(CREDS):
+            pass
+    assert len(closed) == 1  # one spare is kept; the other's connections go
+    pool.evict(CREDS)
+    assert len(closed) == 2
@@ -0,0 +1,124 @@
+import io
+import os
+
+import pytest
+from prometheus_client import REGISTRY
+from PIL import Image
+
+import pipeline
+from benchmarks.corpus import encode, make_photo
+from benchmarks.fake_drive import FakeDrive
+from config import Config
+from drive_service import (
+    DownloadBuffer, download_file, download_head, download_memory, download_thumbnail, progressive_jpeg_preview,
+)
+
+DATA = os.urandom(5500)
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(Config, 'DRIVE_DOWNLOAD_CHUNK_BYTES', 1000)
+    monkeypatch.setattr(Config, 'DRIVE_RETRY_BASE_SECONDS', 0)
+
+
+def _counted(name, kind):
+    return (REGISTRY.get_sample_value('pixclad_drive_api_calls_total', {'call': name}) or 0,
+            REGISTRY.get_sample_value('pixclad_drive_bytes_total', {'kind': kind}) or 0)
+
+
+@pytest.mark.parametrize('size', [len(DATA), None])
+def test_download_in_ranged_chunks(drive, size):
+    file_id = drive.add_file('a.jpg', DATA, drive.add_folder('Photos'))
+    calls, downloaded = _counted('files.get_media', 'downloaded')
+    with download_file(drive.service(), file_id, size) as fh:
+        assert fh.read() == DATA
+    assert drive.calls['files.get_media'] == 6
+    assert drive.bytes_down == len(DATA)
+    assert _counted('files.get_media', 'downloaded') == (calls + 6, downloaded + len(DATA))  # per ranged GET
+
+
+def test_download_carries_on_after_head(drive):
+    file_id = drive.add_file('a.jpg', DATA, drive.add_folder('Photos'))
+    head = download_head(drive.service(), file_id, 2048)
+    assert head == DATA[:2048]
+    assert download_file(drive.service(), file_id, len(DATA), head).read() == DATA
+    assert drive.bytes_down == len(DATA)  # nothing fetched twice
+
+
+def test_download_retries_failed_chunks():
+    drive = FakeDrive(fail_rate=0.3, seed=5)
+    file_id = drive.add_file('a.jpg', DATA, drive.add_folder('Photos'))
+    assert download_file(drive.service(), file_id, len(DATA)).read() == DATA
+
+
+def test_thumbnail_comes_through_the_authorized_transport(drive):
+    file_id = drive.add_file('a.jpg', encode(make_photo((640, 480), 1)), drive.add_folder('Photos'))
+    fh = download_thumbnail(drive.http(), drive.files[file_id], 64)
+    with Image.open(fh) as img:
+        assert max(img.size) == 64
+    assert drive.calls['thumbnail'] == 1
+    assert download_thumbnail(drive.http(), {'id': 'x'}, 64) is None  # no thumbnailLink
+
+
+def _jpeg(progressive):
+    buf = io.BytesIO()
+    make_photo((1600, 1200), 3).save(buf, 'JPEG', quality=90, progressive=progressive)
+    return buf.getvalue()
+
+
+def test_preview_from_the_head_of_a_progressive_jpeg(drive):
+    data = _jpeg(progressive=True)
+    file_id = drive.add_file('a.jpg', data, drive.add_folder('Photos'))
+    head = download_head(drive.service(), file_id, len(data) // 2)  # cut mid-way through the AC scans
+
+    preview = progressive_jpeg_preview(head)
+    assert preview is not None and len(preview) < len(head)
+    with Image.open(io.BytesIO(preview)) as img:
+        img.draft('RGB', (200, 150))
+        img.load()
+        assert img.size == (200, 150)  # the 1/8 scale the DC scans carry
+    assert drive.bytes_down == len(head)
+
+
+def test_baseline_jpeg_falls_through_to_a_full_download(drive):
+    data = _jpeg(progressive=False)
+    file_id = drive.add_file('a.jpg', data, drive.add_folder('Photos'))
+    head = download_head(drive.service(), file_id, len(data) // 2)
+
+    assert progressive_jpeg_preview(head) is None
+    assert progressive_jpeg_preview(_jpeg(progressive=True)[:200]) is None  # DC scans not within the head
+    with download_file(drive.service(), file_id, len(data), head) as fh:
+        assert fh.read() == data
+    assert drive.bytes_down == len(data)
+
+
+def test_closing_a_buffer_returns_its_memory():
+    used = download_memory.used
+    assert download_memory.take(1000)
+    fh = DownloadBuffer(1000, download_memory)
+    fh.write(b'x' * 1000)
+    fh.close()
+    assert download_memory.used == used
+    assert fh.closed
+
+
+def test_sort_closes_every_download(drive, monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'DRIVE_DOWNLOAD_MEMORY_BYTES', 0)  # temporary files only
+    monkeypatch.setattr(pipeline, 'get_image_tags_batch', lambda images: [[{"name": "cat", "conf": 0.9}] for _ in images])
+    opened = []
+
+    def download(*args, **kwargs):
+        opened.append(download_file(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(pipeline, 'download_file', download)
+    root = drive.add_folder('Photos')
+    for i in range(4):
+        drive.add_file(f"img_{i}.jpg", encode(make_photo((64, 48), i)), root)
+
+    for destination in ('local', 'gdrive-destination'):
+        pipeline.sort_gdrive_folder(root, destination, {'refresh_token': 'a'}, {'refresh_token': 'b'},
+                                    make_service=lambda creds: drive.service(), make_http=lambda creds: drive.http(),
+                                    output_dir=str(tmp_path / destination), incremental=False)
+    assert len(opened) == 8
+    assert all(fh.closed for fh in opened)
@@ -0,0 +1,239 @@
+import threading
+import time
+
+import pytest
+
+from drive_service import FolderCache, FOLDER_MIME_TYPE, download_file
+from pipeline import UploadPool, prefetch_downloads
+
+
+def _folder_with_files(drive, count):
+    folder_id = drive.add_folder('Photos')
+    return [drive.add_file(f"img_{i:03d}.jpg", f"data {i}".encode(), folder_id) for i in range(count)]
+
+
+def _drain(batches):
+    return [entry for batch in batches for entry in batch]
+
+
+# ----------------------------------------------------------
+# prefetch_downloads
+# ----------------------------------------------------------
+def test_prefetch_yields_every_download_once(drive):
+    file_ids = _folder_with_files(drive, 40)
+    service = drive.service()
+    entries = _drain(prefetch_downloads(file_ids, lambda file_id: download_file(service, file_id).read(),
+                                        batch_size=8, workers=4, prefetch=4))
+    assert sorted(item for item, _, _ in entries) == sorted(file_ids)
+    for file_id, data, error in entries:
+        assert error is None
+        assert data == drive.files[file_id]['data']
+
+
+def test_prefetch_keeps_listing_order_with_one_worker(drive):
+    file_ids = _folder_with_files(drive, 20)
+    service = drive.service()
+    entries = _drain(prefetch_downloads(file_ids, lambda file_id: download_file(service, file_id).read(),
+                                        batch_size=3, workers=1, prefetch=2))
+    assert [item for item, _, _ in entries] == file_ids
+
+
+def test_prefetch_yields_in_completion_order():
+    delays = {'slow': 0.3, 'fast1': 0.0, 'fast2': 0.05}
+
+    def download(item):
+        time.sleep(delays[item])
+        return item
+
+    entries = _drain(prefetch_downloads(['slow', 'fast1', 'fast2'], download, batch_size=1, workers=3, prefetch=3))
+    assert [item for item, _, _ in entries] == ['fast1', 'fast2', 'slow']
+
+
+def test_prefetch_hands_out_partial_batches():
+    """A batch goes out as soon as one download is ready, not once batch_size are."""
+    release = threading.Event()
+
+    def download(item):
+        if item != 0:
+            release.wait(5)
+        return item
+
+    batches = prefetch_downloads(range(4), download, batch_size=4, workers=4, prefetch=4)
+    assert [item for item, _, _ in next(batches)] == [0]
+    release.set()
+    assert sorted(item for item, _, _ in _drain(batches)) == [1, 2, 3]
+
+
+def test_prefetch_backpressure_bounds_downloads_ahead_of_consumer():
+    started = []
+    lock = threading.Lock()
+
+    def download(item):
+        with lock:
+            started.append(item)
+        return item
+
+    workers, prefetch = 2, 3
+    batches = prefetch_downloads(range(100), download, batch_size=1, workers=workers, prefetch=prefetch)
+    consumed = 0
+    for _ in batches:
+        consumed += 1
+        time.sleep(0.02)  # a slow consumer: workers fill the queue and block
+        with lock:
+            # what was consumed, what waits in the queue, one download in hand per worker
+            assert len(started) <= consumed + prefetch + workers
+        if consumed == 10:
+            break
+    batches.close()
+
+
+def test_prefetch_close_stops_workers():
+    started = []
+    lock = threading.Lock()
+
+    workers = set()
+
+    def download(item):
+        with lock:
+            started.append(item)
+            workers.add(threading.current_thread())
+        time.sleep(0.005)
+        return item
+
+    batches = prefetch_downloads(range(1000), download, batch_size=2, workers=4, prefetch=4)
+    next(batches)
+    batches.close()
+    deadline = time.monotonic() + 2
+    while any(t.is_alive() for t in workers) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not any(t.is_alive() for t in workers)
+    with lock:
+        count = len(started)
+    time.sleep(0.05)
+    assert len(started) == count < 1000
+
+
+def test_prefetch_download_errors_are_yielded():
+    def download(item):
+        if item == 2:
+            raise IOError("network down")
+        return item
+
+    entries = {item: (data, error) for item, data, error in
+               _drain(prefetch_downloads(range(4), download, batch_size=2, workers=2, prefetch=2))}
+    assert isinstance(entries[2][1], IOError)
+    assert entries[2][0] is None
+    assert all(entries[i] == (i, None) for i in (0, 1, 3))
+
+
+def test_prefetch_listing_error_reaches_caller_after_started_downloads():
+    def listing():
+        yield from range(5)
+        raise RuntimeError("listing failed")
+
+    seen = []
+    with pytest.raises(RuntimeError, match="listing failed"):
+        for batch in prefetch_downloads(listing(), lambda item: item, batch_size=2, workers=2, prefetch=2):
+            seen.extend(item for item, _, _ in batch)
+    assert sorted(seen) == [0, 1, 2, 3, 4]
+
+
+# ----------------------------------------------------------
+# UploadPool
+# ----------------------------------------------------------
+def test_upload_pool_runs_every_upload(drive):
+    folder_id = drive.add_folder('Output')
+    service = drive.service()
+    pool = UploadPool(workers=3)
+    for i in range(12):
+        pool.submit(lambda i=i: service.files().create(body={'name': f"{i}.jpg", 'parents': [folder_id]}).execute())
+    pool.close()
+    assert sorted(f['name'] for f in drive.children(folder_id)) == sorted(f"{i}.jpg" for i in range(12))
+
+
+def test_upload_pool_submit_blocks_when_full():
+    workers = 2
+    release = threading.Event()
+    pool = UploadPool(workers=workers)
+    submitted = []
+
+    def producer():
+        for i in range(workers * 2 + 1):
+            pool.submit(release.wait, 5)
+            submitted.append(i)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    time.sleep(0.1)
+    assert len(submitted) == workers * 2  # the last submit waits for a free slot
+    release.set()
+    thread.join(5)
+    assert len(submitted) == workers * 2 + 1
+    pool.close()
+
+
+def test_upload_pool_close_reraises_first_error():
+    pool = UploadPool(workers=2)
+    done = []
+
+    def upload(i):
+        if i == 3:
+            raise ValueError("upload 3 failed")
+        done.append(i)
+
+    for i in range(6):
+        pool.submit(upload, i)
+    with pytest.raises(ValueError, match="upload 3 failed"):
+        pool.close()
+    assert sorted(done) == [0, 1, 2, 4, 5]
+
+
+# ----------------------------------------------------------
+# FolderCache
+# ----------------------------------------------------------
+def test_folder_cache_creates_one_folder_for_racing_threads(drive):
+    cache = FolderCache()
+    service = drive.service()
+    barrier = threading.Barrier(8)
+    ids = []
+
+    def resolve():
+        barrier.wait()
+        ids.append(cache.get_or_create(service, 'account', 'root', 'Cats'))
+
+    threads = [threading.Thread(target=resolve) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    folders = [f for f in drive.children('root') if f['mimeType'] == FOLDER_MIME_TYPE and f['name'] == 'Cats']
+    assert len(folders) == 1
+    assert set(ids) == {folders[0]['id']}
+    assert cache.misses == 1 and cache.hits == 7
+
+
+def test_folder_cache_overlapping_batches_share_folders(drive):
+    cache = FolderCache()
+    service = drive.service()
+    barrier = threading.Barrier(2)
+    results = []
+
+    def resolve(names):
+        barrier.wait()
+        results.append(cache.resolve_many(service, 'account', 'root', names))
+
+    threads = [threading.Thread(target=resolve, args=(names,)) for names in (['A', 'B', 'C'], ['C', 'D', 'A'])]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    names = sorted(f['name'] for f in drive.children('root') if f['mimeType'] == FOLDER_MIME_TYPE)
+    assert names == ['A', 'B', 'C', 'D']
+    assert results[0]['A'] == results[1]['A'] and results[0]['C'] == results[1]['C']
+
+
+def test_folder_cache_finds_existing_folder(drive):
+    existing = drive.add_folder('Dogs')
+    cache = FolderCache()
+    assert cache.get_or_create(drive.service(), 'account', 'root', 'Dogs') == existing
+    assert len([f for f in drive.children('root') if f['name'] == 'Dogs']) == 1
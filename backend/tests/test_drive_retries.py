@@ -0,0 +1,73 @@
+import pytest
+from googleapiclient.errors import HttpError
+
+import pipeline
+from benchmarks.corpus import encode, make_photo
+from benchmarks.fake_drive import FakeDrive, FakeResponse
+from config import Config
+from drive_service import FOLDER_MIME_TYPE, find_or_create_folders, with_retries
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(Config, 'DRIVE_RETRY_BASE_SECONDS', 0)
+    monkeypatch.setattr(Config, 'DRIVE_RETRIES', 5)
+
+
+def _failing(status, times):
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) <= times:
+            raise HttpError(FakeResponse(status), b'{"error": "backendError"}')
+        return 'done'
+    return call, calls
+
+
+def test_with_retries_recovers_from_5xx():
+    call, calls = _failing(503, 3)
+    assert with_retries(call) == 'done'
+    assert len(calls) == 4
+
+
+def test_with_retries_gives_up_after_limit():
+    call, calls = _failing(503, 100)
+    with pytest.raises(HttpError):
+        with_retries(call, retries=2)
+    assert len(calls) == 3
+
+
+def test_with_retries_does_not_retry_client_errors():
+    call, calls = _failing(404, 1)
+    with pytest.raises(HttpError):
+        with_retries(call)
+    assert len(calls) == 1
+
+
+def test_folders_are_created_once_despite_failing_batches():
+    drive = FakeDrive(fail_rate=0.4, seed=1)
+    names = [f"Category {i}" for i in range(8)]
+    found = find_or_create_folders(drive.service(), names, 'root')
+    folders = [f for f in drive.children('root') if f['mimeType'] == FOLDER_MIME_TYPE]
+    assert sorted(f['name'] for f in folders) == names
+    assert found == {f['name']: f['id'] for f in folders}
+
+
+@pytest.mark.parametrize('placement', ['copy', 'move'])
+def test_drive_to_drive_sort_survives_transient_errors(monkeypatch, tmp_path, placement):
+    monkeypatch.setattr(pipeline, 'get_image_tags_batch', lambda images: [[{"name": "cat", "conf": 0.9}] for _ in images])
+    drive = FakeDrive(fail_rate=0.2, seed=3)
+    root = drive.add_folder('Photos')
+    for i in range(12):
+        drive.add_file(f"img_{i:02d}.jpg", encode(make_photo((64, 48), i)), drive.add_folder(f"sub{i % 3}", root))
+
+    result = pipeline.sort_gdrive_folder(root, 'gdrive-source', {'refresh_token': 'a'}, {'refresh_token': 'a'},
+                                         make_service=lambda creds: drive.service(), make_http=lambda creds: drive.http(),
+                                         output_dir=str(tmp_path), incremental=False, recursive=True,
+                                         placement=placement)
+
+    assert len(result['results']) == 12
+    output = next(f['id'] for f in drive.children('root') if f['name'] == 'Output')
+    cat = next(f['id'] for f in drive.children(output) if f['mimeType'] == FOLDER_MIME_TYPE)
+    assert sorted(f['name'] for f in drive.children(cat)) == [f"img_{i:02d}.jpg" for i in range(12)]
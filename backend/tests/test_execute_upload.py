@@ -0,0 +1,77 @@
+import io
+import os
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from benchmarks.fake_upload_server import FakeUploadServer
+from config import Config
+from drive_service import _media_for, execute_upload
+
+CHUNK = 256 * 1024
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(Config, 'DRIVE_UPLOAD_CHUNK_BYTES', CHUNK)
+    monkeypatch.setattr(Config, 'DRIVE_RESUMABLE_MIN_BYTES', 0)
+    monkeypatch.setattr(Config, 'DRIVE_RETRY_BASE_SECONDS', 0)
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(FakeUploadServer(**kwargs).start())
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _upload(server, data, retries=5):
+    request = server.drive_service().files().create(
+        body={'name': 'photo.jpg'}, media_body=_media_for('photo.jpg', io.BytesIO(data)), fields='id')
+    return execute_upload(request, retries=retries)
+
+
+def test_resumes_after_failed_chunk_from_acknowledged_offset(server_factory):
+    server = server_factory(fail_puts=[2])
+    data = os.urandom(3 * CHUNK + 1000)
+    response = _upload(server, data)
+    assert server.files[response['id']]['data'] == data
+    # chunk 2 failed: Drive is asked how much arrived, and chunk 2 sent again
+    assert server.chunk_starts == [0, CHUNK, '*', CHUNK, 2 * CHUNK, 3 * CHUNK]
+
+
+def test_resumes_mid_chunk_after_dropped_connection(server_factory):
+    server = server_factory(drop_puts=[2])
+    data = os.urandom(3 * CHUNK)
+    response = _upload(server, data)
+    assert server.files[response['id']]['data'] == data
+    # half of chunk 2 arrived before the cut; only the rest is re-sent
+    assert server.chunk_starts[:4] == [0, CHUNK, '*', CHUNK + CHUNK // 2]
+
+
+def test_random_failures_still_give_identical_bytes(server_factory):
+    server = server_factory(fail_rate=0.3, drop_rate=0.2, seed=7)
+    data = os.urandom(8 * CHUNK + 12345)
+    response = _upload(server, data, retries=20)
+    assert server.files[response['id']]['data'] == data
+
+
+def test_gives_up_after_retry_limit(server_factory):
+    server = server_factory(fail_puts=range(1, 100))
+    with pytest.raises(HttpError) as e:
+        _upload(server, os.urandom(2 * CHUNK), retries=3)
+    assert e.value.resp.status == 503
+    assert len([start for start in server.chunk_starts if start != '*']) == 4  # first try + 3 retries
+    assert not server.files
+
+
+def test_retry_budget_is_per_chunk(server_factory):
+    server = server_factory(fail_puts=[1, 3, 5])  # every chunk fails once
+    data = os.urandom(3 * CHUNK)
+    response = _upload(server, data, retries=1)
+    assert server.files[response['id']]['data'] == data
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import app as app_module
+import model_loader
+
+
+class FakeBackend:
+    name = 'fake'
+
+    def predict_tags(self, images, conf):
+        return [[{"name": "cat", "conf": 0.9}] for _ in images]
+
+
+class Loads(list):
+    """Threads that loaded the model; loading waits for release()."""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def release(self):
+        self.released.set()
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Replaces the weights with FakeBackend."""
+    loads = Loads()
+
+    def create():
+        loads.append(threading.current_thread().name)
+        loads.released.wait(5)
+        return FakeBackend()
+
+    monkeypatch.setattr(model_loader, '_create_backend', create)
+    monkeypatch.setattr(model_loader, '_backend', None)
+    monkeypatch.setattr(model_loader, '_status', dict(model_loader._status, state='not_loaded', error=None))
+    monkeypatch.setattr(app_module, '_background_load', threading.Lock())
+    return loads
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_model_loads_on_first_inference(loads):
+    loads.release()
+    assert model_loader.model_status()['state'] == 'not_loaded'
+    assert model_loader.get_image_tags_batch([Image.new('RGB', (32, 32))]) == [[{"name": "cat", "conf": 0.9}]]
+    assert model_loader.model_status()['state'] == 'ready'
+    assert len(loads) == 1
+
+
+def test_health_does_not_load_the_model(loads):
+    client = app_module.app.test_client()
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json()['model']['state'] == 'not_loaded'
+    assert not loads
+
+
+def test_ready_loads_the_model_in_the_background(loads):
+    client = app_module.app.test_client()
+    assert client.get('/ready').status_code == 503
+    assert _wait_for(lambda: loads)
+    assert client.get('/ready').get_json()['model']['state'] == 'loading'
+
+    loads.release()
+    assert _wait_for(lambda: client.get('/ready').status_code == 200)
+    assert loads == ['model-load']  # one load, not one per probe
+
+
+def test_ready_reports_a_failed_load(loads, monkeypatch):
+    monkeypatch.setattr(model_loader, '_create_backend', lambda: 1 / 0)
+    client = app_module.app.test_client()
+    client.get('/ready')
+    assert _wait_for(lambda: model_loader.model_status()['state'] == 'failed')
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert 'division' in response.get_json()['model']['error']
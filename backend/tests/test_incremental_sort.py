@@ -0,0 +1,116 @@
+import hashlib
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import folder_manifest
+import pipeline
+from benchmarks.corpus import encode, make_photo
+from benchmarks.fake_drive import FakeResponse
+from folder_manifest import FolderManifest
+
+
+def _photo(seed):
+    return encode(make_photo((64, 48), seed))
+
+
+@pytest.fixture
+def manifest(monkeypatch, tmp_path):
+    """A manifest of its own per test (conftest turns DRIVE_INCREMENTAL off)."""
+    manifest = FolderManifest(str(tmp_path / 'manifests.sqlite3'))
+    monkeypatch.setattr(pipeline, 'folder_manifest', manifest)
+    monkeypatch.setattr(pipeline, 'get_image_tags_batch', lambda images: [[{"name": "cat", "conf": 0.9}] for _ in images])
+    return manifest
+
+
+def _sort(drive, folder_id, tmp_path):
+    result = pipeline.sort_gdrive_folder(folder_id, 'gdrive-destination', {'refresh_token': 'source'},
+                                         {'refresh_token': 'dest'}, make_service=lambda creds: drive.service(),
+                                         make_http=lambda creds: drive.http(), output_dir=str(tmp_path),
+                                         incremental=True)
+    return sorted(result['results']), result['skipped']
+
+
+def _folder(drive, count):
+    root = drive.add_folder('Photos')
+    ids = [drive.add_file(f"img_{i}.jpg", _photo(i), root) for i in range(count)]
+    return root, ids
+
+
+def _tokens(manifest):
+    return [row[0] for row in manifest._db.execute("SELECT page_token FROM runs")]
+
+
+@pytest.fixture
+def listings(monkeypatch):
+    """Folders the run listed in full."""
+    listed = []
+    iter_folder_images = folder_manifest.iter_folder_images
+
+    def listing(service, folder_id, *args, **kwargs):
+        listed.append(folder_id)
+        return iter_folder_images(service, folder_id, *args, **kwargs)
+    monkeypatch.setattr(folder_manifest, 'iter_folder_images', listing)
+    return listed
+
+
+def test_second_run_reads_only_the_changes(drive, manifest, listings, tmp_path):
+    root, _ = _folder(drive, 3)
+    assert _sort(drive, root, tmp_path) == (['img_0.jpg', 'img_1.jpg', 'img_2.jpg'], 0)
+    assert len(_tokens(manifest)) == 1
+    assert listings == [root]
+
+    drive.add_file('img_3.jpg', _photo(3), root)
+    assert _sort(drive, root, tmp_path) == (['img_3.jpg'], 0)
+    assert drive.calls['changes.list'] >= 1
+    assert listings == [root]  # the folder was not listed again
+
+
+def test_expired_token_falls_back_to_the_full_listing(drive, manifest, listings, monkeypatch, tmp_path):
+    root, _ = _folder(drive, 3)
+    _sort(drive, root, tmp_path)
+    drive.add_file('img_3.jpg', _photo(3), root)
+
+    def expired(*args, **kwargs):
+        raise HttpError(FakeResponse(410), b'{"error": "invalid page token"}')
+    monkeypatch.setattr(folder_manifest, 'list_changes', expired)
+
+    # Everything is listed; what the manifest knows is skipped all the same
+    assert _sort(drive, root, tmp_path) == (['img_3.jpg'], 3)
+    assert listings == [root, root]
+
+
+def test_unchanged_content_is_skipped(drive, manifest, tmp_path):
+    root, ids = _folder(drive, 3)
+    _sort(drive, root, tmp_path)
+
+    drive.touch(ids[0])  # renamed or re-shared: new modifiedTime, same md5Checksum
+    data = _photo(10)
+    drive.files[ids[1]].update(data=data, md5Checksum=hashlib.md5(data).hexdigest(), size=str(len(data)))
+    drive.touch(ids[1])  # new content
+
+    assert _sort(drive, root, tmp_path) == (['img_1.jpg'], 1)
+
+
+def test_failed_run_does_not_advance_the_token(drive, manifest, monkeypatch, tmp_path):
+    root, _ = _folder(drive, 2)
+    _sort(drive, root, tmp_path)
+    token = _tokens(manifest)
+
+    bad = drive.add_file('bad.jpg', _photo(5), root)
+    drive.add_file('good.jpg', _photo(6), root)
+    download_file = pipeline.download_file
+
+    def failing(service, file_id, *args, **kwargs):
+        if file_id == bad:
+            raise OSError("connection reset")
+        return download_file(service, file_id, *args, **kwargs)
+    monkeypatch.setattr(pipeline, 'download_file', failing)
+
+    assert _sort(drive, root, tmp_path) == (['bad.jpg', 'good.jpg'], 0)
+    assert _tokens(manifest) == token
+
+    # Next time the failed file is offered again; the one placed is not
+    monkeypatch.setattr(pipeline, 'download_file', download_file)
+    assert _sort(drive, root, tmp_path) == (['bad.jpg'], 1)
+    assert _tokens(manifest) != token
@@ -0,0 +1,72 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import inference_pool
+from config import Config
+from inference_pool import InferencePool
+
+
+class FakeExecutor:
+    """Stands in for the process pool: tags every image 'cat', or is broken."""
+
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.shut_down = False
+
+    def submit(self, fn, items, shm_name, batch_size):
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("a worker died"))
+        else:
+            future.set_result([[{"name": "cat", "conf": 0.9}] for _ in items])
+        return future
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+
+
+class FakePool(InferencePool):
+    def __init__(self, executors):
+        self.executors = executors
+        self.started = []
+        super().__init__(workers=2)
+
+    def _start_executor(self):
+        self.started.append(self.executors.pop(0))
+        return self.started[-1]
+
+
+def test_tag_restarts_a_broken_pool_and_retries():
+    pool = FakePool([FakeExecutor(broken=True), FakeExecutor()])
+    assert pool.tag(['a.jpg', 'b.jpg', 'c.jpg'], batch_size=2) == [[{"name": "cat", "conf": 0.9}]] * 3
+    assert len(pool.started) == 2
+    assert pool.started[0].shut_down
+    assert pool.status()['state'] == 'ready'
+
+
+def test_tag_retries_only_once():
+    pool = FakePool([FakeExecutor(broken=True), FakeExecutor(broken=True)])
+    with pytest.raises(BrokenProcessPool):
+        pool.tag(['a.jpg'])
+    assert len(pool.started) == 2
+
+
+def test_tag_restarts_an_executor_only_once_for_concurrent_callers():
+    pool = FakePool([FakeExecutor(broken=True), FakeExecutor()])
+    broken = pool._executor
+    pool._restart(broken)
+    pool._restart(broken)  # a second caller that saw the same broken executor
+    assert len(pool.started) == 2
+
+
+def test_auto_workers_share_the_cores_between_web_workers(monkeypatch):
+    monkeypatch.setattr(inference_pool.os, 'cpu_count', lambda: 8)
+    monkeypatch.setattr(Config, 'INFERENCE_WORKERS', 'auto')
+    monkeypatch.setattr(Config, 'WEB_CONCURRENCY', 1)
+    assert inference_pool.inference_workers() == 8
+    monkeypatch.setattr(Config, 'WEB_CONCURRENCY', 3)
+    assert inference_pool.inference_workers() == 2
+    monkeypatch.setattr(Config, 'WEB_CONCURRENCY', 16)
+    assert inference_pool.inference_workers() == 1
@@ -0,0 +1,92 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+import app as app_module
+import gdrive
+import tasks
+from pipeline import ZIP_CHUNK_SIZE
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(tasks, '_local_jobs', {})
+    return app_module.app.test_client()
+
+
+def _job(client, job_id, state, info, owned=True):
+    tasks._local_jobs[job_id] = {'state': state, 'info': info}
+    if owned:
+        with client.session_transaction() as sess:
+            sess['jobs'] = [job_id]
+
+
+def test_only_the_owner_sees_a_job(client):
+    _job(client, 'mine', 'SUCCESS', {'results': []})
+    _job(client, 'theirs', 'SUCCESS', {'results': []}, owned=False)
+    assert client.get('/jobs/mine').status_code == 200
+    assert client.get('/jobs/theirs').status_code == 404
+    assert client.get('/jobs/theirs/download').status_code == 404
+    assert client.get('/jobs/unknown').status_code == 404
+
+
+def test_progress_is_reported_while_running(client):
+    _job(client, 'job', 'PROGRESS', {'current': 3, 'total': 10, 'status': 'Tagging'})
+    assert client.get('/jobs/job').get_json() == {
+        'job_id': 'job', 'state': 'PROGRESS', 'current': 3, 'total': 10, 'status': 'Tagging'}
+
+
+def test_timings_only_on_request(client):
+    _job(client, 'job', 'SUCCESS', {'results': [], 'timings': {'inference': 1.5},
+                                    'output_dir': '/tmp/x', 'zip_name': 'x.zip'})
+    body = client.get('/jobs/job').get_json()
+    assert 'timings' not in body and 'output_dir' not in body and 'zip_name' not in body
+    assert body['download_url'] == '/jobs/job/download'
+    assert client.get('/jobs/job?timings=1').get_json()['timings'] == {'inference': 1.5}
+
+
+def test_result_with_error_is_a_failure(client):
+    _job(client, 'job', 'SUCCESS', {'status': 'Task failed', 'error': 'Drive said no'})
+    body = client.get('/jobs/job').get_json()
+    assert body['state'] == 'FAILURE'
+    assert body['error'] == 'Drive said no'
+    assert client.get('/jobs/job/download').status_code == 404
+
+
+def test_unknown_destination_is_rejected_up_front(client, monkeypatch):
+    queued = []
+    monkeypatch.setattr(gdrive, 'enqueue_job', lambda *args, **kwargs: queued.append(args))
+    with client.session_transaction() as sess:
+        sess['credentials'] = {'token': 't'}
+    response = client.post('/auth/gdrive/process-folder/abc', json={'destination': 'dropbox'})
+    assert response.status_code == 400
+    assert not queued
+
+
+def _finished_job(client, tmp_path):
+    output_dir = tmp_path / 'job'
+    (output_dir / 'cat').mkdir(parents=True)
+    (output_dir / 'cat' / 'a.jpg').write_bytes(os.urandom(2 * ZIP_CHUNK_SIZE))
+    (output_dir / 'cat' / 'b.jpg').write_bytes(os.urandom(2 * ZIP_CHUNK_SIZE))
+    _job(client, 'job', 'SUCCESS', {'results': [], 'output_dir': str(output_dir), 'zip_name': 'PixClad.zip'})
+    return output_dir
+
+
+def test_output_is_removed_after_a_full_download(client, tmp_path):
+    output_dir = _finished_job(client, tmp_path)
+    response = client.get('/jobs/job/download')
+    assert response.status_code == 200
+    assert 'PixClad.zip' in response.headers['Content-Disposition']
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert sorted(zf.namelist()) == ['cat/a.jpg', 'cat/b.jpg']
+    assert not output_dir.exists()
+
+
+def test_output_is_kept_after_an_aborted_download(client, tmp_path):
+    output_dir = _finished_job(client, tmp_path)
+    response = client.get('/jobs/job/download', buffered=False)
+    assert next(iter(response.response))
+    response.close()  # the client went away mid-stream
+    assert (output_dir / 'cat' / 'a.jpg').exists()
@@ -0,0 +1,82 @@
+import io
+import re
+import threading
+import time
+
+import pytest
+
+import app as app_module
+import model_loader
+from benchmarks.corpus import encode, make_photo
+from metrics import JobTimings, timed
+
+
+class FakeBackend:
+    name = 'fake'
+
+    def predict_tags(self, images, conf):
+        return [[{"name": "cat", "conf": 0.9}] for _ in images]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(model_loader, '_backend', FakeBackend())
+    return app_module.app.test_client()
+
+
+def _scrape(client, name, **labels):
+    """A sample's value from /metrics (0 if it is not there yet)."""
+    text = client.get('/metrics').get_data(as_text=True)
+    wanted = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    m = re.search(rf'^{name}\{{{wanted}\}} (\S+)$', text, re.M)
+    return float(m.group(1)) if m else 0.0
+
+
+def _run_job(client, count):
+    response = client.post('/process-upload', data={
+        'destination': 'local',
+        'files': [(io.BytesIO(encode(make_photo((96, 64), i))), f"img_{i}.jpg") for i in range(count)],
+    }, content_type='multipart/form-data')
+    status_url = response.get_json()['status_url']
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        body = client.get(status_url + '?timings=1').get_json()
+        if body['state'] not in ('PENDING', 'STARTED', 'PROGRESS'):
+            return body
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+
+def test_metrics_move_after_a_job(client):
+    before = {stage: _scrape(client, 'pixclad_stage_seconds_count', stage=stage) for stage in ('decode', 'inference')}
+    jobs = _scrape(client, 'pixclad_jobs_total', source='upload', outcome='success')
+
+    body = _run_job(client, 3)
+
+    assert body['state'] == 'SUCCESS'
+    assert _scrape(client, 'pixclad_stage_seconds_count', stage='decode') == before['decode'] + 3
+    assert _scrape(client, 'pixclad_stage_seconds_count', stage='inference') > before['inference']
+    assert _scrape(client, 'pixclad_jobs_total', source='upload', outcome='success') == jobs + 1
+    assert body['timings']['tag']['count'] >= 1
+    assert body['timings']['write']['count'] == 3
+
+
+def test_job_timings_add_up_across_threads():
+    timings = JobTimings()
+
+    def work():
+        for _ in range(100):
+            timings.add('download', 0.01)
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with timed('upload', timings):
+        pass
+    timings.add('tag', 0.5, count=8)
+
+    result = timings.as_dict()
+    assert result['download'] == {'seconds': 4.0, 'count': 400}
+    assert result['upload']['count'] == 1
+    assert result['tag'] == {'seconds': 0.5, 'count': 8}
@@ -0,0 +1,114 @@
+import io
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+from pytest import approx
+
+from model_loader import DECODE_SIZE, _load_image, class_name_table, tags_from_detections, tags_from_results
+
+NAMES = class_name_table({0: 'person', 1: 'dog', 2: 'cat'})
+
+
+class FakeTensor:
+    """Just enough of a torch tensor: .cpu().numpy()."""
+
+    def __init__(self, values):
+        self.values = np.array(values, dtype=np.float32)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class FakeBoxes:
+    def __init__(self, *detections):
+        self.cls = FakeTensor([c for c, _ in detections])
+        self.conf = FakeTensor([p for _, p in detections])
+
+    def __len__(self):
+        return len(self.cls.values)
+
+
+def _result(*detections, obb=False):
+    boxes = FakeBoxes(*detections)
+    return SimpleNamespace(boxes=None, obb=boxes) if obb else SimpleNamespace(boxes=boxes, obb=None)
+
+
+def _brute_force(results):
+    """The per-result loop the vectorized code replaced."""
+    all_tags = []
+    for r in results:
+        boxes = r.obb if r.obb is not None else r.boxes
+        best = {}
+        for c, p in zip(boxes.cls.values.tolist(), boxes.conf.values.tolist()):
+            name = NAMES[int(c)] if int(c) < len(NAMES) else str(int(c))
+            best[name] = max(best.get(name, -1.0), p)
+        all_tags.append([{"name": n, "conf": approx(p)} for n, p in sorted(best.items(), key=lambda kv: -kv[1])])
+    return all_tags
+
+
+def test_highest_confidence_per_class_best_first():
+    results = [
+        _result((1, 0.4), (0, 0.7), (1, 0.9), (0, 0.3)),
+        _result(),
+        _result((2, 0.5)),
+    ]
+    assert tags_from_results(results, NAMES) == [
+        [{"name": "dog", "conf": approx(0.9)}, {"name": "person", "conf": approx(0.7)}],
+        [],
+        [{"name": "cat", "conf": approx(0.5)}],
+    ]
+
+
+def test_obb_results_are_read_from_obb():
+    assert tags_from_results([_result((2, 0.6), (2, 0.8), obb=True)], NAMES) == [[{"name": "cat", "conf": approx(0.8)}]]
+
+
+def test_class_ids_past_the_names_table_keep_their_number():
+    assert tags_from_results([_result((7, 0.6), (0, 0.5))], NAMES) == [
+        [{"name": "7", "conf": approx(0.6)}, {"name": "person", "conf": approx(0.5)}]]
+
+
+def test_matches_a_per_result_loop():
+    rng = np.random.default_rng(0)
+    results = []
+    for _ in range(20):
+        n = int(rng.integers(0, 12))
+        detections = list(zip(rng.integers(0, 5, n).tolist(), rng.random(n).tolist()))
+        results.append(_result(*detections, obb=bool(rng.integers(0, 2))))
+    assert tags_from_results(results, NAMES) == _brute_force(results)
+
+
+def test_no_detections_at_all():
+    assert tags_from_results([_result(), SimpleNamespace(boxes=None, obb=None)], NAMES) == [[], []]
+    empty = np.zeros(0, np.int64)
+    assert tags_from_detections(2, empty, empty, np.zeros(0), NAMES) == [[], []]
+
+
+def _encoded(size, fmt):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buf, fmt)
+    return buf.getvalue()
+
+
+def test_large_jpeg_decodes_to_the_model_size():
+    data = _encoded((4000, 3000), 'JPEG')
+    img = _load_image(data)
+    assert img.mode == 'RGB'
+    assert max(img.size) <= DECODE_SIZE
+    assert abs(img.size[0] / img.size[1] - 4 / 3) < 0.01
+    assert _load_image(data, max_size=0).size == (4000, 3000)
+
+
+def test_large_png_from_a_file_object_is_shrunk_and_rewound():
+    source = io.BytesIO(_encoded((1500, 1000), 'PNG'))
+    img = _load_image(source)
+    assert max(img.size) <= DECODE_SIZE
+    assert source.tell() == 0
+
+
+def test_small_images_are_not_enlarged():
+    assert _load_image(_encoded((320, 200), 'JPEG')).size == (320, 200)
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+from pytest import approx
+from PIL import Image
+
+import model_loader
+from onnx_backend import INPUT_SIZE, PAD_VALUE, letterbox, tags_from_output
+
+NAMES = np.array(['person', 'dog', 'cat'], dtype=object)
+
+
+def _output(*anchors):
+    """Raw detection output for one image: one (class scores) tuple per anchor."""
+    scores = np.array(anchors, dtype=np.float32).T  # classes x anchors
+    return np.concatenate([np.zeros((4, len(anchors)), np.float32), scores])[None]
+
+
+def test_each_anchor_counts_only_for_its_best_class():
+    # The dog score on anchor 0 is high, but the anchor is a person
+    output = _output((0.9, 0.8, 0.0), (0.3, 0.1, 0.0))
+    assert tags_from_output(output, 0.25, NAMES) == [[{"name": "person", "conf": approx(0.9)}]]
+
+
+def test_per_class_max_over_anchors_above_threshold():
+    output = np.concatenate([
+        _output((0.9, 0.0, 0.0), (0.0, 0.4, 0.0), (0.0, 0.7, 0.1)),
+        _output((0.2, 0.0, 0.0), (0.0, 0.0, 0.25), (0.0, 0.0, 0.0)),
+    ])
+    assert tags_from_output(output, 0.25, NAMES) == [
+        [{"name": "person", "conf": approx(0.9)}, {"name": "dog", "conf": approx(0.7)}],
+        [],  # nothing above the threshold (0.25 itself does not count)
+    ]
+
+
+def test_letterbox_takes_bgr_arrays():
+    bgr = np.zeros((100, 200, 3), np.uint8)
+    bgr[..., 2] = 255  # red
+    boxed = letterbox(bgr)
+    assert boxed.shape == (INPUT_SIZE, INPUT_SIZE, 3)
+    assert tuple(boxed[INPUT_SIZE // 2, INPUT_SIZE // 2]) == (255, 0, 0)
+    assert tuple(boxed[0, 0]) == (PAD_VALUE,) * 3
+    assert np.array_equal(boxed, letterbox(Image.new('RGB', (200, 100), (255, 0, 0))))
+
+
+def test_letterbox_takes_grey_and_bgra_arrays():
+    assert letterbox(np.full((50, 50), 128, np.uint8)).shape == (INPUT_SIZE, INPUT_SIZE, 3)
+    bgra = np.zeros((50, 50, 4), np.uint8)
+    bgra[..., 0] = 255  # blue
+    assert tuple(letterbox(bgra)[INPUT_SIZE // 2, INPUT_SIZE // 2]) == (0, 0, 255)
+
+
+def test_tags_match_ultralytics(tmp_path):
+    """The ONNX backend tags fixture images like the torch (ultralytics) one."""
+    pytest.importorskip('onnxruntime')
+    ultralytics = pytest.importorskip('ultralytics')
+    if not os.path.exists(model_loader.MODEL_PATH):
+        pytest.skip("model weights not available")
+    from onnx_backend import OnnxBackend
+    from ultralytics.utils import ASSETS
+
+    images = [Image.open(ASSETS / name).convert('RGB') for name in ('bus.jpg', 'zidane.jpg')]
+    torch_tags = model_loader.TorchBackend(model_loader.MODEL_PATH).predict_tags(images, 0.25)
+    onnx_tags = OnnxBackend(str(tmp_path / 'yolo11n.onnx'), model_loader.MODEL_PATH).predict_tags(images, 0.25)
+
+    for expected, got in zip(torch_tags, onnx_tags):
+        expected = {tag['name']: tag['conf'] for tag in expected if tag['conf'] >= 0.35}
+        got = {tag['name']: tag['conf'] for tag in got}
+        assert set(expected) <= set(got)
+        for name, conf in expected.items():
+            assert abs(got[name] - conf) <= 0.1, name
+
+
+def test_fingerprint_hashes_the_onnx_weights(monkeypatch, tmp_path):
+    monkeypatch.setattr(model_loader.Config, 'INFERENCE_BACKEND', 'onnx')
+    monkeypatch.setattr(model_loader, 'ONNX_MODEL_PATH', str(tmp_path / 'model.onnx'))
+
+    def fingerprint(weights):
+        (tmp_path / 'model.onnx').write_bytes(weights)
+        monkeypatch.setattr(model_loader, '_model_fingerprint', None)
+        return model_loader.model_fingerprint()
+
+    assert fingerprint(b'fp32 weights') != fingerprint(b're-exported weights')
+    assert fingerprint(b'fp32 weights').split(':')[1].startswith('onnx')
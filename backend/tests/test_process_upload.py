@@ -0,0 +1,41 @@
+import io
+import os
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client(monkeypatch):
+    jobs = []
+    monkeypatch.setattr(app_module, 'enqueue_job', lambda source, destination, job_id: jobs.append(source))
+    client = app_module.app.test_client()
+    client.jobs = jobs
+    return client
+
+
+def test_upload_of_several_megabytes(client):
+    """Regression: a cap on in-memory form data turned every file over 64 KB into a 413."""
+    big = os.urandom(6 * 1024 * 1024)
+    small = os.urandom(100 * 1024)
+    response = client.post('/process-upload', data={
+        'destination': 'local',
+        'files': [(io.BytesIO(big), 'big.jpg'), (io.BytesIO(small), 'small.jpg')],
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 202, response.get_data(as_text=True)
+    folder = client.jobs[0]['folder']
+    with open(os.path.join(folder, 'big.jpg'), 'rb') as f:
+        assert f.read() == big
+    with open(os.path.join(folder, 'small.jpg'), 'rb') as f:
+        assert f.read() == small
+
+
+def test_oversized_form_field_is_rejected(client):
+    response = client.post('/process-upload', data={
+        'destination': 'x' * (100 * 1024),
+        'files': [(io.BytesIO(b'data'), 'a.jpg')],
+    }, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert not client.jobs
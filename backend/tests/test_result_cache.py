@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import pipeline
+from pipeline import FULL, PREVIEW, THUMBNAIL, lookup_cached_tags, tag_images
+from result_cache import ResultCache
+
+TAGS = [{"name": "dog", "conf": 0.91}, {"name": "person", "conf": 0.7}]
+
+
+def _size(key, tags):
+    return len(key) + len(json.dumps(tags))
+
+
+def test_memory_tier_stays_within_its_byte_budget():
+    entry = _size("k000", TAGS)
+    cache = ResultCache(None, memory_bytes=entry * 10)
+    cache.put_many({f"k{i:03d}": TAGS for i in range(25)})
+    stats = cache.stats()
+    assert stats['memory_bytes'] <= entry * 10
+    assert stats['memory_entries'] == 10
+    # least recently used go first
+    assert cache.get_many(["k000", "k024"]) == {"k024": TAGS}
+
+
+def test_disk_tier_is_trimmed_to_its_byte_budget(tmp_path):
+    budget = 256 * 1024
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), memory_bytes=0, disk_bytes=budget)
+    cache.TRIM_EVERY = 100
+    tags = [{"name": f"class{i}", "conf": 0.5} for i in range(20)]
+    for start in range(0, 20000, 100):
+        cache.put_many({f"{i:032x}": tags for i in range(start, start + 100)})
+        assert cache.stats()['disk_bytes'] <= budget * 1.5  # trimmed every TRIM_EVERY puts
+    assert cache.stats()['disk_bytes'] <= budget
+    newest, oldest = f"{19999:032x}", f"{0:032x}"
+    assert cache.get_many([newest, oldest]) == {newest: tags}
+
+
+def test_stats_count_hits_and_misses(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), memory_bytes=1024 * 1024)
+    cache.put_many({"a": TAGS})
+    cache.get_many(["a", "b"])
+    disk_only = ResultCache(cache.path, memory_bytes=1024 * 1024)
+    disk_only.get_many(["a"])
+    assert cache.stats()['memory_hits'] == 1 and cache.stats()['misses'] == 1
+    assert disk_only.stats()['disk_hits'] == 1 and disk_only.stats()['hit_rate'] == 1.0
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    monkeypatch.setattr(pipeline, 'result_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def inferred(monkeypatch):
+    """Images that went through the (fake) model."""
+    seen = []
+
+    def get_image_tags_batch(images):
+        seen.extend(images)
+        return [TAGS for _ in images]
+    monkeypatch.setattr(pipeline, 'get_image_tags_batch', get_image_tags_batch)
+    return seen
+
+
+def test_thumbnail_tags_are_not_reused_for_the_original(cache, inferred):
+    tag_images(['thumbnail'], ['md5'], [THUMBNAIL])
+    assert lookup_cached_tags(['md5']) == [None]
+    tag_images(['original'], ['md5'])
+    assert inferred == ['thumbnail', 'original']
+
+
+def test_preview_tags_are_not_reused_for_the_original(cache, inferred):
+    tag_images(['preview'], ['md5'], [PREVIEW])
+    assert lookup_cached_tags(['md5'], [FULL]) == [None]
+    assert lookup_cached_tags(['md5'], [PREVIEW]) == [TAGS]
+
+
+def test_original_tags_serve_thumbnails(cache, inferred):
+    tag_images(['original'], ['md5'])
+    assert tag_images(['thumbnail'], ['md5'], [THUMBNAIL]) == [TAGS]
+    assert lookup_cached_tags(['md5', 'md5'], [THUMBNAIL, PREVIEW]) == [TAGS, TAGS]
+    assert inferred == ['original']
+
+
+def test_thumbnail_tags_serve_thumbnails(cache, inferred):
+    tag_images(['thumbnail'], ['md5'], [THUMBNAIL])
+    assert tag_images(['thumbnail again'], ['md5'], [THUMBNAIL]) == [TAGS]
+    assert inferred == ['thumbnail']
@@ -0,0 +1,101 @@
+import time
+from datetime import timedelta
+
+import pytest
+from flask import Flask
+
+import app as app_module
+import session_store
+from session_store import MemorySessionStore, SQLiteSessionStore, StoreSessionInterface, session_data
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """session_store's time.time, moved on by hand."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(session_store.time, 'time', lambda: now[0])
+    return now
+
+
+def test_memory_store_expires_and_evicts(clock):
+    store = MemorySessionStore(max_entries=2)
+    store.set('a', b'A', clock[0] + 10)
+    store.set('b', b'B', clock[0] + 100)
+    assert store.get('a') == (b'A', clock[0] + 10)  # now the most recently used
+    store.set('c', b'C', clock[0] + 100)
+    assert store.get('b') is None  # least recently used, evicted
+    assert store.get('a') and store.get('c')
+
+    clock[0] += 50
+    assert store.get('a') is None
+    store.sweep()
+    assert list(store._entries) == ['c']
+
+
+def test_sqlite_cache_sees_writes_from_other_connections(tmp_path):
+    # Two stores on one file stand for two workers on the host
+    path = str(tmp_path / 'sessions.sqlite3')
+    first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    expires = time.time() + 100
+
+    first.set('sid', b'v1', expires)
+    assert second.get('sid') == (b'v1', expires)
+    assert first.get('sid') == (b'v1', expires)  # served from first's cache
+
+    second.set('sid', b'v2', expires)
+    assert first.get('sid') == (b'v2', expires)
+    second.delete('sid')
+    assert first.get('sid') is None
+
+
+def test_sqlite_sweep_deletes_only_expired(tmp_path, monkeypatch):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.sqlite3'))
+    monkeypatch.setattr(store, 'SWEEP_BATCH', 7)  # several batches
+    now = time.time()
+    for i in range(30):
+        store.set(f"old{i}", b'x', now - 1)
+    for i in range(5):
+        store.set(f"live{i}", b'x', now + 100)
+
+    store.sweep()
+    left = sorted(row[0] for row in store._db.execute("SELECT id FROM sessions"))
+    assert left == [f"live{i}" for i in range(5)]
+
+
+class CountingStore(MemorySessionStore):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def set(self, sid, data, expires):
+        self.writes += 1
+        super().set(sid, data, expires)
+
+
+def test_unchanged_session_is_only_touched_after_the_interval(clock):
+    store = CountingStore()
+    interface = StoreSessionInterface(Flask(__name__), store, touch_interval=60, sweep_interval=10 ** 9)
+    lifetime = timedelta(days=30)
+
+    interface._upsert_session(lifetime, {'user': 'a'}, 'sid')
+    clock[0] += 30
+    interface._upsert_session(lifetime, {'user': 'a'}, 'sid')
+    assert store.writes == 1  # same data, expiry moved less than touch_interval
+
+    interface._upsert_session(lifetime, {'user': 'b'}, 'sid')
+    assert store.writes == 2  # changed data is always written
+
+    clock[0] += 61
+    interface._upsert_session(lifetime, {'user': 'b'}, 'sid')
+    assert store.writes == 3
+    assert store.get('sid')[1] == clock[0] + lifetime.total_seconds()
+
+
+def test_session_data_outside_a_request():
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['credentials'] = {'token': 't'}
+    sid = client.get_cookie(app_module.app.config.get('SESSION_COOKIE_NAME', 'session')).value
+
+    assert session_data(sid)['credentials'] == {'token': 't'}
+    assert session_data('no-such-session') is None
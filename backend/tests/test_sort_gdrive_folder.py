@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import pipeline
+from benchmarks.corpus import encode, make_photo
+from drive_service import FOLDER_MIME_TYPE
+
+
+def _photo(seed):
+    return encode(make_photo((64, 48), seed))
+
+
+@pytest.fixture
+def tagger(monkeypatch):
+    """Every image gets the same tag; the model is not what these tests are about."""
+    monkeypatch.setattr(pipeline, 'get_image_tags_batch', lambda images: [[{"name": "cat", "conf": 0.9}] for _ in images])
+
+
+def _sort(drive, folder_id, destination, tmp_path, **kwargs):
+    return pipeline.sort_gdrive_folder(folder_id, destination, {'refresh_token': 'source'}, {'refresh_token': 'dest'},
+                                       make_service=lambda creds: drive.service(), make_http=lambda creds: drive.http(),
+                                       output_dir=str(tmp_path), incremental=False, **kwargs)
+
+
+def test_same_names_in_subfolders_stay_apart_locally(drive, tagger, tmp_path):
+    root = drive.add_folder('Photos')
+    data = {}
+    for seed, parent in enumerate((root, drive.add_folder('2023', root), drive.add_folder('2024', root))):
+        data[seed] = _photo(seed)
+        drive.add_file('IMG_0001.jpg', data[seed], parent)
+
+    result = _sort(drive, root, 'local', tmp_path, recursive=True)
+
+    assert sorted(result['results']) == ['IMG_0001.jpg', 'IMG_0001_1.jpg', 'IMG_0001_2.jpg']
+    assert set(result['categories'].values()) == {'cat'}
+    written = sorted(os.listdir(tmp_path / 'cat'))
+    assert written == ['IMG_0001.jpg', 'IMG_0001_1.jpg', 'IMG_0001_2.jpg']
+    contents = {open(tmp_path / 'cat' / name, 'rb').read() for name in written}
+    assert contents == set(data.values())
+
+
+def test_same_names_in_subfolders_stay_apart_on_drive(drive, tagger, tmp_path):
+    root = drive.add_folder('Photos')
+    for seed, parent in enumerate((root, drive.add_folder('Sub', root))):
+        drive.add_file('a.jpg', _photo(seed), parent)
+
+    result = _sort(drive, root, 'gdrive-source', tmp_path, recursive=True, placement='copy')
+
+    assert sorted(result['results']) == ['a.jpg', 'a_1.jpg']
+    output = next(f['id'] for f in drive.children('root') if f['name'] == 'Output')
+    cat = next(f['id'] for f in drive.children(output) if f['mimeType'] == FOLDER_MIME_TYPE)
+    assert sorted(f['name'] for f in drive.children(cat)) == ['a.jpg', 'a_1.jpg']
@@ -0,0 +1,74 @@
+import pytest
+
+import pipeline
+import sorting_rules
+from config import Config
+from sorting_rules import UNCATEGORIZED, SortingRules
+
+RULES = [
+    {"category": "Vehicles", "classes": ["car", "truck"], "min_conf": 0.5},
+    {"category": "People", "classes": {"person": 0.8}},
+]
+
+
+def _tags(**confs):
+    return [{"name": name, "conf": conf} for name, conf in sorted(confs.items(), key=lambda kv: -kv[1])]
+
+
+def test_first_matching_rule_wins():
+    rules = SortingRules(RULES, default_conf=0.65)
+    assert rules.categories_for([
+        _tags(person=0.9, car=0.6),
+        _tags(person=0.9),
+        _tags(person=0.7, dog=0.95),
+        _tags(cat=0.3),
+        [],
+        ["Error: could not read image"],
+    ]) == ["Vehicles", "People", "dog", UNCATEGORIZED, UNCATEGORIZED, UNCATEGORIZED]
+
+
+def test_scores_are_compared_unrounded():
+    rules = SortingRules(RULES, default_conf=0.95)
+    # 0.799 would show as 0.80, but is below the People rule's 0.8
+    assert rules.categories_for([_tags(person=0.799), _tags(person=0.8)]) == [UNCATEGORIZED, "People"]
+
+
+def test_best_score_of_a_class_counts():
+    rules = SortingRules(RULES, default_conf=0.65)
+    tags = [{"name": "truck", "conf": 0.2}, {"name": "truck", "conf": 0.55}]
+    assert rules.categories_for([tags]) == ["Vehicles"]
+
+
+def test_min_confidence_is_the_lowest_threshold():
+    assert SortingRules(RULES, default_conf=0.65).min_confidence == 0.5
+    assert SortingRules([], default_conf=0.65).min_confidence == 0.65
+
+
+@pytest.mark.parametrize('rule', [
+    {"classes": ["car"]},
+    {"category": "Vehicles", "classes": "car"},
+    {"category": "Vehicles", "classes": {"car": 1.5}},
+    "Vehicles",
+])
+def test_malformed_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        SortingRules([rule])
+
+
+@pytest.mark.parametrize('text', ['[{"category": "Vehicles"', '{"category": "Vehicles"}', '[{"category": "V"}]'])
+def test_malformed_setting_falls_back_to_best_tag(monkeypatch, capsys, text):
+    monkeypatch.setattr(Config, 'SORT_RULES', text)
+    rules = sorting_rules.load_sorting_rules()
+    assert rules.categories == []
+    assert rules.categories_for([_tags(dog=0.9)]) == ["dog"]
+    assert "Ignoring SORT_RULES" in capsys.readouterr().out
+
+
+def test_missing_rules_file_falls_back(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'SORT_RULES', "")
+    monkeypatch.setattr(Config, 'SORT_RULES_PATH', str(tmp_path / "missing.json"))
+    assert sorting_rules.load_sorting_rules().categories == []
+
+
+def test_job_results_show_rounded_confidences():
+    assert pipeline.rounded_tags([{"name": "dog", "conf": 0.87654}, "Error"]) == [{"name": "dog", "conf": 0.88}, "Error"]
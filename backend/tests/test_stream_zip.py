@@ -0,0 +1,35 @@
+import io
+import os
+import zipfile
+import zlib
+
+from pipeline import ZIP_CHUNK_SIZE, stream_zip
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_zip_streams_from_an_unseekable_sink(tmp_path):
+    files = {
+        'cat/a.jpg': os.urandom(3 * ZIP_CHUNK_SIZE + 17),  # several chunks, STORED
+        'cat/b.png': os.urandom(100),
+        'dog/notes.txt': b'deflated ' * 1000,
+        'dog/sub/c.jpeg': b'',
+    }
+    for name, data in files.items():
+        _write(str(tmp_path / name), data)
+
+    chunks = [chunk for chunk in stream_zip(str(tmp_path)) if chunk]
+    assert len(chunks) > len(files)  # bytes go out while entries are written
+
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted(files)
+        for name, data in files.items():
+            info = zf.getinfo(name)
+            assert info.CRC == zlib.crc32(data)
+            assert info.compress_type == (zipfile.ZIP_DEFLATED if name.endswith('.txt') else zipfile.ZIP_STORED)
+            assert zf.read(name) == data
@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import time
+
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+from config import Config
+
+STREAM_CHUNK = 64 * 1024
+MAX_FIELD_BYTES = 64 * 1024  # Non-file form fields (e.g. destination)
+
+# Files in a spool folder besides the uploads themselves
+MANIFEST = '.manifest'   # One JSON [filename, path] line per finished file
+COMPLETE = '.complete'   # The whole request body arrived
+ABORTED = '.aborted'     # The upload failed; holds the reason
+
+
+class UploadAborted(RuntimeError):
+    pass
+
+
+# ----------------------------------------------------------
+# Request side: parse the multipart body as it arrives
+# ----------------------------------------------------------
+class UploadSpool:
+    """
+    One upload request's folder under temp_uploads. Each file is written
+    as soon as its part of the body arrives and listed in the manifest once
+    finished, so the job can start tagging before the request is over.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.count = 0
+        self._names = set()
+        os.makedirs(folder, exist_ok=True)
+
+    def path_for(self, filename):
+        """A path in the spool for filename; repeated names get a _1, _2, ... suffix."""
+        name = secure_filename(os.path.basename(filename)) or 'upload'
+        stem, ext = os.path.splitext(name)
+        n = 0
+        while name in self._names:
+            n += 1
+            name = f"{stem}_{n}{ext}"
+        self._names.add(name)
+        return name, os.path.join(self.folder, name)
+
+    def add(self, filename, path):
+        with open(os.path.join(self.folder, MANIFEST), 'a') as f:
+            f.write(json.dumps([filename, path]) + '\n')
+        self.count += 1
+
+    def complete(self):
+        open(os.path.join(self.folder, COMPLETE), 'w').close()
+
+    def abort(self, reason):
+        with open(os.path.join(self.folder, ABORTED), 'w') as f:
+            f.write(reason)
+
+    def discard(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def receive_multipart(request, spool, on_field=None, on_file=None,
+                      max_file_bytes=None, max_request_bytes=None):
+    """
+    Streams a multipart/form-data request body into `spool` without letting
+    Werkzeug buffer the whole form first. on_field(name, value) is called
+    for each form field and on_file(filename, path) as soon as each file
+    part is complete. Raises RequestEntityTooLarge as soon as a file or the
+    body goes over its limit, and BadRequest for a malformed body.
+    """
+    max_file_bytes = max_file_bytes or Config.MAX_UPLOAD_FILE_BYTES
+    max_request_bytes = max_request_bytes or Config.MAX_UPLOAD_REQUEST_BYTES
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        raise BadRequest("Expected a multipart/form-data upload")
+    if request.content_length and request.content_length > max_request_bytes:
+        raise RequestEntityTooLarge(f"The upload is larger than {max_request_bytes} bytes")
+
+    # No limit in the decoder itself: it checks its whole buffer, which holds
+    # back the tail of the previous chunk (a possible boundary), so any chunk
+    # of STREAM_CHUNK would trip it. Reading one chunk at a time already
+    # bounds the buffer; fields are limited below.
+    decoder = MultipartDecoder(boundary.encode())
+    received = 0
+    part, out, size, field_data = None, None, 0, []
+    try:
+        while True:
+            chunk = request.stream.read(STREAM_CHUNK)
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise RequestEntityTooLarge(f"The upload is larger than {max_request_bytes} bytes")
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    part, field_data = event, []
+                elif isinstance(event, File):
+                    part, size = event, 0
+                    if event.filename:
+                        name, path = spool.path_for(event.filename)
+                        out = open(path, 'wb')
+                elif isinstance(event, Data):
+                    if isinstance(part, Field):
+                        field_data.append(event.data)
+                        if sum(len(data) for data in field_data) > MAX_FIELD_BYTES:
+                            raise RequestEntityTooLarge(f"Form field {part.name} is larger than {MAX_FIELD_BYTES} bytes")
+                        if not event.more_data and on_field:
+                            on_field(part.name, b''.join(field_data).decode('utf-8', 'replace'))
+                    elif out is not None:
+                        size += len(event.data)
+                        if size > max_file_bytes:
+                            raise RequestEntityTooLarge(f"{part.filename} is larger than {max_file_bytes} bytes")
+                        out.write(event.data)
+                        if not event.more_data:
+                            out.close()
+                            out = None
+                            spool.add(name, path)
+                            if on_file:
+                                on_file(name, path)
+                event = decoder.next_event()
+            if isinstance(event, Epilogue):
+                return
+            if not chunk:
+                raise BadRequest("The upload ended before the form was complete")
+    except ValueError as e:
+        raise BadRequest(str(e))
+    finally:
+        if out is not None:
+            out.close()
+
+
+# ----------------------------------------------------------
+# Job side: tag files as their parts finish
+# ----------------------------------------------------------
+def iter_spooled_batches(folder, batch_size, poll_interval=0.1, idle_timeout=None):
+    """
+    Yields lists of at most batch_size (filename, path) from a spool folder,
+    each as soon as files are available, until the upload is complete.
+    Raises UploadAborted if the request failed or went quiet for
+    idle_timeout seconds (default UPLOAD_IDLE_TIMEOUT).
+    """
+    idle_timeout = idle_timeout or Config.UPLOAD_IDLE_TIMEOUT
+    manifest = os.path.join(folder, MANIFEST)
+    offset, last_seen = 0, time.monotonic()
+    while True:
+        # Checked before reading so nothing listed before the marker is missed
+        complete = os.path.exists(os.path.join(folder, COMPLETE))
+        if os.path.exists(os.path.join(folder, ABORTED)):
+            with open(os.path.join(folder, ABORTED)) as f:
+                raise UploadAborted(f"Upload failed: {f.read()}")
+
+        files = []
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                f.seek(offset)
+                for line in iter(f.readline, ''):
+                    if not line.endswith('\n'):
+                        break  # still being written
+                    offset = f.tell()
+                    files.append(tuple(json.loads(line)))
+
+        if files:
+            last_seen = time.monotonic()
+            for start in range(0, len(files), batch_size):
+                yield files[start:start + batch_size]
+        elif complete:
+            return
+        elif time.monotonic() - last_seen > idle_timeout:
+            raise UploadAborted("Upload timed out")
+        else:
+            time.sleep(poll_interval)
@@ -44,6 +44,20 @@ const OutlineButton = ({ children, onClick, disabled, style = {} }) => (
   </button>
 );
 
+/* Background jobs: poll /jobs/<id> until the job finishes */
+const JOB_POLL_MS = 1500;
+
+async function waitForJob(statusUrl, onProgress) {
+  for (;;) {
+    const res = await axios.get(`${API_BASE_URL}${statusUrl}`, { withCredentials: true });
+    const job = res.data || {};
+    if (job.state === "SUCCESS") return job;
+    if (job.state === "FAILURE") throw new Error(job.error || "Job failed");
+    if (onProgress && job.total) onProgress(job.current || 0, job.total);
+    await new Promise(r => setTimeout(r, JOB_POLL_MS));
+  }
+}
+
 export default function Uploader() {
 
   /* Drive states */
@@ -55,6 +69,7 @@ export default function Uploader() {
   const [isProcessingFolder, setIsProcessingFolder] = useState(false);
   const [gdriveMessage, setGdriveMessage] = useState("");
   const [gdriveResults, setGdriveResults] = useState({});
+  const [gdriveCategories, setGdriveCategories] = useState({});
 
   /* Local states */
   const fileInputRef = useRef(null);
@@ -64,6 +79,7 @@ export default function Uploader() {
   const [isLocalLoading, setIsLocalLoading] = useState(false);
   const [localMessage, setLocalMessage] = useState("");
   const [localResults, setLocalResults] = useState({});
+  const [localCategories, setLocalCategories] = useState({});
 
   useEffect(() => {
     checkConnectionStatus();
@@ -104,10 +120,12 @@ export default function Uploader() {
   async function handleProcessFolder(folderId, folderName) {
     setIsProcessingFolder(true); setGdriveMessage(`Processing folder: "${folderName}"...`); setGdriveResults({});
     try {
-      const res = await axios.post(`${API_BASE_URL}/auth/gdrive/process-folder/${folderId}`, { destination: gdriveDestination }, { withCredentials: true });
-      let successMessage = res.data?.message || "Processing complete.";
+      const queued = await axios.post(`${API_BASE_URL}/auth/gdrive/process-folder/${folderId}`, { destination: gdriveDestination }, { withCredentials: true });
+      const job = await waitForJob(queued.data.status_url, (current, total) =>
+        setGdriveMessage(`Processing folder: "${folderName}" (${current}/${total})...`));
+      let successMessage = job.message || "Processing complete.";
       if (gdriveDestination !== "local" && !successMessage.includes("Output")) successMessage += " Results saved at the selected location's 'Output' folder.";
-      setGdriveMessage(successMessage); setGdriveResults(res.data?.results || {});
+      setGdriveMessage(successMessage); setGdriveResults(job.results || {}); setGdriveCategories(job.categories || {});
     } catch (err) {
       setGdriveMessage(err?.response?.status === 401 && gdriveDestination === "gdrive-destination" ? "Error: Destination not connected." : "Error processing folder.");
     } finally {
@@ -126,13 +144,18 @@ export default function Uploader() {
     setIsLocalLoading(true);
     setLocalMessage(`Processing ${files.length} item(s)...`);
 
+    // destination goes first so the server can start sorting while files upload
     const formData = new FormData();
-    files.forEach(f => formData.append('files', f));
     formData.append('destination', localDestination);
+    files.forEach(f => formData.append('files', f));
 
     try {
+      const queued = await axios.post(`${API_BASE_URL}/process-upload`, formData, { withCredentials: true });
+      const job = await waitForJob(queued.data.status_url, (current, total) =>
+        setLocalMessage(`Processing ${current}/${total} item(s)...`));
+
       if (localDestination === 'local') {
-        const response = await axios.post(`${API_BASE_URL}/process-upload`, formData, {
+        const response = await axios.get(`${API_BASE_URL}${job.download_url}`, {
           withCredentials: true,
           responseType: 'blob',
         });
@@ -162,12 +185,11 @@ export default function Uploader() {
 
       } else {
         // Save to Drive (existing flow)
-        const res = await axios.post(`${API_BASE_URL}/process-upload`, formData, { withCredentials: true });
-        setLocalResults(res.data.results || {}); setLocalMessage('Processing complete! Files saved to Google Drive.');
+        setLocalResults(job.results || {}); setLocalCategories(job.categories || {}); setLocalMessage('Processing complete! Files saved to Google Drive.');
       }
     } catch (error) {
       // Try to parse JSON error blob if available
-      if (error.response && error.response.data) {
+      if (error.response && error.response.data instanceof Blob) {
         try {
           const reader = new FileReader();
           reader.onload = () => {
@@ -183,7 +205,7 @@ export default function Uploader() {
           setLocalMessage('Error: Could not process the upload.');
         }
       } else {
-        setLocalMessage('Error: Could not process the upload.');
+        setLocalMessage(error?.response?.data?.error || 'Error: Could not process the upload.');
       }
     } finally {
       setIsLocalLoading(false);
@@ -319,7 +341,7 @@ export default function Uploader() {
                   {Object.keys(gdriveResults).length > 0 && (
                     <div style={styles.resultBox}><div style={{ fontWeight: 700, marginBottom: 8, color: LIGHT_BG }}>Processing Summary</div>
                       <div style={{ display: "grid", gap: 8 }}>
-                        {Object.entries(gdriveResults).map(([name, tags]) => (<div key={name} style={{ display: "flex", justifyContent: "space-between" }}><div>{name}</div><div style={{ color: CORAL_RED }}>{tags[0]?.name || "Uncategorized"}</div><div style={{ color: LIGHT_BG }}>{tags[0]?.conf || "0.00"}</div></div>))}
+                        {Object.entries(gdriveResults).map(([name, tags]) => (<div key={name} style={{ display: "flex", justifyContent: "space-between" }}><div>{name}</div><div style={{ color: CORAL_RED }}>{gdriveCategories[name] || tags[0]?.name || "Uncategorized"}</div><div style={{ color: LIGHT_BG }}>{tags[0]?.conf || "0.00"}</div></div>))}
                       </div>
                     </div>
                   )}
@@ -369,7 +391,7 @@ export default function Uploader() {
                   {Object.keys(localResults).length > 0 && (
                     <div style={styles.resultBox}><div style={{ fontWeight: 700, marginBottom: 8, color: LIGHT_BG }}>Local Upload Summary</div>
                       <div style={{ display: "grid", gap: 8 }}>
-                        {Object.entries(localResults).map(([name, tags]) => (<div key={name} style={{ display: "flex", justifyContent: "space-between" }}><div>{name}</div><div style={{ color: CORAL_RED }}>{tags[0]?.name || "Uncategorized"}</div><div style={{ color: LIGHT_BG }}>{tags[0]?.conf || "0.00"}</div></div>))}
+                        {Object.entries(localResults).map(([name, tags]) => (<div key={name} style={{ display: "flex", justifyContent: "space-between" }}><div>{name}</div><div style={{ color: CORAL_RED }}>{localCategories[name] || tags[0]?.name || "Uncategorized"}</div><div style={{ color: LIGHT_BG }}>{tags[0]?.conf || "0.00"}</div></div>))}
                       </div>
                     </div>
                   )}